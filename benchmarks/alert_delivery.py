@@ -0,0 +1,134 @@
+"""Low-stock alert delivery against a local SMTP server.
+
+Runs the alert dispatcher with its real e-mail path against an in-process
+aiosmtpd server (pip install aiosmtpd) and checks that:
+
+    a burst of crossings from many writes is coalesced into one message
+    writes that find an item already low send nothing
+    an item restocked and drained again alerts again
+    all messages go over one SMTP session, and a session dropped by the
+    server is replaced transparently
+
+    python -m benchmarks.alert_delivery
+    python -m benchmarks.alert_delivery --writes 500 --debounce 0.2
+"""
+import argparse
+import email
+import os
+import socket
+import sys
+import threading
+import time
+
+# Run from the repository root: python -m benchmarks.<name>
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+from src.alert_dispatcher import LowStockAlertDispatcher
+from src.email_service import SMTPConnectionPool, create_email_content, send_actual_email
+
+class RecordingHandler:
+    """Keeps every message received and counts SMTP sessions (one per connection)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            message = email.message_from_bytes(envelope.content)
+            # The HTML part is base64-encoded; keep its text
+            self.messages.append("".join(
+                part.get_payload(decode=True).decode("utf-8", "replace")
+                for part in message.walk() if part.get_content_type() == "text/html"
+            ))
+            self.sessions.add(id(session))
+        return "250 OK"
+
+def level(name, quantity):
+    return {"type": "item", "name": name, "quantity": quantity, "danger_level": 30}
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def run(writes, debounce, port):
+    if Controller is None:
+        print("aiosmtpd is not installed: pip install aiosmtpd")
+        return 2
+    # The controller can't be started on port 0
+    port = port or free_port()
+
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    pool = SMTPConnectionPool("127.0.0.1", port, starttls=False, timeout=5)
+    dispatcher = LowStockAlertDispatcher(
+        send=lambda items: send_actual_email(create_email_content(items), pool=pool),
+        debounce=debounce
+    )
+    failures = []
+
+    def check(label, condition):
+        print(f"{'ok  ' if condition else 'FAIL'} {label}")
+        if not condition:
+            failures.append(label)
+
+    try:
+        # Onboarding burst: many writes from several threads drain three items
+        started = time.perf_counter()
+        def drain(offset):
+            for n in range(offset, writes, 4):
+                dispatcher.submit([level("bag", 29 - n % 5), level("pen", 35 - n % 10), level("diary", 20)])
+        threads = [threading.Thread(target=drain, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        time.sleep(debounce * 3)
+        check(f"{writes} writes in {time.perf_counter() - started:.2f}s sent one message", len(handler.messages) == 1)
+        check("the message lists every item that crossed",
+              all(name in handler.messages[0] for name in ("bag", "pen", "diary")) if handler.messages else False)
+
+        # Still low: nothing new to report
+        for _ in range(50):
+            dispatcher.submit([level("bag", 10), level("diary", 5)])
+        time.sleep(debounce * 3)
+        check("writes while already low sent nothing", len(handler.messages) == 1)
+
+        # Restocked and drained again
+        dispatcher.submit([level("bag", 100)])
+        dispatcher.submit([level("bag", 12)])
+        dispatcher.flush(10)
+        check("a new crossing after a restock sent a second message", len(handler.messages) == 2)
+        check("both messages used one SMTP session", len(handler.sessions) == 1)
+
+        # The server goes away and comes back: the stale session is replaced on the next send
+        controller.stop()
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        dispatcher.submit([level("bottle", 3)])
+        dispatcher.flush(10)
+        check("a dropped session was replaced and the alert delivered",
+              len(handler.messages) == 3 and len(handler.sessions) == 2)
+    finally:
+        dispatcher.stop()
+        pool.close()
+        controller.stop()
+
+    print(f"{len(handler.messages)} messages over {len(handler.sessions)} SMTP sessions")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=200, help="stock writes in the burst")
+    parser.add_argument("--debounce", type=float, default=0.3, help="dispatcher quiet period in seconds")
+    parser.add_argument("--port", type=int, default=0, help="SMTP port (0 picks a free one)")
+    args = parser.parse_args()
+    sys.exit(run(args.writes, args.debounce, args.port))
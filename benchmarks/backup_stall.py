@@ -0,0 +1,123 @@
+"""How long a backup stalls concurrent employee writes.
+
+Writer threads keep POSTing /api/employees against a seeded database while a
+backup runs in the middle of the measurement. Request latencies are reported
+separately for requests that overlapped the backup and for the rest, and the
+snapshot is integrity-checked afterwards. --method copy2 runs the old
+shutil.copy2 backup for comparison (it does not lock, but can capture a torn
+file under write load).
+
+    python -m benchmarks.backup_stall --employees 200000 --threads 4
+    python -m benchmarks.backup_stall --journal-mode wal
+    python -m benchmarks.backup_stall --method copy2
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import create_benchmark_app, temp_db_path, seed_employees, percentile
+from src import db_backup
+from src.models.inventory import db
+
+def describe(label, latencies):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    print(
+        f"{label:<16} n={len(latencies_ms):<6} p50={percentile(latencies_ms, 0.5):7.1f}ms "
+        f"p99={percentile(latencies_ms, 0.99):7.1f}ms max={max(latencies_ms, default=0):7.1f}ms"
+    )
+
+def run(employees, threads, journal_mode, method, warmup):
+    db_path = temp_db_path()
+    backup_dir = tempfile.mkdtemp(prefix="inventory_backups_")
+    # The tuning layer would switch every new connection to WAL
+    app = create_benchmark_app(db_path, tuned=journal_mode == "wal")
+    with app.app_context():
+        db.session.execute(db.text(f"PRAGMA journal_mode={journal_mode}"))
+        db.session.commit()
+    seed_employees(app, employees)
+    print(f"Database: {os.path.getsize(db_path) / 1e6:.1f} MB, journal_mode={journal_mode}, method={method}")
+
+    samples = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def writer(worker_id):
+        client = app.test_client()
+        n = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.post("/api/employees", json={
+                "employee_id": f"W{worker_id:02d}-{n:06d}",
+                "first_name": "Bench",
+                "last_name": "Writer",
+                "emergency_no": "0000000000",
+                "blood_group": "O+",
+                "department_name": "Onboarding"
+            })
+            finished = time.perf_counter()
+            with lock:
+                samples.append((started, finished, response.status_code))
+            n += 1
+
+    pool = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    time.sleep(warmup)
+
+    backup_started = time.perf_counter()
+    manifest = None
+    if method == "copy2":
+        snapshot_path = os.path.join(backup_dir, "copy2.db")
+        shutil.copy2(db_path, snapshot_path)
+    else:
+        manifest = db_backup.backup_sqlite_db(db_path, backup_dir, full=True, verify=False)
+        snapshot_path = os.path.join(backup_dir, "restored.db")
+        db_backup.restore_backup(backup_dir, manifest["name"], snapshot_path)
+    backup_finished = time.perf_counter()
+
+    time.sleep(warmup)
+    stop.set()
+    for thread in pool:
+        thread.join()
+
+    during = [end - start for start, end, _ in samples if start < backup_finished and end > backup_started]
+    outside = [end - start for start, end, _ in samples if end <= backup_started or start >= backup_finished]
+    errors = sum(1 for _, _, status in samples if status != 201)
+
+    connection = sqlite3.connect(snapshot_path)
+    try:
+        integrity = connection.execute("PRAGMA integrity_check").fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        integrity = str(e)
+    finally:
+        connection.close()
+
+    print(f"Backup took {backup_finished - backup_started:.3f}s")
+    if manifest is not None:
+        # The rest of the run is hashing and compressing the private copy
+        print(f"Online copy (the only part touching the live database) took {manifest['copy_seconds']:.3f}s")
+    describe("outside backup", outside)
+    describe("during backup", during)
+    print(f"Failed writes: {errors}")
+    print(f"Snapshot integrity_check: {integrity}")
+
+    shutil.rmtree(backup_dir, ignore_errors=True)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    return 0 if integrity == "ok" and errors == 0 else 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=200000, help="rows seeded before measuring")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--journal-mode", choices=["delete", "wal"], default="delete")
+    parser.add_argument("--method", choices=["online", "copy2"], default="online")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of traffic before and after the backup")
+    args = parser.parse_args()
+    sys.exit(run(args.employees, args.threads, args.journal_mode, args.method, args.warmup))
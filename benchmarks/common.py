@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+
+# Run from the repository root: python -m benchmarks.<name>
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models.inventory import db, Employee
+from src.database_init import init_database
+from src.metrics import init_metrics
+from src.routes.stock import stock_bp
+from src.routes.employee import employee_bp
+from src.routes.events import events_bp
+from src.main import create_app
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+def temp_db_path():
+    handle, path = tempfile.mkstemp(prefix="inventory_bench_", suffix=".db")
+    os.close(handle)
+    os.remove(path)
+    return path
+
+def create_benchmark_app(db_path, tuned=True):
+    """The application of src/main.py on a throwaway database.
+
+    tuned=False wires the blueprints without the SQLite tuning layer
+    (src/db_config.py) to measure the plain default configuration.
+    """
+    if tuned:
+        return create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}"}, initialize=True)
+    app = Flask(
+        __name__,
+        static_folder=os.path.join(SRC_DIR, "static"),
+        template_folder=os.path.join(SRC_DIR, "templates")
+    )
+    app.register_blueprint(stock_bp, url_prefix="/api")
+    app.register_blueprint(employee_bp, url_prefix="/api")
+    app.register_blueprint(events_bp, url_prefix="/api")
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    init_metrics(app)
+    with app.app_context():
+        init_database()
+    return app
+
+def seed_employees(app, count):
+    """Bulk-insert count placeholder employees (no kit, so stock is untouched)"""
+    with app.app_context():
+        employee = Employee.__table__
+        for start in range(0, count, 10000):
+            db.session.execute(employee.insert(), [
+                {
+                    "employee_id": f"SEED{n:07d}",
+                    "first_name": "Seed",
+                    "last_name": f"Employee{n}",
+                    "emergency_no": f"{9000000000 + n}",
+                    "blood_group": "O+",
+                    "department_name": f"Department {n % 40}"
+                }
+                for n in range(start, min(start + 10000, count))
+            ])
+        db.session.commit()
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
@@ -0,0 +1,68 @@
+"""Cost and size of the full employee list in each JSON encoding.
+
+Seeds --employees rows, then fetches GET /api/employees (every field, no
+paging) --repeats times each way: dicts encoded by Flask's standard-library
+provider (the path before src/json_response.py), dicts encoded by orjson,
+and the columnar format encoded by orjson. Prints the median time and the
+raw and gzip-compressed body size, and checks that every encoding carries
+the same data.
+
+    python -m benchmarks.json_responses --employees 100000
+    python -m benchmarks.json_responses --employees 20000 --repeats 20
+"""
+import argparse
+import gzip
+import json
+import sys
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+from benchmarks.common import create_benchmark_app, temp_db_path, seed_employees, percentile
+from src.json_response import OrjsonProvider, orjson
+
+def fetch(client, url, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} answered {response.status_code}")
+    return response.get_data(), timings
+
+def run(employees, repeats):
+    if orjson is None:
+        print("orjson is not installed: pip install orjson")
+        return 2
+    app = create_benchmark_app(temp_db_path())
+    seed_employees(app, employees)
+    client = app.test_client()
+
+    paths = [
+        ("stdlib, objects", DefaultJSONProvider(app), "/api/employees"),
+        ("orjson, objects", OrjsonProvider(app), "/api/employees"),
+        ("orjson, columns", OrjsonProvider(app), "/api/employees?format=columns")
+    ]
+    print(f"{'encoding':<18}{'p50':>10}{'bytes':>14}{'gzip bytes':>14}")
+    decoded = []
+    for label, provider, url in paths:
+        app.json = provider
+        body, timings = fetch(client, url, repeats)
+        print(f"{label:<18}{percentile(timings, 0.5):>8.1f}ms{len(body):>14,}{len(gzip.compress(body, 6)):>14,}")
+        data = json.loads(body)
+        if isinstance(data, dict):
+            data = [dict(zip(data["columns"], row)) for row in data["rows"]]
+        decoded.append(data)
+
+    if any(data != decoded[0] for data in decoded[1:]):
+        print("FAIL: the encodings carry different data")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=50000, help="rows seeded before measuring")
+    parser.add_argument("--repeats", type=int, default=10, help="requests per encoding")
+    args = parser.parse_args()
+    sys.exit(run(args.employees, args.repeats))
@@ -0,0 +1,117 @@
+"""Concurrent read-modify-write edits: If-Match against lock-based serialization.
+
+Every edit is what the stock modal does: GET /api/stock/<item>, an edit
+window of --think ms, then PUT the level read plus one. --threads workers
+make --edits edits each, all on one item (hot) or each on its own item
+(spread), under four schemes:
+
+  unguarded   plain PUTs, so edits made from the same read overwrite each other
+  row lock    a lock per item held from the GET to the PUT
+  db lock     one lock held from the GET to the PUT, which is what
+              BEGIN IMMEDIATE around the edit amounts to in SQLite
+  if-match    PUT with If-Match; a 412 re-reads and tries again
+
+Prints edits/s, edit latency (waits and retries included), retries and
+lost updates. Every scheme except unguarded must end with each level at
+its start plus the edits made to it.
+
+    python -m benchmarks.optimistic_updates
+    python -m benchmarks.optimistic_updates --threads 16 --edits 50 --think 5
+"""
+import argparse
+import sys
+import threading
+import time
+
+from benchmarks.common import create_benchmark_app, temp_db_path, percentile
+
+SCHEMES = ("unguarded", "row lock", "db lock", "if-match")
+START_QUANTITY = 1000
+
+def run_scheme(app, scheme, item_names, threads, edits, think):
+    """(seconds, latencies ms, retries, {item_name: edits made}) of one scheme"""
+    row_locks = {item_name: threading.Lock() for item_name in item_names}
+    db_lock = threading.Lock()
+    latencies = []
+    retries = []
+    made = {item_name: 0 for item_name in item_names}
+    tally = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def edit(client, item_name):
+        """One edit; returns how many times it had to retry"""
+        attempts = 0
+        while True:
+            response = client.get(f"/api/stock/{item_name}")
+            quantity = response.get_json()["quantity"]
+            time.sleep(think)
+            headers = {"If-Match": response.headers["ETag"]} if scheme == "if-match" else {}
+            response = client.put(f"/api/stock/{item_name}", json={"quantity": quantity + 1}, headers=headers)
+            if response.status_code == 200:
+                return attempts
+            if response.status_code != 412:
+                raise RuntimeError(f"PUT answered {response.status_code}: {response.get_json()}")
+            attempts += 1
+
+    def worker(worker_id):
+        client = app.test_client()
+        item_name = item_names[worker_id % len(item_names)]
+        lock = {"row lock": row_locks[item_name], "db lock": db_lock}.get(scheme)
+        start.wait()
+        for _ in range(edits):
+            started = time.perf_counter()
+            if lock is None:
+                attempts = edit(client, item_name)
+            else:
+                with lock:
+                    attempts = edit(client, item_name)
+            with tally:
+                latencies.append((time.perf_counter() - started) * 1000)
+                retries.append(attempts)
+                made[item_name] += 1
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started, latencies, sum(retries), made
+
+def run(threads, edits, think):
+    app = create_benchmark_app(temp_db_path())
+    client = app.test_client()
+    failures = []
+    print(f"{threads} threads x {edits} edits, {think:.0f}ms edit window")
+    print(f"{'items':<8}{'scheme':<12}{'edits/s':>9}{'p50':>10}{'p95':>10}{'retries':>9}{'lost':>7}")
+    for layout in ("hot", "spread"):
+        for scheme in SCHEMES:
+            count = 1 if layout == "hot" else threads
+            item_names = [f"bench_{layout}_{scheme.replace(' ', '_')}_{n}" for n in range(count)]
+            for item_name in item_names:
+                client.post("/api/stock", json={
+                    "item_name": item_name, "quantity": START_QUANTITY, "danger_level": 0
+                })
+            elapsed, latencies, retries, made = run_scheme(app, scheme, item_names, threads, edits, think / 1000)
+            lost = 0
+            for item_name in item_names:
+                quantity = client.get(f"/api/stock/{item_name}").get_json()["quantity"]
+                lost += START_QUANTITY + made[item_name] - quantity
+            print(
+                f"{layout:<8}{scheme:<12}{len(latencies) / elapsed:>9.0f}"
+                f"{percentile(latencies, 0.5):>8.1f}ms{percentile(latencies, 0.95):>8.1f}ms{retries:>9}{lost:>7}"
+            )
+            if lost and scheme != "unguarded":
+                failures.append(f"{layout} {scheme}: {lost} lost updates")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--edits", type=int, default=25, help="edits per thread")
+    parser.add_argument("--think", type=float, default=2.0, help="ms between reading a level and writing it")
+    args = parser.parse_args()
+    sys.exit(run(args.threads, args.edits, args.think))
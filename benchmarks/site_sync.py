@@ -0,0 +1,239 @@
+"""Two office instances kept in step by site-to-site sync.
+
+Builds site A's database with --employees employees, copies it to site B
+(how a new office joins) and starts both as separate local servers with
+their own SITE_ID. Both then change the same data concurrently: restocks
+and handouts of the same items, a new item, edits of one employee at both
+sites, a handout to an employee the other site deletes, a delete at both.
+After `flask sync` has pulled each way, the two sites must report the same
+stock, employees and stats, and at each site stock must add up: the start
+level plus restocks minus what employees newly hold, with the movement
+journal and the stats agreeing. Finally a
+few changes are synced on their own, to show a pull costs what changed
+rather than the table size.
+
+    python -m benchmarks.site_sync
+    python -m benchmarks.site_sync --employees 100000
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.common import create_benchmark_app, temp_db_path, seed_employees
+from src.stats_service import EMPLOYEE_COUNT_KEY
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYNC_TOKEN = "benchmark-sync-token"
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+class Site:
+    """One instance of the app: its own database, SITE_ID and local server"""
+
+    def __init__(self, name, db_path, scratch):
+        self.name = name
+        self.db_path = db_path
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(
+            os.environ, SITE_ID=name, SYNC_TOKEN=SYNC_TOKEN, INVENTORY_DATABASE=db_path,
+            STOCK_VERSION_FILE=os.path.join(scratch, f"{name}.stock.version"),
+            ALERT_STATE_FILE=os.path.join(scratch, f"{name}.low_stock.state"),
+            EVENT_RELAY_FILE=""
+        )
+        self.server = None
+
+    def flask(self, *args):
+        return [sys.executable, "-m", "flask", "--app", "src.main:create_app", *args]
+
+    def start(self):
+        self.server = subprocess.Popen(
+            self.flask("run", "--port", str(self.port)), cwd=PROJECT_DIR, env=self.env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for _ in range(100):
+            try:
+                self.get("/api/stock")
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError(f"site {self.name} did not start")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.terminate()
+            self.server.wait(10)
+
+    def request(self, method, path, data=None):
+        body = json.dumps(data).encode() if data is not None else None
+        request = urllib.request.Request(
+            self.url + path, data=body, method=method, headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def pull(self, peer):
+        """Run `flask sync <peer>` for this site; returns (seconds, summary line)"""
+        started = time.perf_counter()
+        result = subprocess.run(
+            self.flask("sync", peer.url), cwd=PROJECT_DIR, env=dict(self.env, INVENTORY_INIT_DB="0"),
+            capture_output=True, text=True
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            raise RuntimeError(f"sync {self.name} <- {peer.name} failed: {result.stdout}{result.stderr}")
+        return elapsed, " / ".join(result.stdout.strip().splitlines())
+
+    def state(self):
+        stock = {item["item_name"]: item["quantity"] for item in self.get("/api/stock")["stock_items"]}
+        employees = sorted(self.get("/api/employees"), key=lambda employee: employee["employee_id"])
+        return stock, employees, self.get("/api/employees/stats")
+
+    def journal_levels(self, item_names):
+        """Each item's level as the movement journal adds it up"""
+        return {item_name: self.get(f"/api/stock/{item_name}/level")["quantity"] for item_name in item_names}
+
+def held_totals(employees):
+    """{item_name: quantity held by all employees} from the employee list"""
+    totals = {}
+    for data in employees:
+        for field, value in data.items():
+            if field.endswith("_quantity"):
+                item_name = field[:-len("_quantity")]
+                totals[item_name] = totals.get(item_name, 0) + value
+    return totals
+
+def employee(employee_id, department, **items):
+    data = {
+        "employee_id": employee_id, "first_name": "Sync", "last_name": employee_id,
+        "emergency_no": "9000000000", "blood_group": "O+", "department_name": department
+    }
+    data.update({f"{item}_quantity": quantity for item, quantity in items.items()})
+    return data
+
+def sync_both(a, b):
+    for puller, peer in ((b, a), (a, b)):
+        elapsed, summary = puller.pull(peer)
+        print(f"  {puller.name} <- {summary} ({elapsed:.2f}s)")
+
+def run(employees):
+    scratch = tempfile.mkdtemp(prefix="inventory_sync_")
+    a_path = temp_db_path()
+    app = create_benchmark_app(a_path)
+    seed_employees(app, employees)
+    with app.app_context():
+        from src.models.inventory import db
+        from src.stats_service import scan_distribution_totals, get_distribution_totals
+        from src.database_init import get_stock_levels
+        start_stock = {item["name"]: item["quantity"] for item in get_stock_levels()}
+        # The rollup is what /api/employees/stats reports; seeding bypasses it
+        start_held = scan_distribution_totals()
+        start_counted = get_distribution_totals()
+        db.session.remove()
+        db.engine.dispose()
+    # A new office starts from a copy of an existing site's database
+    b_path = temp_db_path()
+    with sqlite3.connect(a_path) as source, sqlite3.connect(b_path) as target:
+        source.backup(target)
+
+    a = Site("site-a", a_path, scratch)
+    b = Site("site-b", b_path, scratch)
+    failures = []
+
+    def check(label, condition):
+        print(f"{'ok  ' if condition else 'FAIL'} {label}")
+        if not condition:
+            failures.append(label)
+
+    try:
+        a.start()
+        b.start()
+        print(f"Sites started with {employees:,} employees each")
+
+        # Restocks of the same item at both sites must both count
+        a.request("POST", "/api/stock/pen/add", {"quantity": 10})
+        b.request("POST", "/api/stock/pen/add", {"quantity": 5})
+        a.request("POST", "/api/employees", employee("SYNC-A1", "Sales", bag=2, pen=1))
+        b.request("POST", "/api/employees", employee("SYNC-B1", "Support", bag=3))
+        b.request("POST", "/api/employees", employee("SYNC-B2", "Support", diary=1))
+        a.request("POST", "/api/stock", {"item_name": "mug", "quantity": 40, "danger_level": 10})
+        print("Concurrent changes made; syncing")
+        sync_both(a, b)
+
+        # Both sites edit one employee: the later edit wins the fields, and
+        # the pen handed out in the earlier one is still held
+        a.request("PUT", "/api/employees/SYNC-B1", {"department_name": "Edited at A", "pen_quantity": 1})
+        time.sleep(0.05)
+        b.request("PUT", "/api/employees/SYNC-B1", {"department_name": "Edited at B"})
+        # B hands out a pen to an employee A then deletes; the pen comes back
+        b.request("PUT", "/api/employees/SYNC-B2", {"pen_quantity": 1})
+        time.sleep(0.05)
+        a.request("DELETE", "/api/employees/SYNC-B2")
+        # Both sites delete one employee; what they held comes back once
+        a.request("DELETE", "/api/employees/SYNC-A1")
+        b.request("DELETE", "/api/employees/SYNC-A1")
+        print("Conflicting edits made; syncing")
+        sync_both(a, b)
+        # B's last pull settled the delete at A; that travels back to A
+        print("Settlements made while syncing:")
+        sync_both(a, b)
+
+        restocked = {"pen": 15, "mug": 40}
+        stock_a, employees_a, stats_a = a.state()
+        stock_b, employees_b, stats_b = b.state()
+        check("stock levels match", stock_a == stock_b)
+        check("the item added at A exists at B", stock_b.get("mug") == 40)
+        check("employee lists match", employees_a == employees_b)
+        edited = {item["employee_id"]: item for item in employees_b}
+        check("the later edit won", edited.get("SYNC-B1", {}).get("department_name") == "Edited at B")
+        check("the pen handed out in the losing edit is still held", edited.get("SYNC-B1", {}).get("pen_quantity") == 1)
+        check("the deletes reached both sites", not {"SYNC-A1", "SYNC-B2"} & {item["employee_id"] for item in employees_a})
+        check("stats match", stats_a == stats_b)
+        for site, stock, employees, stats in ((a, stock_a, employees_a, stats_a), (b, stock_b, employees_b, stats_b)):
+            held = held_totals(employees)
+            expected = {
+                item_name: start_stock.get(item_name, 0) + restocked.get(item_name, 0)
+                - (held.get(item_name, 0) - start_held.get(item_name, 0))
+                for item_name in stock
+            }
+            check(f"{site.name}: stock = start + restocks - newly held", stock == expected)
+            check(f"{site.name}: the journal adds up to the stock levels", site.journal_levels(stock) == stock)
+            counted = dict(stats["items_distributed"], **{EMPLOYEE_COUNT_KEY: stats["total_employees"]})
+            held[EMPLOYEE_COUNT_KEY] = len(employees)
+            check(f"{site.name}: stats moved with what employees hold", all(
+                counted.get(key, 0) - start_counted.get(key, 0) == quantity - start_held.get(key, 0)
+                for key, quantity in held.items()
+            ))
+
+        # Nothing changed: a pull is one empty page
+        print("Pull with nothing new:")
+        sync_both(a, b)
+        a.request("POST", "/api/employees", employee("SYNC-A2", "Sales", bag=1))
+        print("Pull of one change:")
+        elapsed, summary = b.pull(a)
+        print(f"  {b.name} <- {summary} ({elapsed:.2f}s)")
+        check("one change moved one employee and one movement", "1 movements, 1 employees" in summary)
+    finally:
+        a.stop()
+        b.stop()
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=20000, help="employees on both sites before syncing")
+    args = parser.parse_args()
+    sys.exit(run(args.employees))
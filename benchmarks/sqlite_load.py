@@ -0,0 +1,120 @@
+"""Read/write throughput of the API under a mixed multi-threaded load.
+
+Reader threads alternate GET /api/stock and GET /api/employees?limit=50
+while writer threads create employees and restock items. The same workload
+runs against the default SQLite setup (rollback journal, no pragmas) and
+against the tuned one from src/db_config.py (WAL, pragmas, sized pool,
+retry on busy), and the two are printed side by side.
+
+    python -m benchmarks.sqlite_load --readers 8 --writers 4 --duration 10
+    python -m benchmarks.sqlite_load --config tuned
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import create_benchmark_app, temp_db_path, seed_employees, percentile
+from src.models.inventory import db, Stock
+
+def run_config(tuned, readers, writers, duration, employees):
+    db_path = temp_db_path()
+    app = create_benchmark_app(db_path, tuned=tuned)
+    seed_employees(app, employees)
+    with app.app_context():
+        db.session.execute(db.update(Stock).values(quantity=10 ** 9, danger_level=0))
+        db.session.commit()
+
+    latencies = {"read": [], "write": []}
+    statuses = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(readers + writers + 1)
+    stop = threading.Event()
+
+    def record(kind, started, response):
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies[kind].append(elapsed)
+            statuses[f"{kind} {response.status_code}"] += 1
+
+    def reader():
+        client = app.test_client()
+        start.wait()
+        n = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            url = "/api/stock" if n % 2 else "/api/employees?limit=50"
+            record("read", started, client.get(url))
+            n += 1
+
+    def writer(worker_id):
+        client = app.test_client()
+        start.wait()
+        n = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            if n % 4 == 3:
+                response = client.post("/api/stock/pen/add", json={"quantity": 1})
+            else:
+                response = client.post("/api/employees", json={
+                    "employee_id": f"L{worker_id:02d}-{n:07d}",
+                    "first_name": "Load",
+                    "last_name": "Test",
+                    "emergency_no": "0000000000",
+                    "blood_group": "O+",
+                    "department_name": "Onboarding",
+                    "pen_quantity": 1
+                })
+            record("write", started, response)
+            n += 1
+
+    pool = [threading.Thread(target=reader) for _ in range(readers)]
+    pool += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in pool:
+        thread.start()
+    start.wait()
+    time.sleep(duration)
+    stop.set()
+    for thread in pool:
+        thread.join()
+
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    return latencies, statuses
+
+def report(label, latencies, statuses, duration):
+    print(f"[{label}]")
+    for kind in ("read", "write"):
+        values = [latency * 1000 for latency in latencies[kind]]
+        print(
+            f"  {kind:<5} {len(values) / duration:8.1f}/s  p50={percentile(values, 0.5):7.1f}ms "
+            f"p99={percentile(values, 0.99):7.1f}ms"
+        )
+    print("  responses: " + ", ".join(f"{key}={count}" for key, count in sorted(statuses.items())))
+    return sum(count for key, count in statuses.items() if key.endswith(" 500"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per configuration")
+    parser.add_argument("--employees", type=int, default=20000, help="rows seeded before measuring")
+    parser.add_argument("--config", choices=["both", "default", "tuned"], default="both")
+    args = parser.parse_args()
+
+    configs = {"both": [False, True], "default": [False], "tuned": [True]}[args.config]
+    failed = False
+    for tuned in configs:
+        latencies, statuses = run_config(tuned, args.readers, args.writers, args.duration, args.employees)
+        server_errors = report("tuned" if tuned else "default", latencies, statuses, args.duration)
+        # Lock errors are expected from the default setup, not from the tuned one
+        failed = failed or (tuned and server_errors > 0)
+    sys.exit(1 if failed else 0)
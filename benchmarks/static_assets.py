@@ -0,0 +1,109 @@
+"""Bytes a browser transfers for the dashboard and the i-card page.
+
+Builds the static assets into a scratch folder (src/static_assets.py) and
+loads each page as a browser accepting "br, gzip" would, once from src/static
+as it is and once from the build: the page, every same-origin stylesheet,
+script and image it references, and the first font source of every
+@font-face in its stylesheets. The first load fetches everything; the
+repeat load, --hours later, sends only the requests whose cached copy has
+expired (revalidating with If-None-Match) and the page itself. Transfer is
+counted as response headers plus body.
+
+    python -m benchmarks.static_assets
+    python -m benchmarks.static_assets --hours 0.5
+"""
+import argparse
+import gzip
+import os
+import posixpath
+import re
+import sys
+import tempfile
+
+from benchmarks.common import temp_db_path
+from src.main import create_app
+from src.static_assets import build_assets, brotli
+
+PAGES = ("/", "/icard")
+ACCEPT_ENCODING = "br, gzip"
+
+PAGE_URL = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+FONT_SOURCE = re.compile(r"src:\s*url\(\s*['\"]?([^'\")]+)")
+
+def transfer_bytes(response):
+    headers = sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+    return headers + len(response.get_data())
+
+def decoded_text(response):
+    data = response.get_data()
+    if response.content_encoding == "br":
+        data = brotli.decompress(data)
+    elif response.content_encoding == "gzip":
+        data = gzip.decompress(data)
+    return data.decode("utf-8")
+
+def max_age(response):
+    control = response.cache_control
+    return control.max_age if control.max_age is not None and not control.no_cache else 0
+
+def page_assets(client, page):
+    """(page response, {asset url: response}) of a first load"""
+    response = client.get(page, headers={"Accept-Encoding": ACCEPT_ENCODING})
+    assets = {}
+    pending = PAGE_URL.findall(response.get_data(as_text=True))
+    while pending:
+        url = pending.pop()
+        if url in assets:
+            continue
+        assets[url] = client.get(url, headers={"Accept-Encoding": ACCEPT_ENCODING})
+        if assets[url].mimetype == "text/css":
+            folder = posixpath.dirname(url.split("?")[0])
+            for font in FONT_SOURCE.findall(decoded_text(assets[url])):
+                pending.append(posixpath.normpath(posixpath.join(folder, font)))
+    return response, assets
+
+def measure(client, page, hours):
+    """(first load bytes, requests), (repeat load bytes, requests)"""
+    response, assets = page_assets(client, page)
+    first = transfer_bytes(response) + sum(transfer_bytes(asset) for asset in assets.values())
+
+    repeat = transfer_bytes(client.get(page, headers={"Accept-Encoding": ACCEPT_ENCODING}))
+    requests = 1
+    for url, cached in assets.items():
+        if max_age(cached) > hours * 3600:
+            continue
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        if cached.headers.get("ETag"):
+            headers["If-None-Match"] = cached.headers["ETag"]
+        repeat += transfer_bytes(client.get(url, headers=headers))
+        requests += 1
+    return (first, 1 + len(assets)), (repeat, requests)
+
+def run(hours):
+    build_folder = tempfile.mkdtemp(prefix="inventory_static_")
+    build_assets(build_folder=build_folder)
+    db_path = temp_db_path()
+    setups = [
+        ("src/static", os.path.join(build_folder, "none")),
+        ("built", build_folder)
+    ]
+    print(f"{'page':<8}{'assets':<12}{'first load':>14}{'requests':>10}{'repeat load':>14}{'requests':>10}")
+    results = {}
+    for label, folder in setups:
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}", "ASSET_BUILD_DIR": folder}, initialize=True)
+        client = app.test_client()
+        for page in PAGES:
+            (first, first_requests), (repeat, repeat_requests) = measure(client, page, hours)
+            results[label, page] = first
+            print(f"{page:<8}{label:<12}{first:>14,}{first_requests:>10}{repeat:>14,}{repeat_requests:>10}")
+
+    if any(results["built", page] >= results["src/static", page] for page in PAGES):
+        print("FAIL: the build did not reduce first-load bytes")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=24, help="time between the first and the repeat load")
+    args = parser.parse_args()
+    sys.exit(run(args.hours))
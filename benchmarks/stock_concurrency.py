@@ -0,0 +1,101 @@
+"""Concurrent kit handouts against one stock table.
+
+Many threads create employees at once, each taking a random kit. Afterwards
+every stock level must equal its starting quantity minus what the committed
+employees actually hold, no level may be negative, and the movement journal
+must sum to the same level. A lost update, an oversell or a missing journal
+entry shows up as a mismatch and a non-zero exit status.
+
+    python -m benchmarks.stock_concurrency --threads 16 --per-thread 50 --stock 300
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import create_benchmark_app, temp_db_path
+from src.models.inventory import db, Stock, EmployeeItem, StockMovement
+from src.stock_journal import set_stock_quantity
+
+def run(threads, per_thread, initial_stock, seed):
+    app = create_benchmark_app(temp_db_path())
+    with app.app_context():
+        db.session.execute(db.update(Stock).values(danger_level=0))
+        item_names = list(db.session.execute(db.select(Stock.item_name).order_by(Stock.id)).scalars())
+        for item_name in item_names:
+            set_stock_quantity(item_name, initial_stock)
+        db.session.commit()
+
+    statuses = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker(worker_id):
+        rng = random.Random(seed + worker_id)
+        client = app.test_client()
+        start.wait()
+        for n in range(per_thread):
+            kit = {f"{item_name}_quantity": rng.randint(0, 2) for item_name in item_names}
+            response = client.post("/api/employees", json={
+                "employee_id": f"W{worker_id:03d}-{n:05d}",
+                "first_name": "Bench",
+                "last_name": f"Worker{worker_id}",
+                "emergency_no": "0000000000",
+                "blood_group": "O+",
+                "department_name": "Onboarding",
+                **kit
+            })
+            with lock:
+                statuses[response.status_code] += 1
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        levels = dict(db.session.execute(db.select(Stock.item_name, Stock.quantity)).all())
+        held = dict(db.session.execute(
+            db.select(Stock.item_name, db.func.sum(EmployeeItem.quantity))
+            .join(Stock, Stock.id == EmployeeItem.stock_id)
+            .group_by(EmployeeItem.stock_id)
+        ).all())
+        journaled = dict(db.session.execute(
+            db.select(Stock.item_name, db.func.sum(StockMovement.delta))
+            .join(Stock, Stock.id == StockMovement.stock_id)
+            .group_by(StockMovement.stock_id)
+        ).all())
+
+    failures = []
+    for item_name in item_names:
+        expected = initial_stock - held.get(item_name, 0)
+        if levels[item_name] != expected or levels[item_name] < 0:
+            failures.append(f"{item_name}: stock {levels[item_name]}, expected {expected}")
+        if journaled.get(item_name) != levels[item_name]:
+            failures.append(f"{item_name}: journal sums to {journaled.get(item_name)}, stock is {levels[item_name]}")
+
+    requests = threads * per_thread
+    print(f"{requests} handouts from {threads} threads in {elapsed:.2f}s ({requests / elapsed:.0f} req/s)")
+    print("Responses: " + ", ".join(f"{status}={count}" for status, count in sorted(statuses.items())))
+    print("Final stock: " + ", ".join(f"{name}={quantity}" for name, quantity in levels.items()))
+    if failures:
+        print("FAIL: stock does not match committed handouts")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("OK: no lost updates, no oversells, journal matches stock")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--per-thread", type=int, default=50)
+    parser.add_argument("--stock", type=int, default=300, help="starting quantity of every item")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(run(args.threads, args.per_thread, args.stock, args.seed))
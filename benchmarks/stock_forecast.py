@@ -0,0 +1,85 @@
+"""Stock forecast over a large movement journal.
+
+Seeds --movements journal rows spread over --days across every stock item
+(the same mix as benchmarks/stock_journal.py), then times GET
+/api/stock/forecast with the default 90-day window and with a window
+covering the whole journal. The per-day consumption the forecast is built
+from is checked against bucketing every movement in Python.
+
+    python -m benchmarks.stock_forecast --movements 1000000
+    python -m benchmarks.stock_forecast --movements 200000 --days 90 --repeats 10
+"""
+import argparse
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from benchmarks.common import create_benchmark_app, temp_db_path, percentile
+from benchmarks.stock_journal import seed_movements
+from src.models.inventory import db, Stock, StockMovement
+from src.stock_forecast import daily_consumption
+from src.stock_journal import HANDOUT, RETURN
+
+def bucket_in_python(start, days):
+    """The row-by-row version of daily_consumption"""
+    series = defaultdict(lambda: [0] * days)
+    rows = db.session.execute(
+        db.select(StockMovement.stock_id, StockMovement.delta, StockMovement.created_at)
+        .where(StockMovement.reason.in_((HANDOUT, RETURN)), StockMovement.created_at >= start)
+    )
+    for stock_id, delta, created_at in rows:
+        index = (created_at.date() - start.date()).days
+        if index < days:
+            series[stock_id][index] -= delta
+    return series
+
+def run(movements, days, repeats, seed):
+    db_path = temp_db_path()
+    app = create_benchmark_app(db_path)
+    with app.app_context():
+        stock_ids = db.session.execute(db.select(Stock.id)).scalars().all()
+    started = time.perf_counter()
+    seed_movements(db_path, stock_ids, movements, days, seed)
+    print(f"Seeded {movements:,} movements over {days} days in {time.perf_counter() - started:.1f}s")
+
+    client = app.test_client()
+    for window in sorted({min(90, days), days}):
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            response = client.get(f"/api/stock/forecast?days={window}")
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                print(f"FAIL: forecast answered {response.status_code}: {response.get_json()}")
+                return 1
+        print(f"forecast over {window:>4} days: p50={percentile(timings, 0.5):7.1f}ms max={max(timings):7.1f}ms")
+
+    for item in response.get_json()["items"]:
+        print(
+            f"  {item['item_name']:<12} quantity={item['quantity']:<6} {item['daily_consumption']:>7}/day "
+            f"cover={item['days_of_cover']} reorder_point={item['reorder_point']}"
+        )
+
+    with app.app_context():
+        start = datetime.combine(datetime.utcnow().date() - timedelta(days=days), datetime.min.time())
+        started = time.perf_counter()
+        expected = bucket_in_python(start, days)
+        python_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        actual = daily_consumption(start, days)
+        sql_ms = (time.perf_counter() - started) * 1000
+    print(f"daily consumption: one query {sql_ms:.1f}ms, row by row in Python {python_ms:.1f}ms")
+    if any(actual[stock_id] != expected.get(stock_id, [0] * days) for stock_id in actual):
+        print("FAIL: daily consumption differs from the row-by-row sums")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movements", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=365, help="days the seeded journal spans")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    sys.exit(run(args.movements, args.days, args.repeats, args.seed))
@@ -0,0 +1,124 @@
+"""Point-in-time stock queries over a large movement journal.
+
+Seeds --movements journal rows spread over --days across every stock item,
+builds the per-item checkpoints, then times "stock of X at time T" answered
+from the last checkpoint plus the tail of movements after it, against
+replaying the item's whole journal up to T. Every answer is checked against
+the replay; 30-day consumption reports are timed as well.
+
+    python -m benchmarks.stock_journal --movements 10000000
+    python -m benchmarks.stock_journal --movements 1000000 --queries 500
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import create_benchmark_app, temp_db_path, percentile
+from src.models.inventory import db, Stock
+from src.stock_journal import stock_at, consumption, rebuild_checkpoints, HANDOUT, RETURN, RESTOCK
+
+SEED_BATCH = 100000
+# The ORM's text format for DateTime columns
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+def seed_movements(db_path, stock_ids, movements, days, seed):
+    """Append movements in time order straight through sqlite3 (the ORM would take hours)"""
+    rng = random.Random(seed)
+    start = datetime.utcnow() - timedelta(days=days)
+    step = timedelta(days=days) / movements
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA synchronous=OFF")
+    try:
+        for batch_start in range(0, movements, SEED_BATCH):
+            rows = []
+            for n in range(batch_start, min(batch_start + SEED_BATCH, movements)):
+                roll = rng.random()
+                if roll < 0.8:
+                    delta, reason = -rng.randint(1, 3), HANDOUT
+                elif roll < 0.9:
+                    delta, reason = rng.randint(1, 3), RETURN
+                else:
+                    delta, reason = rng.randint(10, 40), RESTOCK
+                employee_id = f"SEED{rng.randrange(100000):07d}" if reason != RESTOCK else None
+                rows.append((rng.choice(stock_ids), delta, reason, employee_id, (start + step * n).strftime(TIMESTAMP_FORMAT)))
+            connection.executemany(
+                "INSERT INTO stock_movement (stock_id, delta, reason, employee_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            connection.commit()
+    finally:
+        connection.close()
+    return start
+
+def replay(stock_id, at):
+    """The query the checkpoints replace: sum the item's journal from the beginning"""
+    return db.session.execute(db.text(
+        "SELECT COALESCE(SUM(delta), 0) FROM stock_movement WHERE stock_id = :stock_id AND created_at <= :at"
+    ).bindparams(db.bindparam("at", type_=db.DateTime)), {"stock_id": stock_id, "at": at}).scalar()
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+def describe(label, latencies_ms):
+    print(
+        f"{label:<26} n={len(latencies_ms):<5} p50={percentile(latencies_ms, 0.5):8.2f}ms "
+        f"p99={percentile(latencies_ms, 0.99):8.2f}ms"
+    )
+
+def run(movements, days, queries, seed):
+    db_path = temp_db_path()
+    app = create_benchmark_app(db_path)
+    with app.app_context():
+        stock_ids = list(db.session.execute(db.select(Stock.id)).scalars())
+
+    started = time.perf_counter()
+    origin = seed_movements(db_path, stock_ids, movements, days, seed)
+    print(f"Seeded {movements} movements over {len(stock_ids)} items in {time.perf_counter() - started:.1f}s "
+          f"({os.path.getsize(db_path) / 1e6:.0f} MB)")
+
+    rng = random.Random(seed)
+    with app.app_context():
+        started = time.perf_counter()
+        checkpoints = sum(rebuild_checkpoints(stock_id) for stock_id in stock_ids)
+        db.session.commit()
+        print(f"Built {checkpoints} checkpoints in {time.perf_counter() - started:.1f}s")
+
+        checkpointed, replayed, reports = [], [], []
+        mismatches = 0
+        for _ in range(queries):
+            stock_id = rng.choice(stock_ids)
+            at = origin + timedelta(seconds=rng.uniform(0, days * 86400))
+            quantity, elapsed = timed(stock_at, stock_id, at)
+            checkpointed.append(elapsed)
+            expected, elapsed = timed(replay, stock_id, at)
+            replayed.append(elapsed)
+            if quantity != expected:
+                mismatches += 1
+
+            _, elapsed = timed(consumption, stock_id, at, at + timedelta(days=30))
+            reports.append(elapsed)
+
+    describe("stock_at (checkpoint+tail)", checkpointed)
+    describe("stock_at (full replay)", replayed)
+    describe("30-day consumption", reports)
+    print(f"Mismatches against replay: {mismatches}")
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    return 0 if mismatches == 0 else 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movements", type=int, default=10000000, help="journal rows seeded before measuring")
+    parser.add_argument("--days", type=int, default=365, help="period the movements are spread over")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(run(args.movements, args.days, args.queries, args.seed))
@@ -0,0 +1,391 @@
+"""Load suite for the whole API, with saved results and a regression gate.
+
+Seeds a synthetic database (employees with kit allocations, a stock
+catalog), then worker threads replay a weighted mix of what people do in
+the app for --duration seconds:
+
+    dashboard   GET /api/stock (revalidating its ETag) and /api/employees/stats
+    listing     the first two pages of the employee grid
+    search      typing a surname into the search box, one request per keystroke
+    onboarding  a burst of new joiners, each with a random kit
+    export      department CSV export and stock CSV export
+    icard       an employee's i-card PDF
+
+Requests go through Flask's test client, or with --server through a local
+threaded WSGI server over keep-alive HTTP. Throughput and p50/p95/p99 per
+endpoint are printed and written as JSON to --output; --baseline compares
+against an earlier file and exits 1 when an endpoint's p95 or a scenario's
+throughput regressed by more than --tolerance. The same --seed replays the
+same data and the same request sequence per thread.
+
+    python -m benchmarks.suite --employees 20000 --duration 20 --output before.json
+    python -m benchmarks.suite --employees 20000 --duration 20 --baseline before.json
+    python -m benchmarks.suite --server --threads 8 --mix search=1,dashboard=1
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from benchmarks.common import create_benchmark_app, temp_db_path, seed_employees, percentile
+from src.models.inventory import db, EmployeeItem, Stock
+from src.stats_service import rebuild_stats_rollup
+from src.stock_journal import apply_stock_changes, record_opening_balances
+
+DEFAULT_MIX = "dashboard=30,listing=15,search=25,onboarding=15,export=5,icard=10"
+GRID_FIELDS = "employee_id,first_name,last_name,department_name,bag_quantity,pen_quantity"
+# Stock big enough that onboarding never runs out during a run
+BENCH_STOCK = 10 ** 9
+
+def seed_database(app, employees, items, seed):
+    """Employees with 0-3 kit items each and a catalog of at least items stock items"""
+    seed_employees(app, employees)
+    rng = random.Random(seed)
+    with app.app_context():
+        existing = db.session.execute(db.select(db.func.count()).select_from(Stock)).scalar()
+        for n in range(existing, items):
+            db.session.add(Stock(item_name=f"item_{n:03d}", quantity=0, danger_level=30))
+        db.session.flush()
+        record_opening_balances()
+        catalog = list(db.session.execute(db.select(Stock.item_name, Stock.id).order_by(Stock.id)).all())
+        apply_stock_changes({item_name: ("set", BENCH_STOCK) for item_name, _ in catalog})
+
+        allocation = EmployeeItem.__table__
+        rows = []
+        for n in range(employees):
+            for _, stock_id in rng.sample(catalog, rng.randint(0, min(3, len(catalog)))):
+                rows.append({"employee_id": f"SEED{n:07d}", "stock_id": stock_id, "quantity": rng.randint(1, 2)})
+            if len(rows) >= 10000:
+                db.session.execute(allocation.insert(), rows)
+                rows = []
+        if rows:
+            db.session.execute(allocation.insert(), rows)
+        rebuild_stats_rollup()
+        db.session.commit()
+        return [item_name for item_name, _ in catalog]
+
+class TestClientDriver:
+    """Calls the app in-process, so the numbers are the app's own cost"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        # Reading the body drives streamed responses (exports) to the end
+        return response.status_code, response.headers, response.get_data()
+
+class QuietHTTP11Handler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+class HTTPDriver:
+    """One keep-alive connection per worker to a local WSGI server"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = http.client.HTTPConnection(host, port, timeout=120)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        try:
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The server closed the connection (e.g. after a streamed response); retry once
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+        data = response.read()
+        return response.status, response.headers, data
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.actions = defaultdict(int)
+
+    def call(self, driver, label, method, path, body=None, headers=None, ok=(200, 201, 304)):
+        started = time.perf_counter()
+        status, response_headers, data = driver.request(method, path, body, headers)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[label].append(elapsed)
+            if status not in ok:
+                self.errors[label] += 1
+        return status, response_headers, data
+
+    def action(self, scenario):
+        with self.lock:
+            self.actions[scenario] += 1
+
+class Session:
+    """What one simulated user keeps between actions: the last stock ETag, ids it created"""
+
+    def __init__(self, worker_id, rng, employees, catalog):
+        self.worker_id = worker_id
+        self.rng = rng
+        self.employees = employees
+        self.catalog = catalog
+        self.stock_etag = None
+        self.created = 0
+
+    def random_employee_id(self):
+        return f"SEED{self.rng.randrange(self.employees):07d}"
+
+def scenario_dashboard(driver, recorder, session):
+    headers = {"If-None-Match": session.stock_etag} if session.stock_etag else None
+    _, response_headers, _ = recorder.call(driver, "GET /api/stock", "GET", "/api/stock", headers=headers)
+    session.stock_etag = response_headers.get("ETag") or session.stock_etag
+    recorder.call(driver, "GET /api/employees/stats", "GET", "/api/employees/stats")
+
+def scenario_listing(driver, recorder, session):
+    query = {"limit": 50, "fields": GRID_FIELDS}
+    _, _, data = recorder.call(driver, "GET /api/employees", "GET", f"/api/employees?{urlencode(query)}")
+    cursor = json.loads(data).get("next_cursor")
+    if cursor:
+        query["cursor"] = cursor
+        recorder.call(driver, "GET /api/employees (next page)", "GET", f"/api/employees?{urlencode(query)}")
+
+def scenario_search(driver, recorder, session):
+    # Seeded surnames are Employee<n>; type one out from the third keystroke on
+    surname = f"Employee{session.rng.randrange(session.employees)}"
+    for length in range(3, len(surname) + 1):
+        query = urlencode({"q": surname[:length], "limit": 20, "fields": GRID_FIELDS})
+        recorder.call(driver, "GET /api/employees/search", "GET", f"/api/employees/search?{query}")
+
+def scenario_onboarding(driver, recorder, session):
+    for _ in range(5):
+        session.created += 1
+        kit = {f"{item_name}_quantity": session.rng.randint(0, 1) for item_name in session.catalog[:10]}
+        recorder.call(driver, "POST /api/employees", "POST", "/api/employees", body={
+            "employee_id": f"B{session.worker_id:02d}-{session.created:07d}",
+            "first_name": "Bench",
+            "last_name": f"Joiner{session.created}",
+            "emergency_no": "0000000000",
+            "blood_group": "O+",
+            "department_name": "Onboarding",
+            **kit
+        })
+
+def scenario_export(driver, recorder, session):
+    department = urlencode({"department": f"Department {session.rng.randrange(40)}"})
+    recorder.call(driver, "GET /api/export/employees", "GET", f"/api/export/employees?{department}")
+    recorder.call(driver, "GET /api/export/stock", "GET", "/api/export/stock")
+
+def scenario_icard(driver, recorder, session):
+    path = f"/api/employees/icard/{session.random_employee_id()}"
+    recorder.call(driver, "GET /api/employees/icard", "GET", path)
+
+SCENARIOS = {
+    "dashboard": scenario_dashboard,
+    "listing": scenario_listing,
+    "search": scenario_search,
+    "onboarding": scenario_onboarding,
+    "export": scenario_export,
+    "icard": scenario_icard
+}
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    for label, latencies in sorted(recorder.latencies.items()):
+        latencies_ms = [latency * 1000 for latency in latencies]
+        endpoints[label] = {
+            "requests": len(latencies_ms),
+            "errors": recorder.errors.get(label, 0),
+            "rps": round(len(latencies_ms) / elapsed, 2),
+            "p50_ms": round(percentile(latencies_ms, 0.5), 3),
+            "p95_ms": round(percentile(latencies_ms, 0.95), 3),
+            "p99_ms": round(percentile(latencies_ms, 0.99), 3)
+        }
+    scenarios = {
+        name: {"actions": count, "per_second": round(count / elapsed, 2)}
+        for name, count in sorted(recorder.actions.items())
+    }
+    return endpoints, scenarios
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Print changes against a baseline run; returns the regressions found"""
+    regressions = []
+    print(f"\nAgainst baseline {baseline['meta'].get('git_revision')} ({baseline['meta']['finished_at']}):")
+    for key in ("driver", "employees", "items", "threads", "mix", "cpus"):
+        if baseline["meta"].get(key) != results["meta"].get(key):
+            print(f"  warning: {key} differs ({baseline['meta'].get(key)} -> {results['meta'].get(key)}), "
+                  f"the runs are not comparable")
+    for label, current in results["endpoints"].items():
+        previous = baseline["endpoints"].get(label)
+        if previous is None:
+            continue
+        change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] if previous["p95_ms"] else 0.0
+        regressed = change > tolerance and current["p95_ms"] - previous["p95_ms"] > min_delta_ms
+        print(f"  {label:<34} p95 {previous['p95_ms']:9.2f} -> {current['p95_ms']:9.2f}ms ({change:+.0%})"
+              f"{'  REGRESSED' if regressed else ''}")
+        if regressed:
+            regressions.append(f"{label} p95")
+    for name, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if not previous or not previous["per_second"]:
+            continue
+        change = (current["per_second"] - previous["per_second"]) / previous["per_second"]
+        regressed = change < -tolerance
+        print(f"  {name + ' actions/s':<34}     {previous['per_second']:9.2f} -> {current['per_second']:9.2f}   ({change:+.0%})"
+              f"{'  REGRESSED' if regressed else ''}")
+        if regressed:
+            regressions.append(f"{name} throughput")
+    return regressions
+
+def run(args):
+    db_path = temp_db_path()
+    app = create_benchmark_app(db_path)
+    started = time.perf_counter()
+    catalog = seed_database(app, args.employees, args.items, args.seed)
+    print(f"Seeded {args.employees} employees and {len(catalog)} stock items in {time.perf_counter() - started:.1f}s")
+
+    server = None
+    if args.server:
+        server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHTTP11Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        make_driver = lambda: HTTPDriver("127.0.0.1", server.server_port)
+    else:
+        make_driver = lambda: TestClientDriver(app)
+
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    recorder = Recorder()
+    start = threading.Barrier(args.threads + 1)
+    stop = threading.Event()
+    measuring = threading.Event()
+
+    def worker(worker_id):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        session = Session(worker_id, rng, args.employees, catalog)
+        driver = make_driver()
+        warmup = Recorder()
+        start.wait()
+        while not stop.is_set():
+            scenario = rng.choices(names, weights)[0]
+            target = recorder if measuring.is_set() else warmup
+            SCENARIOS[scenario](driver, target, session)
+            target.action(scenario)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in pool:
+        thread.start()
+    start.wait()
+    time.sleep(args.warmup)
+    measuring.set()
+    measure_started = time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - measure_started
+    if server is not None:
+        server.shutdown()
+
+    endpoints, scenarios = summarize(recorder, elapsed)
+    results = {
+        "meta": {
+            **environment(),
+            "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "driver": "server" if args.server else "test_client",
+            "employees": args.employees,
+            "items": len(catalog),
+            "threads": args.threads,
+            "duration": round(elapsed, 2),
+            "mix": args.mix,
+            "seed": args.seed
+        },
+        "endpoints": endpoints,
+        "scenarios": scenarios
+    }
+
+    print(f"\n{'endpoint':<34} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for label, row in endpoints.items():
+        print(f"{label:<34} {row['requests']:>8} {row['errors']:>6} {row['rps']:>8.1f} "
+              f"{row['p50_ms']:>7.2f}ms {row['p95_ms']:>7.2f}ms {row['p99_ms']:>7.2f}ms")
+    print("Scenario actions/s: " + ", ".join(f"{name}={row['per_second']}" for name, row in scenarios.items()))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"Results written to {args.output}")
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    failed = sum(row["errors"] for row in endpoints.values())
+    if failed:
+        print(f"FAIL: {failed} requests returned an error status")
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("FAIL: regressed " + ", ".join(regressions))
+    return 1 if failed or regressions else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=20000, help="employees seeded before measuring")
+    parser.add_argument("--items", type=int, default=10, help="stock items in the catalog (at least the 10 defaults)")
+    parser.add_argument("--threads", type=int, default=4, help="simulated users")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds run before measuring")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"scenario weights, default {DEFAULT_MIX}")
+    parser.add_argument("--server", action="store_true", help="go through a local threaded WSGI server instead of the test client")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95 increase / throughput drop")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="p95 increases smaller than this never fail the gate")
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,101 @@
+"""Gunicorn settings for running the inventory app in production.
+
+    gunicorn -c gunicorn.conf.py
+
+Starts WEB_CONCURRENCY gevent worker processes (default one per core). The
+database is created/migrated once, by `flask init-db` in a child process,
+before any worker starts and again on every reload; workers then build the
+app with INVENTORY_INIT_DB=0.
+
+The master never imports the application, so `kill -HUP <master>` (or
+`systemctl reload`) starts workers on the current code and stops the old
+ones after their in-flight requests finish.
+
+Under gevent an open live-update stream (/api/events) is one idle greenlet,
+so each worker keeps up to EVENT_MAX_SUBSCRIBERS dashboards live. Request
+work that doesn't wait on I/O (SQLite queries, PDF rendering) still runs one
+request at a time per worker; i-card batches go to a process pool so they
+don't stall the rest. GUNICORN_WORKER_CLASS=gthread runs 2 x cores + 1
+threaded workers instead, where each stream holds a thread and at most
+GUNICORN_THREADS - API_RESERVED_THREADS streams are accepted per worker.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+wsgi_app = "src.main:create_app()"
+chdir = PROJECT_DIR
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+cooperative = worker_class in ("gevent", "eventlet")
+workers = int(os.environ.get(
+    "WEB_CONCURRENCY", multiprocessing.cpu_count() if cooperative else multiprocessing.cpu_count() * 2 + 1
+))
+# gthread only; gevent workers take up to worker_connections connections each
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+worker_connections = 1000
+# Threads per worker never given to live-update streams
+API_RESERVED_THREADS = 8
+# WeasyPrint processes for i-card batches on the whole host, split between workers
+ICARD_HOST_WORKERS = int(os.environ.get("ICARD_HOST_WORKERS", min(4, multiprocessing.cpu_count())))
+
+# Workers are created after fork, so each opens its own database connections
+preload_app = False
+# Requests longer than this (large i-card batches) get the worker restarted
+timeout = 120
+# Live-update streams never finish on their own; they reconnect to a new worker
+graceful_timeout = 20
+keepalive = 5
+# Recycle workers now and then to bound memory growth from PDF rendering
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = "-"
+errorlog = "-"
+
+raw_env = [
+    "INVENTORY_INIT_DB=0",
+    # Events published by one worker reach the streams held by the others
+    "EVENT_RELAY_FILE=" + os.environ.get(
+        "EVENT_RELAY_FILE", os.path.join(PROJECT_DIR, "src", "database", "events.relay")
+    ),
+    # A low-stock crossing is e-mailed by whichever worker records it first
+    "ALERT_STATE_FILE=" + os.environ.get(
+        "ALERT_STATE_FILE", os.path.join(PROJECT_DIR, "src", "database", "low_stock.state")
+    ),
+    # A gthread worker left with none renders its batches itself; a gevent
+    # worker keeps at least one process, so rendering never blocks its greenlets
+    "ICARD_WORKERS=" + os.environ.get(
+        "ICARD_WORKERS", str(max(ICARD_HOST_WORKERS // workers, 1 if cooperative else 0))
+    )
+]
+if worker_class == "gthread":
+    raw_env.append("EVENT_MAX_SUBSCRIBERS=" + str(max(threads - API_RESERVED_THREADS, 0)))
+
+def _init_database(server):
+    # A child process, so the master keeps no application modules to hand to new workers
+    env = dict(os.environ, INVENTORY_INIT_DB="0")
+    result = subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "src.main:create_app", "init-db"],
+        cwd=PROJECT_DIR, env=env
+    )
+    if result.returncode != 0:
+        server.log.error("flask init-db failed with exit code %s", result.returncode)
+    return result.returncode == 0
+
+def on_starting(server):
+    if not _init_database(server):
+        sys.exit(1)
+
+def on_reload(server):
+    # Keep serving on the previous schema rather than refusing to reload
+    _init_database(server)
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from src.db_config import dispose_inherited_connections
+        dispose_inherited_connections(server.app.wsgi())
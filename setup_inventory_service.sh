@@ -7,7 +7,8 @@ SERVICE_NAME="infopercept-inventory"
 USER_NAME=$(whoami)
 PROJECT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"  # Script's folder
 PYTHON_BIN="$PROJECT_DIR/venv/bin/python"
-MAIN_PY="$PROJECT_DIR/src/main.py"
+GUNICORN_BIN="$PROJECT_DIR/venv/bin/gunicorn"
+GUNICORN_CONF="$PROJECT_DIR/gunicorn.conf.py"
 BACKUP_PY="$PROJECT_DIR/src/db_backup.py"
 REQUIREMENTS_FILE="$PROJECT_DIR/requirements.txt"
 SERVICE_FILE="/etc/systemd/system/$SERVICE_NAME.service"
@@ -37,6 +38,10 @@ fi
 # Always ensure critical deps are present
 pip install flask weasyprint
 
+# Fingerprinted, minified and precompressed static files (src/static_build)
+echo "🗜️ Building static assets..."
+python "$PROJECT_DIR/src/static_assets.py"
+
 deactivate
 
 # --- Step 3: Create/Update systemd service file ---
@@ -50,7 +55,11 @@ After=network.target
 Type=simple
 User=$USER_NAME
 WorkingDirectory=$PROJECT_DIR
-ExecStart=$PYTHON_BIN $MAIN_PY
+ExecStart=$GUNICORN_BIN -c $GUNICORN_CONF
+# Graceful reload: new workers on the current code, old ones finish their requests
+ExecReload=/bin/kill -HUP \$MAINPID
+# SIGTERM lets workers finish in-flight requests (graceful_timeout) before exiting
+TimeoutStopSec=30
 Restart=always
 Environment=PYTHONUNBUFFERED=1
 
@@ -73,4 +82,5 @@ CRON_JOB="0 16 * * * $PYTHON_BIN $BACKUP_PY >> $BACKUP_LOG 2>&1"
 echo "✅ Setup complete!"
 echo "Service file: $SERVICE_FILE"
 echo "Service status: sudo systemctl status $SERVICE_NAME"
+echo "Reload after deploying new code: sudo systemctl reload $SERVICE_NAME"
 echo "Cron job set for: $BACKUP_PY (daily at 4:00 PM)"
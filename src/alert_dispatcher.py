@@ -0,0 +1,225 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from src.email_service import send_low_stock_alert
+from src.event_hub import publish_event
+
+# Quiet period after the last low-stock transition before an alert goes out
+ALERT_DEBOUNCE_SECONDS = 2.0
+# Upper bound on how long a transition can wait behind a stream of new ones
+ALERT_MAX_DELAY_SECONDS = 30.0
+
+# Set when several worker processes serve the app (see gunicorn.conf.py): which
+# items are low is then kept in this file, so a crossing alerts in one worker only
+ALERT_STATE_FILE = os.environ.get("ALERT_STATE_FILE")
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development server only
+    fcntl = None
+
+_FLUSH = object()
+_STOP = object()
+
+class LowItems:
+    """Names of the items currently known to be low, for this process"""
+
+    def __init__(self):
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def update(self, levels):
+        """Record levels; returns (names that became low, names that recovered)"""
+        with self._lock:
+            return _apply_levels(self._names, levels)
+
+    def discard(self, names):
+        with self._lock:
+            self._names.difference_update(names)
+
+class SharedLowItems:
+    """LowItems kept in a small JSON file under an flock, shared by every worker of the host.
+
+    Whichever worker records a crossing first gets it back from update();
+    the others see the item already low and stay quiet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _locked(self, change):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), "r+") as state_file:
+                content = state_file.read()
+                names = set(json.loads(content)) if content else set()
+                before = set(names)
+                result = change(names)
+                if names != before:
+                    state_file.seek(0)
+                    state_file.truncate()
+                    json.dump(sorted(names), state_file)
+            return result
+        finally:
+            os.close(fd)
+
+    def update(self, levels):
+        return self._locked(lambda names: _apply_levels(names, levels))
+
+    def discard(self, names):
+        self._locked(lambda low: low.difference_update(names))
+
+def _apply_levels(low, levels):
+    entered, recovered = set(), set()
+    for level in levels:
+        name = level["name"]
+        if level["quantity"] <= level["danger_level"]:
+            if name not in low:
+                low.add(name)
+                entered.add(name)
+        elif name in low:
+            low.discard(name)
+            recovered.add(name)
+    return entered, recovered
+
+class LowStockAlertDispatcher:
+    """Sends low-stock alerts from a background thread, only on state changes.
+
+    Write paths submit the current level of every item they touched. An
+    item alerts when it crosses into low stock; further drops while it stays
+    low, and repeated writes, are ignored until it has been restocked above
+    its danger level. Crossings that arrive close together are coalesced
+    into a single alert, so a burst of onboarding writes sends one email.
+    The request thread only enqueues, so mail server latency never reaches it.
+    on_transition(level, low) is called, undebounced, whenever an item
+    crosses its danger level in either direction.
+    """
+
+    def __init__(self, send=send_low_stock_alert, debounce=ALERT_DEBOUNCE_SECONDS,
+                 max_delay=ALERT_MAX_DELAY_SECONDS, on_transition=None, low_items=None):
+        self.send = send
+        self.on_transition = on_transition
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Which items are currently known to be low (LowItems or SharedLowItems)
+        self._low = low_items if low_items is not None else LowItems()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="low-stock-alerts", daemon=True)
+                self._thread.start()
+
+    def submit(self, levels, force=False):
+        """Queue item levels ({"name", "quantity", "danger_level"} dicts) for evaluation.
+
+        force=True alerts for every low item in levels even if it was already
+        reported, as the manual low-stock check does.
+        """
+        self.start()
+        self._queue.put((list(levels), force))
+
+    def flush(self, timeout=None):
+        """Send anything pending now and wait until it has gone out"""
+        self.start()
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def stop(self, timeout=5):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join(timeout)
+
+    def _run(self):
+        pending = {}
+        # When the oldest and the newest queued crossing arrived
+        first_at = last_at = None
+
+        while True:
+            timeout = None
+            if pending:
+                due = min(last_at + self.debounce, first_at + self.max_delay)
+                timeout = max(0.0, due - time.monotonic())
+
+            try:
+                levels, option = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                levels, option = _FLUSH, None
+
+            if levels is _FLUSH or levels is _STOP:
+                self._deliver(pending)
+                pending = {}
+                if levels is _STOP:
+                    return
+                if option is not None:
+                    option.set()
+                continue
+
+            try:
+                entered, recovered = self._low.update(levels)
+            except Exception as e:
+                print(f"Error recording low stock levels: {e}")
+                continue
+            for level in levels:
+                name = level["name"]
+                if name in entered:
+                    self._transition(level, True)
+                elif name in recovered:
+                    # Back above the danger level: the next drop alerts again
+                    self._transition(level, False)
+                    pending.pop(name, None)
+                    continue
+                low = level["quantity"] <= level["danger_level"]
+                # Newer levels replace queued ones; forced checks alert for every low item
+                if low and (option or name in entered or name in pending):
+                    if not pending:
+                        first_at = time.monotonic()
+                    last_at = time.monotonic()
+                    pending[name] = level
+
+    def _transition(self, level, low):
+        if self.on_transition is None:
+            return
+        try:
+            self.on_transition(level, low)
+        except Exception as e:
+            print(f"Error reporting low stock transition: {e}")
+
+    def _deliver(self, pending):
+        if not pending:
+            return
+        items = list(pending.values())
+        try:
+            delivered = self.send(items)
+        except Exception as e:
+            print(f"Error sending low stock alert: {e}")
+            delivered = False
+        if delivered is False:
+            # Let the next write that sees these items low try again
+            try:
+                self._low.discard([item["name"] for item in items])
+            except Exception as e:
+                print(f"Error recording low stock levels: {e}")
+
+def publish_low_stock_transition(level, low):
+    publish_event("low_stock", {"item": level, "low": low})
+
+_dispatcher = LowStockAlertDispatcher(
+    on_transition=publish_low_stock_transition,
+    low_items=SharedLowItems(ALERT_STATE_FILE) if ALERT_STATE_FILE and fcntl is not None else None
+)
+
+def get_alert_dispatcher():
+    return _dispatcher
+
+@atexit.register
+def _shutdown_dispatcher():
+    _dispatcher.stop()
@@ -0,0 +1,127 @@
+import codecs
+import csv
+import json
+import shutil
+import tempfile
+from src.models.inventory import Employee, ITEM_FIELD_SUFFIX
+
+# Rows validated and inserted per round trip
+IMPORT_CHUNK_SIZE = 500
+
+# Raw uploads up to this size are buffered in memory, larger ones on disk
+UPLOAD_SPOOL_BYTES = 8 * 1024 * 1024
+
+EMPLOYEE_COLUMNS = set(Employee.__table__.columns.keys())
+
+def normalize_header(header):
+    """Map an upload column name onto the employee field it holds.
+
+    Accepts API field names ("bag_quantity") as well as the labels written by
+    /export/employees ("Employee ID", "Bag", "T-shirt S"), so an export can be
+    fed straight back in. Anything that isn't an employee column is taken to
+    be an item name.
+    """
+    key = header.strip().lower().replace("-", "").replace(" ", "_")
+    if key in EMPLOYEE_COLUMNS or key.endswith(ITEM_FIELD_SUFFIX):
+        return key
+    return key + ITEM_FIELD_SUFFIX
+
+def normalize_row(raw):
+    row = {}
+    for key, value in raw.items():
+        if key is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        field = normalize_header(key)
+        # Blank quantity cells mean none handed out
+        if field.endswith(ITEM_FIELD_SUFFIX) and value in ("", None):
+            continue
+        row[field] = value
+    return row
+
+def detect_format(filename, content_type, requested=None):
+    """Work out whether an upload is CSV or JSON lines"""
+    if requested:
+        return requested.lower()
+    name = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "jsonl"
+    return "csv"
+
+def spool_upload(stream):
+    """Read a request body to the end before any database work starts.
+
+    Otherwise a slow client would hold the write lock while it uploads, and
+    under gevent another request could run (and wait on that lock) whenever
+    reading the body yields.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+    return spooled
+
+class UploadDecodeError(ValueError):
+    """The upload is not UTF-8; line_number is the line holding the first bad byte"""
+
+    def __init__(self, line_number):
+        self.line_number = line_number
+        super().__init__(f"Not valid UTF-8 text (line {line_number}); save the file as UTF-8 and upload it again")
+
+def _decode_upload(stream):
+    """Decode a binary stream chunk by chunk as UTF-8, raising UploadDecodeError at a bad byte"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    line_number = 1
+    for chunk in stream:
+        try:
+            text = decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise UploadDecodeError(line_number + chunk[:max(e.start, 0)].count(b"\n"))
+        line_number += chunk.count(b"\n")
+        if text:
+            yield text
+    try:
+        text = decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise UploadDecodeError(line_number)
+    if text:
+        yield text
+
+def iter_upload_rows(stream, upload_format):
+    """Yield (line_number, row, error) for each record of a binary upload stream.
+
+    The stream is decoded incrementally, so memory use doesn't depend on the
+    size of the upload. Bytes that aren't UTF-8 raise UploadDecodeError.
+    """
+    text = _decode_upload(stream)
+
+    if upload_format == "csv":
+        reader = csv.DictReader(text)
+        for raw in reader:
+            yield reader.line_num, normalize_row(raw), None
+    elif upload_format == "jsonl":
+        buffered = ""
+        line_number = 0
+        for chunk in text:
+            buffered += chunk
+            *lines, buffered = buffered.split("\n")
+            for line in lines:
+                line_number += 1
+                yield _parse_json_line(line_number, line)
+        if buffered.strip():
+            yield _parse_json_line(line_number + 1, buffered)
+    else:
+        raise ValueError("Unsupported format, use csv or jsonl")
+
+def _parse_json_line(line_number, line):
+    line = line.strip()
+    if not line:
+        return line_number, None, None
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return line_number, None, f"Invalid JSON: {e}"
+    if not isinstance(record, dict):
+        return line_number, None, "Each line must be a JSON object"
+    return line_number, normalize_row(record), None
@@ -0,0 +1,68 @@
+import csv
+import zlib
+from io import StringIO
+from flask import Response, request, stream_with_context
+from src.models.inventory import db
+
+# Rows fetched from SQLite and written out per chunk
+EXPORT_BATCH_SIZE = 1000
+
+def parse_export_columns(requested, available):
+    """Pick export columns from a comma separated columns= value.
+
+    available is an ordered list of (field, header label) pairs; the default
+    is all of them in that order.
+    """
+    if not requested:
+        return list(available)
+
+    labels = dict(available)
+    fields = [field.strip() for field in requested.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in labels]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return [(field, labels[field]) for field in fields]
+
+def iter_csv_chunks(header, stmt):
+    """Yield CSV text for stmt, one chunk per EXPORT_BATCH_SIZE rows"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(header)
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for rows in result.partitions():
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks into one gzip member as they arrive"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode("utf-8"))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def wants_gzip():
+    """gzip when the client accepts it, unless ?gzip=0 turns it off"""
+    if request.args.get("gzip") == "0":
+        return False
+    return "gzip" in request.headers.get("Accept-Encoding", "").lower()
+
+def csv_export_response(filename, columns, stmt):
+    """Stream stmt's rows as a CSV download without materializing the table"""
+    chunks = iter_csv_chunks([label for _, label in columns], stmt)
+    headers = {
+        "Content-Disposition": f"attachment;filename={filename}",
+        "Vary": "Accept-Encoding"
+    }
+    if wants_gzip():
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(stream_with_context(chunks), mimetype="text/csv", headers=headers)
@@ -1,4 +1,11 @@
-from src.models.inventory import db, Stock, Employee
+from src.models.inventory import db, Stock, Employee, StockMovement, StatsRollup
+from src.stats_service import rebuild_stats_rollup
+from src.item_catalog import migrate_legacy_item_columns
+from src.search_index import ensure_search_index
+from src.stock_journal import record_opening_balances
+from src.stock_cache import stock_cache
+from src.site_sync import migrate_sync_columns
+from src.row_version import migrate_version_columns
 
 def init_database():
     """Initialize database with default stock items"""
@@ -6,6 +13,16 @@ def init_database():
     # Create all tables
     db.create_all()
     
+    # Journals from before multi-site sync get the movement origin columns
+    migrate_sync_columns()
+    
+    # Stock and employee rows from before optimistic concurrency start at version 1
+    migrate_version_columns()
+    
+    # create_all skips tables that already exist, so add any newer indexes
+    for index in (*Employee.__table__.indexes, *StockMovement.__table__.indexes):
+        index.create(db.engine, checkfirst=True)
+    
     # Check if stock items already exist
     if Stock.query.count() == 0:
         # Initialize default stock items
@@ -26,8 +43,25 @@ def init_database():
             item = Stock(**item_data)
             db.session.add(item)
     
+    # Older databases keep kit quantities in per-item employee columns
+    migrate_legacy_item_columns()
+    
+    # Start the movement journal of items that predate it from their current level
+    db.session.flush()
+    record_opening_balances()
+    
+    # Seed the stats rollup from existing employees on first run
+    if StatsRollup.query.count() == 0:
+        rebuild_stats_rollup()
+    
     # Commit all changes
     db.session.commit()
+    
+    # Full-text index for employee search, maintained by triggers
+    ensure_search_index()
+    
+    # The database may have been replaced (e.g. restored) while the app was down
+    stock_cache.invalidate()
     print("Database initialized successfully!")
 
 def get_low_stock_items():
@@ -46,4 +80,19 @@ def get_low_stock_items():
     
     return low_stock_items
 
-
+def get_stock_levels(item_names=None):
+    """Current level of the given items (every item when None), shaped like get_low_stock_items"""
+    stmt = db.select(Stock.item_name, Stock.quantity, Stock.danger_level, Stock.version)
+    if item_names is not None:
+        stmt = stmt.where(Stock.item_name.in_(list(item_names)))
+    
+    return [
+        {
+            "type": "item",
+            "name": item_name,
+            "quantity": quantity,
+            "danger_level": danger_level,
+            "version": version
+        }
+        for item_name, quantity, danger_level, version in db.session.execute(stmt)
+    ]
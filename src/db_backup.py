@@ -1,24 +1,314 @@
-import shutil
+"""Online backups of the inventory database.
+
+Snapshots are taken with SQLite's online backup API, so they are always a
+consistent database image even while the app is writing. Every run stores
+either a full snapshot or a delta holding only the pages that changed since
+the previous snapshot; both are gzip-compressed and described by a JSON
+manifest next to them. A chain of deltas is closed by the next full
+snapshot after FULL_SNAPSHOT_EVERY runs, and only the newest KEEP_CHAINS
+chains are kept.
+
+A delta saves disk space, not backup time: every run copies the whole
+database to a scratch file and hashes every page of it, and a delta then
+stores the pages whose hash differs from the parent manifest's.
+
+    python src/db_backup.py                  # back up (full or delta) and verify it
+    python src/db_backup.py --full           # force a full snapshot
+    python src/db_backup.py --list
+    python src/db_backup.py --verify <name>
+    python src/db_backup.py --restore <name> --target restored.db
+"""
+import argparse
+import contextlib
 import datetime
+import gzip
+import hashlib
+import json
 import os
+import sqlite3
 import sys
+import tempfile
+import time
+
+# Pages copied per backup step when writers have to be let in between steps
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_SLEEP = 0.005
+# Restarts (caused by concurrent commits) tolerated before copying in one step
+MAX_BACKUP_RESTARTS = 3
+
+FULL_SNAPSHOT_EVERY = 7
+KEEP_CHAINS = 4
+COMPRESS_LEVEL = 6
+
+class BackupError(Exception):
+    pass
+
+class _BackupRestarted(Exception):
+    pass
+
+def _timestamp():
+    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+
+def _page_digest(page):
+    return hashlib.blake2b(page, digest_size=8).hexdigest()
+
+def copy_database(db_path, dest_path):
+    """Copy a live database to dest_path with the online backup API.
+
+    In WAL mode the whole copy runs inside one read transaction, which never
+    blocks writers. In rollback-journal mode a read lock would hold writers
+    off for the whole copy, so pages are copied in small steps with a pause
+    in between; if concurrent commits keep restarting the copy it falls
+    back to a single step.
+    """
+    source = sqlite3.connect(db_path, timeout=30)
+    dest = sqlite3.connect(dest_path)
+    try:
+        journal_mode = source.execute("PRAGMA journal_mode").fetchone()[0]
+        if journal_mode.lower() == "wal":
+            source.backup(dest)
+            return journal_mode
+
+        last_remaining = [None]
+        restarts = [0]
+
+        def progress(status, remaining, total):
+            # A commit from another connection makes the next step start over
+            if last_remaining[0] is not None and remaining >= last_remaining[0]:
+                restarts[0] += 1
+                if restarts[0] > MAX_BACKUP_RESTARTS:
+                    raise _BackupRestarted()
+            last_remaining[0] = remaining
+
+        try:
+            source.backup(dest, pages=BACKUP_PAGES_PER_STEP, progress=progress, sleep=BACKUP_STEP_SLEEP)
+        except _BackupRestarted:
+            source.backup(dest)
+        return journal_mode
+    finally:
+        dest.close()
+        source.close()
+
+def _iter_pages(path, page_size):
+    with open(path, "rb") as db_file:
+        while True:
+            page = db_file.read(page_size)
+            if not page:
+                return
+            yield page
+
+def _manifest_path(backup_dir, name):
+    return os.path.join(backup_dir, f"{name}.json")
+
+def load_manifest(backup_dir, name):
+    with open(_manifest_path(backup_dir, name)) as manifest_file:
+        return json.load(manifest_file)
+
+def list_snapshots(backup_dir):
+    """Manifests of every snapshot in backup_dir, oldest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    names = sorted(
+        filename[:-len(".json")] for filename in os.listdir(backup_dir)
+        if filename.endswith(".json") and filename.startswith(("full_", "delta_"))
+    )
+    snapshots = [load_manifest(backup_dir, name) for name in names]
+    return sorted(snapshots, key=lambda manifest: manifest["created_at"])
+
+def _write_manifest(backup_dir, manifest):
+    path = _manifest_path(backup_dir, manifest["name"])
+    with open(f"{path}.tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(f"{path}.tmp", path)
+
+def backup_sqlite_db(db_path, backup_dir, full=False, verify=True):
+    """Take a full or delta snapshot of db_path into backup_dir; returns its manifest.
 
-def backup_sqlite_db(db_path, backup_dir):
+    Either kind copies and hashes the whole database; a delta only writes less.
+    """
     if not os.path.exists(backup_dir):
         os.makedirs(backup_dir)
-    
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = os.path.join(backup_dir, f"backup_{timestamp}.db")
-    
-    shutil.copy2(db_path, backup_file)
-    print(f"Backup created at: {backup_file}")
+
+    handle, copy_path = tempfile.mkstemp(prefix="snapshot_", suffix=".db", dir=backup_dir)
+    os.close(handle)
+    try:
+        started = time.perf_counter()
+        journal_mode = copy_database(db_path, copy_path)
+        copy_seconds = time.perf_counter() - started
+
+        # A connection's with block only ends the transaction; closing() closes it
+        with contextlib.closing(sqlite3.connect(copy_path)) as copy:
+            page_size = copy.execute("PRAGMA page_size").fetchone()[0]
+
+        snapshots = list_snapshots(backup_dir)
+        parent = snapshots[-1] if snapshots else None
+        chain_length = 0
+        if parent is not None:
+            chain = [snapshot for snapshot in snapshots if snapshot["base"] == parent["base"]]
+            chain_length = len(chain)
+        kind = "delta"
+        if full or parent is None or parent["page_size"] != page_size or chain_length >= FULL_SNAPSHOT_EVERY:
+            kind = "full"
+
+        name = f"{kind}_{_timestamp()}"
+        data_path = os.path.join(backup_dir, f"{name}.{'db' if kind == 'full' else 'pages'}.gz")
+        page_hashes = []
+        changed = 0
+        digest = hashlib.sha256()
+
+        with gzip.open(f"{data_path}.tmp", "wb", compresslevel=COMPRESS_LEVEL) as out:
+            for page_no, page in enumerate(_iter_pages(copy_path, page_size)):
+                digest.update(page)
+                page_hash = _page_digest(page)
+                page_hashes.append(page_hash)
+                if kind == "full":
+                    out.write(page)
+                elif page_no >= len(parent["page_hashes"]) or parent["page_hashes"][page_no] != page_hash:
+                    # Delta records: 4-byte page number followed by the page
+                    out.write(page_no.to_bytes(4, "big"))
+                    out.write(page)
+                    changed += 1
+        os.replace(f"{data_path}.tmp", data_path)
+
+        manifest = {
+            "name": name,
+            "kind": kind,
+            "created_at": datetime.datetime.now().isoformat(),
+            "source": os.path.abspath(db_path),
+            "journal_mode": journal_mode,
+            "base": name if kind == "full" else parent["base"],
+            "parent": None if kind == "full" else parent["name"],
+            "data_file": os.path.basename(data_path),
+            "page_size": page_size,
+            "page_count": len(page_hashes),
+            "changed_pages": len(page_hashes) if kind == "full" else changed,
+            "sha256": digest.hexdigest(),
+            "copy_seconds": round(copy_seconds, 4),
+            "page_hashes": page_hashes
+        }
+        _write_manifest(backup_dir, manifest)
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+
+    print(
+        f"Backup created at: {data_path} ({kind}, {manifest['changed_pages']}/{manifest['page_count']} pages, "
+        f"copied in {copy_seconds:.3f}s)"
+    )
+
+    if verify:
+        verify_backup(backup_dir, name)
+    apply_retention(backup_dir)
+    return manifest
+
+def _snapshot_chain(backup_dir, name):
+    """Manifests from the full snapshot up to name, in the order they must be applied"""
+    chain = [load_manifest(backup_dir, name)]
+    while chain[0]["parent"] is not None:
+        chain.insert(0, load_manifest(backup_dir, chain[0]["parent"]))
+    if chain[0]["kind"] != "full":
+        raise BackupError(f"Snapshot chain of {name} does not start with a full snapshot")
+    return chain
+
+def restore_backup(backup_dir, name, target_path):
+    """Rebuild the database image of snapshot name at target_path"""
+    chain = _snapshot_chain(backup_dir, name)
+    manifest = chain[-1]
+    temp_path = f"{target_path}.restore.tmp"
+
+    with open(temp_path, "wb") as out:
+        with gzip.open(os.path.join(backup_dir, chain[0]["data_file"]), "rb") as full_data:
+            while True:
+                block = full_data.read(1024 * 1024)
+                if not block:
+                    break
+                out.write(block)
+
+        for delta in chain[1:]:
+            page_size = delta["page_size"]
+            with gzip.open(os.path.join(backup_dir, delta["data_file"]), "rb") as delta_data:
+                while True:
+                    header = delta_data.read(4)
+                    if not header:
+                        break
+                    page = delta_data.read(page_size)
+                    out.seek(int.from_bytes(header, "big") * page_size)
+                    out.write(page)
+        # A database that shrank since the full snapshot drops its tail pages
+        out.truncate(manifest["page_count"] * manifest["page_size"])
+
+    digest = hashlib.sha256()
+    for page in _iter_pages(temp_path, manifest["page_size"]):
+        digest.update(page)
+    if digest.hexdigest() != manifest["sha256"]:
+        os.remove(temp_path)
+        raise BackupError(f"Restored image of {name} does not match its checksum")
+
+    os.replace(temp_path, target_path)
+    return target_path
+
+def verify_backup(backup_dir, name):
+    """Restore a snapshot to a scratch file and run SQLite's integrity check on it"""
+    handle, scratch_path = tempfile.mkstemp(prefix="verify_", suffix=".db", dir=backup_dir)
+    os.close(handle)
+    try:
+        restore_backup(backup_dir, name, scratch_path)
+        connection = sqlite3.connect(scratch_path)
+        try:
+            result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            connection.close()
+        if result != "ok":
+            raise BackupError(f"Integrity check of {name} failed: {result}")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(scratch_path + suffix):
+                os.remove(scratch_path + suffix)
+    print(f"Backup verified: {name}")
+    return True
+
+def apply_retention(backup_dir, keep_chains=KEEP_CHAINS):
+    """Delete whole snapshot chains older than the newest keep_chains"""
+    snapshots = list_snapshots(backup_dir)
+    bases = [snapshot["name"] for snapshot in snapshots if snapshot["kind"] == "full"]
+    expired = set(bases[:-keep_chains]) if keep_chains else set()
+    for snapshot in snapshots:
+        if snapshot["base"] in expired:
+            os.remove(os.path.join(backup_dir, snapshot["data_file"]))
+            os.remove(_manifest_path(backup_dir, snapshot["name"]))
+            print(f"Removed expired backup: {snapshot['name']}")
 
 if __name__ == "__main__":
     # Get the project root directory (infopercept-inventory folder)
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    
+
     # Relative paths from project root
     db_path = os.path.join(project_root, "src", "database", "app.db")
     backup_dir = os.path.join(project_root, "src", "database", "backups")
-    
-    backup_sqlite_db(db_path, backup_dir)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=db_path)
+    parser.add_argument("--backup-dir", default=backup_dir)
+    parser.add_argument("--full", action="store_true", help="take a full snapshot even if a delta would do")
+    parser.add_argument("--no-verify", action="store_true", help="skip the restore check after backing up")
+    parser.add_argument("--list", action="store_true", help="list snapshots")
+    parser.add_argument("--verify", metavar="NAME", help="restore-check an existing snapshot")
+    parser.add_argument("--restore", metavar="NAME", help="restore a snapshot to --target")
+    parser.add_argument("--target", help="database file written by --restore")
+    args = parser.parse_args()
+
+    try:
+        if args.list:
+            for snapshot in list_snapshots(args.backup_dir):
+                print(f"{snapshot['name']}  {snapshot['created_at']}  {snapshot['changed_pages']}/{snapshot['page_count']} pages")
+        elif args.verify:
+            verify_backup(args.backup_dir, args.verify)
+        elif args.restore:
+            if not args.target:
+                parser.error("--restore needs --target")
+            print(f"Restored {args.restore} to {restore_backup(args.backup_dir, args.restore, args.target)}")
+        else:
+            backup_sqlite_db(args.db, args.backup_dir, full=args.full, verify=not args.no_verify)
+    except (BackupError, sqlite3.Error, OSError) as e:
+        print(f"Backup failed: {e}")
+        sys.exit(1)
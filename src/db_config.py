@@ -0,0 +1,101 @@
+import functools
+import os
+import random
+import sqlite3
+import time
+from flask import jsonify
+from sqlalchemy import event
+from sqlalchemy.exc import DisconnectionError, OperationalError
+from src.models.inventory import db
+
+# Applied to every new SQLite connection, in this order
+SQLITE_PRAGMAS = (
+    # Readers keep reading from their snapshot while a writer commits
+    ("journal_mode", "WAL"),
+    # Durable across app crashes; a power cut can lose only the last commits
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", "5000"),
+    # Negative means KiB: 20 MB of page cache per connection
+    ("cache_size", "-20000"),
+    ("mmap_size", str(256 * 1024 * 1024)),
+    ("temp_store", "MEMORY")
+)
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+
+# Write transactions that still hit "database is locked" after busy_timeout
+WRITE_RETRY_ATTEMPTS = 3
+WRITE_RETRY_BACKOFF = 0.05
+
+def sqlite_engine_options():
+    """SQLALCHEMY_ENGINE_OPTIONS for a file-backed SQLite database"""
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": 30,
+        "connect_args": {"timeout": 5, "check_same_thread": False}
+    }
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def record_connection_pid(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+def reject_inherited_connection(dbapi_connection, connection_record, connection_proxy):
+    """Never hand a forked worker a pooled connection its parent opened"""
+    pid = os.getpid()
+    if connection_record.info.get("pid", pid) != pid:
+        # Dropped without closing: the parent still owns the underlying handle
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise DisconnectionError(f"Connection opened in process {connection_record.info['pid']}, checked out in {pid}")
+
+def init_sqlite(app):
+    """Bind db to app with the pooled engine options and install the connection pragmas"""
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", sqlite_engine_options())
+    db.init_app(app)
+    with app.app_context():
+        event.listen(db.engine, "connect", apply_sqlite_pragmas)
+        event.listen(db.engine, "connect", record_connection_pid)
+        event.listen(db.engine, "checkout", reject_inherited_connection)
+
+def dispose_inherited_connections(app):
+    """Call in a worker right after fork when the app was created before it (preload)"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def is_database_busy(error):
+    message = str(getattr(error, "orig", error)).lower()
+    return "database is locked" in message or "database is busy" in message
+
+def retry_on_busy(view):
+    """Re-run a write view whose transaction failed because another writer held the lock.
+
+    The view must roll back and re-raise OperationalError instead of turning
+    it into a response. Only decorate views that can safely run twice, i.e.
+    ones that don't consume a request stream.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        for attempt in range(WRITE_RETRY_ATTEMPTS):
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if not is_database_busy(e):
+                    return jsonify({"error": str(e)}), 500
+                if attempt + 1 == WRITE_RETRY_ATTEMPTS:
+                    response = jsonify({"error": "Database is busy, please retry"})
+                    response.headers["Retry-After"] = "1"
+                    return response, 503
+                # Jittered exponential backoff so retrying writers don't collide again
+                time.sleep(WRITE_RETRY_BACKOFF * (2 ** attempt) * (0.5 + random.random()))
+    return wrapper
@@ -1,15 +1,97 @@
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 import os
 
-# Email configuration
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
-SENDER_EMAIL = "inventory@company.com"  # This would need to be configured
-SENDER_PASSWORD = "your_app_password"   # This would need to be configured
-RECIPIENT_EMAIL = "bansrijiyani07@gmail.com"
+# Email configuration (environment variables override the defaults)
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+SENDER_EMAIL = os.environ.get("SENDER_EMAIL", "inventory@company.com")  # This would need to be configured
+SENDER_PASSWORD = os.environ.get("SENDER_PASSWORD", "your_app_password")   # This would need to be configured
+RECIPIENT_EMAIL = os.environ.get("RECIPIENT_EMAIL", "bansrijiyani07@gmail.com")
+# Login name for the SMTP server; set SMTP_USERNAME="" for servers without auth
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME", SENDER_EMAIL)
+
+# Real delivery is opt-in; otherwise alerts are printed for demo purposes
+SMTP_ENABLED = os.environ.get("SMTP_ENABLED", "0") == "1"
+
+# Seconds an open SMTP session may sit unused before it is closed
+SMTP_IDLE_TIMEOUT = 300
+
+class SMTPConnectionPool:
+    """Keeps one authenticated SMTP session open between sends.
+
+    Opening a connection costs a TCP handshake, STARTTLS and a login, so the
+    session is reused until it has been idle for idle_timeout seconds or the
+    server drops it, in which case the send is retried on a fresh one. Point
+    it at a local stand-in (e.g. aiosmtpd on port 8025 with starttls=False
+    and no username) to exercise delivery in tests.
+    """
+
+    def __init__(self, host, port, starttls=True, username=None, password=None,
+                 idle_timeout=SMTP_IDLE_TIMEOUT, timeout=30):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._connection = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                connection.starttls()
+            if self.username:
+                connection.login(self.username, self.password)
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+            raise
+        return connection
+
+    def _discard(self):
+        if self._connection is not None:
+            try:
+                self._connection.quit()
+            except (smtplib.SMTPException, OSError):
+                # quit() only closes the socket once the server has answered
+                self._connection.close()
+            self._connection = None
+
+    def send(self, msg):
+        with self._lock:
+            if self._connection is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._discard()
+
+            for attempt in range(2):
+                if self._connection is None:
+                    self._connection = self._connect()
+                try:
+                    self._connection.send_message(msg)
+                    self._last_used = time.monotonic()
+                    return
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    # Stale pooled session; close it and reconnect once before giving up
+                    self._discard()
+                    if attempt:
+                        raise
+
+    def close(self):
+        with self._lock:
+            self._discard()
+
+smtp_pool = SMTPConnectionPool(
+    SMTP_SERVER, SMTP_PORT, starttls=SMTP_STARTTLS,
+    username=SMTP_USERNAME or None, password=SENDER_PASSWORD
+)
 
 def send_low_stock_alert(low_stock_items):
     """Send email alert for low stock items"""
@@ -41,11 +123,12 @@ def send_low_stock_alert(low_stock_items):
         print("Inventory Management System")
         print("=" * 50)
         
-        # Create email content for actual sending (commented out for demo)
+        # Create email content for actual sending
         email_content = create_email_content(low_stock_items)
         
-        # Uncomment below for actual email sending
-        # send_actual_email(email_content)
+        # Real delivery only when SMTP_ENABLED=1
+        if SMTP_ENABLED:
+            return send_actual_email(email_content)
         
         return True
     except Exception as e:
@@ -114,8 +197,8 @@ def create_email_content(low_stock_items):
     
     return html_content
 
-def send_actual_email(html_content):
-    """Send actual email (requires SMTP configuration)"""
+def send_actual_email(html_content, pool=None):
+    """Send actual email (requires SMTP configuration); pool defaults to smtp_pool"""
     try:
         # Create message
         msg = MIMEMultipart('alternative')
@@ -127,13 +210,8 @@ def send_actual_email(html_content):
         html_part = MIMEText(html_content, 'html')
         msg.attach(html_part)
         
-        # Send email
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(SENDER_EMAIL, RECIPIENT_EMAIL, text)
-        server.quit()
+        # Send email over the pooled session
+        (pool or smtp_pool).send(msg)
         
         print(f"Low stock alert email sent successfully to {RECIPIENT_EMAIL}")
         return True
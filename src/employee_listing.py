@@ -0,0 +1,125 @@
+import base64
+import json
+from datetime import datetime
+from src.models.inventory import db, Employee
+from src.item_catalog import get_item_catalog, get_item_fields, employee_columns, item_field
+
+# Columns of the employee table itself; item quantities come from the catalog.
+# The row version is left out: it is served as the ETag of GET /employees/<id>
+# and differs between sync sites for the same data.
+BASE_EMPLOYEE_FIELDS = tuple(name for name in Employee.__table__.columns.keys() if name != "version")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def employee_fields():
+    """Every employee field: the table columns plus a <item>_quantity per catalog item"""
+    return BASE_EMPLOYEE_FIELDS + tuple(get_item_fields())
+
+def parse_employee_fields(requested, default=None):
+    """Validate a comma separated fields= value against the employee fields"""
+    if not requested:
+        return tuple(default) if default is not None else employee_fields()
+
+    fields = [field.strip() for field in requested.split(",") if field.strip()]
+    available = employee_fields()
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    # Rows are always identifiable
+    if "employee_id" not in fields:
+        fields.insert(0, "employee_id")
+    return tuple(fields)
+
+def parse_page_size(requested, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if requested is None:
+        return default
+    return max(1, min(int(requested), maximum))
+
+def employee_values_to_dict(fields, values):
+    """Build a response dict straight from Employee column values"""
+    data = dict(zip(fields, values))
+    if data.get("created_at") is not None:
+        data["created_at"] = data["created_at"].isoformat()
+    return data
+
+def fetch_employee(employee_id, catalog=None):
+    """(response dict, row version) of one employee, or (None, None).
+
+    One select with the item quantities as columns, like the listing;
+    pass the catalog when the caller already has it.
+    """
+    catalog = get_item_catalog() if catalog is None else catalog
+    fields = BASE_EMPLOYEE_FIELDS + tuple(item_field(item_name) for item_name in catalog)
+    row = db.session.execute(
+        db.select(*employee_columns(fields, catalog), Employee.version).where(Employee.employee_id == employee_id)
+    ).first()
+    if row is None:
+        return None, None
+    return employee_values_to_dict(fields, row[:-1]), row[-1]
+
+def employee_row_to_dict(row):
+    return employee_values_to_dict(row._fields, row)
+
+def employee_rows_to_lists(fields, rows):
+    """Value lists in fields order for a columnar response (see src/json_response.py)"""
+    width = len(fields)
+    if "created_at" not in fields:
+        return [list(row[:width]) for row in rows]
+    position = fields.index("created_at")
+    lists = []
+    for row in rows:
+        values = list(row[:width])
+        if values[position] is not None:
+            values[position] = values[position].isoformat()
+        lists.append(values)
+    return lists
+
+def encode_keyset_cursor(created_at, employee_id):
+    payload = {"c": created_at.isoformat() if created_at else None, "id": employee_id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_keyset_cursor(cursor):
+    """Turn an opaque listing cursor back into its (created_at, employee_id) key"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(payload["c"]) if payload["c"] else None
+        return created_at, str(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def fetch_employee_page(fields=None, limit=DEFAULT_PAGE_SIZE, after=None, as_lists=False):
+    """Return (employees, next_cursor) for one page of employees in joining order.
+
+    Pages are keyed on (created_at, employee_id) so every page is an index
+    range scan, however deep the client has paged. Dicts are built straight
+    from Core rows of the requested fields; no ORM objects are hydrated.
+    after is a decoded cursor (see decode_keyset_cursor); limit=None returns
+    everything after it. as_lists=True returns value lists in fields order
+    instead of dicts.
+    """
+    fields = employee_fields() if fields is None else fields
+    employee = Employee.__table__
+    sort_key = (employee.c.created_at, employee.c.employee_id)
+
+    # The sort key rides along so the next cursor can be built from the last row
+    columns = employee_columns(fields)
+    columns += [column.label(f"_key_{column.name}") for column in sort_key]
+    stmt = db.select(*columns).order_by(*sort_key)
+    if after is not None:
+        key = [db.literal(value, column.type) for value, column in zip(after, sort_key)]
+        stmt = stmt.where(db.tuple_(*sort_key) > db.tuple_(*key))
+
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+
+    rows = db.session.execute(stmt).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_keyset_cursor(rows[-1]._key_created_at, rows[-1]._key_employee_id)
+
+    if as_lists:
+        return employee_rows_to_lists(fields, rows), next_cursor
+    width = len(fields)
+    return [employee_values_to_dict(fields, row[:width]) for row in rows], next_cursor
@@ -0,0 +1,303 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development server only
+    fcntl = None
+
+# Recent events kept for clients reconnecting with Last-Event-ID
+EVENT_BUFFER_SIZE = 1000
+# Idle streams get a comment this often so proxies and dead clients are noticed
+HEARTBEAT_SECONDS = 15
+# Milliseconds the browser waits before reconnecting a dropped stream
+RECONNECT_MILLISECONDS = 3000
+MAX_SUBSCRIBERS = int(os.environ.get("EVENT_MAX_SUBSCRIBERS", "500"))
+
+# Set when several worker processes serve the app (see gunicorn.conf.py): events
+# are appended to this file and every worker streams what any of them published
+EVENT_RELAY_FILE = os.environ.get("EVENT_RELAY_FILE")
+# The relay file is replaced by an empty one past this size; open streams resync
+EVENT_RELAY_MAX_BYTES = 8 * 1024 * 1024
+EVENT_RELAY_POLL_SECONDS = 0.1
+
+class TooManySubscribers(Exception):
+    pass
+
+def _frame(epoch, seq, event_type, payload):
+    return f"id: {epoch}-{seq}\nevent: {event_type}\ndata: {payload}\n\n"
+
+class EventRelay:
+    """Append-only event file shared by the worker processes of one host.
+
+    Each line is "<type> <json>", after a first line naming the file's
+    epoch. An event's id is the byte offset just past its line, so ids are
+    ordered the same way in every worker. Writers append under an flock;
+    the file is swapped for a fresh one (new epoch) once it grows past
+    max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=EVENT_RELAY_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def append(self, event_type, payload):
+        line = f"{event_type} {payload}\n".encode()
+        while True:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                # Another worker may have swapped the file between our open and lock
+                try:
+                    current = os.stat(self.path).st_ino
+                except FileNotFoundError:
+                    current = None
+                if current != os.fstat(fd).st_ino:
+                    continue
+                size = os.fstat(fd).st_size
+                if size == 0:
+                    os.write(fd, self._header())
+                elif size + len(line) > self.max_bytes:
+                    self._replace()
+                    continue
+                os.write(fd, line)
+                return
+            finally:
+                os.close(fd)
+
+    def _header(self):
+        return f"epoch {uuid.uuid4().hex[:12]}\n".encode()
+
+    def _replace(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as relay_file:
+            relay_file.write(self._header())
+        os.replace(temp_path, self.path)
+
+class RelayFollower:
+    """Reads new lines of the relay file into a hub; polled from a daemon thread"""
+
+    def __init__(self, relay, hub):
+        self.relay = relay
+        self.hub = hub
+        self._handle = None
+        self._inode = None
+        self._epoch = None
+        self._offset = 0
+
+    def poll(self):
+        try:
+            inode = os.stat(self.relay.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._handle is not None:
+            # Lines written before a swap are still read from the old file
+            self._read()
+            if inode != self._inode:
+                self._handle.close()
+                self._handle = None
+        if self._handle is None and inode is not None:
+            self._open()
+
+    def _open(self):
+        handle = open(self.relay.path, "rb")
+        header = handle.readline()
+        if not header.endswith(b"\n"):
+            # Created but not written yet
+            handle.close()
+            return
+        self._handle = handle
+        self._inode = os.fstat(handle.fileno()).st_ino
+        self._epoch = header.split()[1].decode()
+        self._offset = handle.tell()
+        self.hub._reset(self._epoch, self._offset)
+        self._read()
+
+    def _read(self):
+        data = self._handle.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        # Leave a line still being written for the next poll
+        self._handle.seek(self._offset + len(complete))
+        events = []
+        for line in complete.splitlines(keepends=True):
+            previous = self._offset
+            self._offset += len(line)
+            event_type, _, payload = line.decode().rstrip("\n").partition(" ")
+            events.append((previous, self._offset, _frame(self._epoch, self._offset, event_type, payload)))
+        if events:
+            self.hub._extend(events)
+
+    def run(self):
+        while True:
+            time.sleep(EVENT_RELAY_POLL_SECONDS)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error reading event relay: {e}")
+
+class EventHub:
+    """Fans server-sent events out to every open /api/events stream of this process.
+
+    Each event is serialized once into its SSE frame and appended to a
+    bounded ring buffer under a sequence number. Subscribers don't get a
+    queue or a thread of their own: they all block on one Condition and,
+    when woken, copy the frames after the last sequence they sent. An idle
+    subscriber therefore costs one blocked wait, and under gevent (whose
+    monkey-patching makes Condition cooperative) one greenlet. A subscriber
+    that fell further behind than the buffer, or reconnects after a restart
+    (new epoch), is told to resync instead.
+
+    With a relay, publish() only appends to the shared file and the buffer
+    is filled by a follower thread, started with the first stream.
+    """
+
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE, max_subscribers=MAX_SUBSCRIBERS, relay=None):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.max_subscribers = max_subscribers
+        self.relay = relay
+        # (sequence of the event before, sequence, frame)
+        self._events = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._follower = None
+        self._follower_lock = threading.Lock()
+        self.subscribers = 0
+
+    def publish(self, event_type, data):
+        payload = json.dumps(data, separators=(",", ":"), default=str)
+        if self.relay is not None:
+            self.relay.append(event_type, payload)
+            return
+        with self._condition:
+            self._seq += 1
+            self._events.append((self._seq - 1, self._seq, _frame(self.epoch, self._seq, event_type, payload)))
+            self._condition.notify_all()
+
+    def _extend(self, events):
+        with self._condition:
+            self._events.extend(events)
+            self._seq = events[-1][1]
+            self._condition.notify_all()
+
+    def _reset(self, epoch, seq):
+        """Start over on a new relay file; open streams resync"""
+        with self._condition:
+            self.epoch = epoch
+            self._events.clear()
+            self._seq = seq
+            self._condition.notify_all()
+
+    def _start_follower(self):
+        with self._follower_lock:
+            # A thread doesn't survive fork: a preloaded worker starts its own
+            if self._follower is None or not self._follower[1].is_alive():
+                follower = RelayFollower(self.relay, self)
+                # Caught up before the first stream computes its resume point
+                follower.poll()
+                thread = threading.Thread(target=follower.run, name="event-relay", daemon=True)
+                thread.start()
+                self._follower = (follower, thread)
+
+    def _resume_point(self, last_event_id):
+        """Sequence to resume after for a Last-Event-ID, or None when it can't be resumed"""
+        epoch, _, seq = (last_event_id or "").rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _frames_after(self, epoch, seq, timeout):
+        """Frames published after seq, waiting up to timeout for one; None if seq is no longer buffered"""
+        with self._condition:
+            if self.epoch == epoch and self._seq <= seq:
+                self._condition.wait(timeout)
+            if self.epoch != epoch or (self._events and self._events[0][0] > seq):
+                return None, self.epoch, self._seq
+            return [frame for _, event_seq, frame in self._events if event_seq > seq], epoch, self._seq
+
+    def stream(self, last_event_id=None):
+        """Generator of SSE text for one subscriber; raises TooManySubscribers before yielding"""
+        if self.relay is not None:
+            self._start_follower()
+        with self._condition:
+            if self.subscribers >= self.max_subscribers:
+                raise TooManySubscribers()
+            # Reserved under the same lock as the check, so concurrent connects can't overshoot it
+            self.subscribers += 1
+            seq = self._resume_point(last_event_id)
+            resync = last_event_id is not None and seq is None
+            if seq is None or seq > self._seq:
+                seq = self._seq
+            epoch = self.epoch
+        subscription = Subscription(self)
+
+        def generate(epoch, seq, resync):
+            try:
+                yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+                while True:
+                    if resync:
+                        # Everything since the client's last event is gone: it must reload
+                        yield f"id: {epoch}-{seq}\nevent: resync\ndata: {{}}\n\n"
+                    frames, epoch, latest = self._frames_after(epoch, seq, HEARTBEAT_SECONDS)
+                    resync = frames is None
+                    if frames:
+                        yield "".join(frames)
+                    elif frames is not None:
+                        yield ": keepalive\n\n"
+                    seq = latest
+            finally:
+                subscription.release()
+
+        subscription.frames = generate(epoch, seq, resync)
+        return subscription
+
+    def _release_subscriber(self):
+        with self._condition:
+            self.subscribers -= 1
+
+class Subscription:
+    """Iterator over one subscriber's SSE text, holding its slot in EventHub.subscribers.
+
+    The slot is released when the stream ends or is closed (the WSGI server
+    closes the response), including when it is closed before its first read,
+    which never runs the generator's own finally.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.frames = None
+        self._lock = threading.Lock()
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.frames)
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.hub._release_subscriber()
+
+    def close(self):
+        self.frames.close()
+        self.release()
+
+event_hub = EventHub(relay=EventRelay(EVENT_RELAY_FILE) if EVENT_RELAY_FILE and fcntl is not None else None)
+
+def publish_event(event_type, data):
+    """Publish to live subscribers; never lets a push failure fail the write that caused it"""
+    try:
+        event_hub.publish(event_type, data)
+    except Exception as e:
+        print(f"Error publishing {event_type} event: {e}")
+
+def has_subscribers():
+    # Subscribers of other workers can't be counted from here
+    return event_hub.relay is not None or event_hub.subscribers > 0
@@ -0,0 +1,178 @@
+import atexit
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from werkzeug.utils import secure_filename
+from src.metrics import timed, ICARD_RENDER_SECONDS, ICARDS_RENDERED
+
+SRC_FOLDER = os.path.dirname(os.path.abspath(__file__))
+ICARD_TEMPLATE = os.path.join(SRC_FOLDER, 'templates', 'icard.html')
+ICARD_STYLESHEET = os.path.join(SRC_FOLDER, 'static', 'css', 'icard.css')
+ICARD_CACHE_FOLDER = os.path.join(SRC_FOLDER, 'icard_cache')
+# File in the cache folder naming the template/stylesheet version its cards use
+DESIGN_MARKER = 'design.version'
+# Printed for employees without a photo
+ICARD_DEFAULT_PHOTO = os.path.join(SRC_FOLDER, 'static', 'images', 'default_user.png')
+
+# Relative URLs in the card (logo, fonts) resolve against the local tree
+# instead of being fetched back over HTTP from the running server
+ICARD_BASE_URL = Path(SRC_FOLDER).as_uri() + '/'
+
+# Employee fields printed on the card; a change to any of them changes the cache key
+ICARD_FIELDS = ("employee_id", "first_name", "last_name", "emergency_no", "blood_group", "department_name")
+
+# Processes rendering batches; 0 renders them in the calling thread
+ICARD_WORKERS = int(os.environ.get("ICARD_WORKERS", min(4, os.cpu_count() or 1)))
+MAX_BATCH_CARDS = 1000
+
+# Stylesheet and font configuration, parsed once per process
+_font_config = None
+_stylesheet = None
+_executor = None
+
+def _load_stylesheet():
+    """Parse icard.css and register its fonts once for this process"""
+    global _font_config, _stylesheet
+    if _stylesheet is None:
+        # WeasyPrint loads Pango/cairo on import: only processes that render pay for it
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+        _font_config = FontConfiguration()
+        _stylesheet = CSS(filename=ICARD_STYLESHEET, font_config=_font_config)
+
+def render_icard_pdf(html):
+    """Render card HTML (rendered with pdf=True) to PDF bytes using the preloaded stylesheet"""
+    _load_stylesheet()
+    from weasyprint import HTML
+    with timed(ICARD_RENDER_SECONDS, "single"):
+        pdf = HTML(string=html, base_url=ICARD_BASE_URL).write_pdf(
+            stylesheets=[_stylesheet], font_config=_font_config
+        )
+    ICARDS_RENDERED.inc("single")
+    return pdf
+
+def build_icard_context(employee, photo_path):
+    """Template variables for one card; the photo is linked from disk rather than inlined"""
+    context = {field: getattr(employee, field) for field in ICARD_FIELDS}
+    # A file: URI, since url_for paths don't resolve against the file: base URL
+    photo = photo_path if os.path.exists(photo_path) else ICARD_DEFAULT_PHOTO
+    context["photo_data"] = Path(photo).resolve().as_uri()
+    context["pdf"] = True
+    return context
+
+def icard_cache_key(context, photo_path):
+    """Content hash of everything that ends up on the card"""
+    try:
+        stat = os.stat(photo_path)
+        photo = [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        photo = None
+    # Editing the template or stylesheet invalidates every cached card
+    payload = json.dumps(
+        [[context[field] for field in ICARD_FIELDS], photo, _design_version()], default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+def _design_version():
+    return f"{os.stat(ICARD_TEMPLATE).st_mtime_ns}-{os.stat(ICARD_STYLESHEET).st_mtime_ns}"
+
+def _cache_prefix(employee_id):
+    return os.path.join(ICARD_CACHE_FOLDER, secure_filename(str(employee_id)) or "_")
+
+def icard_cache_path(employee_id, key):
+    return f"{_cache_prefix(employee_id)}-{key}.pdf"
+
+def _cached_icards(employee_id):
+    """Paths of the cached cards of one employee (not of IDs that merely start the same)"""
+    prefix = _cache_prefix(employee_id)
+    return [
+        path for path in glob.glob(f"{glob.escape(prefix)}-*.pdf")
+        if "-" not in path[len(prefix) + 1:]
+    ]
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _drop_old_design():
+    """Empty the cache once the template or stylesheet has changed since its cards were rendered.
+
+    Every card in it is superseded then, including those of employees whose
+    card isn't asked for again; a marker file holds the design they were
+    rendered with.
+    """
+    marker = os.path.join(ICARD_CACHE_FOLDER, DESIGN_MARKER)
+    design = _design_version()
+    try:
+        with open(marker) as marker_file:
+            if marker_file.read() == design:
+                return
+    except OSError:
+        pass
+    _remove(glob.glob(os.path.join(glob.escape(ICARD_CACHE_FOLDER), "*.pdf")))
+    with open(f"{marker}.{os.getpid()}.tmp", "w") as marker_file:
+        marker_file.write(design)
+    os.replace(f"{marker}.{os.getpid()}.tmp", marker)
+
+def store_icard(employee_id, path, pdf):
+    """Write a rendered card atomically so readers never see a partial file.
+
+    The cards it supersedes are deleted: the employee's cards under other
+    keys, and every card rendered with an older template or stylesheet.
+    """
+    os.makedirs(ICARD_CACHE_FOLDER, exist_ok=True)
+    _drop_old_design()
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as pdf_file:
+        pdf_file.write(pdf)
+    os.replace(temp_path, path)
+    _remove([cached for cached in _cached_icards(employee_id) if cached != path])
+
+def invalidate_icards(employee_id):
+    """Drop every cached card of an employee (after an update, delete or photo upload)"""
+    _remove(_cached_icards(employee_id))
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn keeps workers clear of the web process's threads and DB connections
+        _executor = ProcessPoolExecutor(
+            max_workers=ICARD_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_load_stylesheet
+        )
+    return _executor
+
+def render_icard_batch(htmls):
+    """Render many cards in the worker pool; returns PDF bytes in input order"""
+    if len(htmls) <= 1 or ICARD_WORKERS < 1:
+        return [render_icard_pdf(html) for html in htmls]
+    # Workers record into their own process; the batch is timed here as a whole
+    with timed(ICARD_RENDER_SECONDS, "batch"):
+        pdfs = list(_get_executor().map(render_icard_pdf, htmls, chunksize=8))
+    ICARDS_RENDERED.inc("batch", amount=len(pdfs))
+    return pdfs
+
+def merge_pdfs(pdfs):
+    """Concatenate single-card PDFs into one multi-page document"""
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for pdf in pdfs:
+        writer.append(BytesIO(pdf))
+    output = BytesIO()
+    writer.write(output)
+    output.seek(0)
+    return output
+
+@atexit.register
+def _shutdown_executor():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
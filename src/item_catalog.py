@@ -0,0 +1,132 @@
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from src.models.inventory import db, Employee, EmployeeItem, Stock, ITEM_FIELD_SUFFIX
+
+# CSV header labels for the original kit items; others are derived from the name
+ITEM_LABELS = {
+    "bag": "Bag",
+    "pen": "Pen",
+    "diary": "Diary",
+    "bottle": "Bottle",
+    "tshirt_s": "T-shirt S",
+    "tshirt_m": "T-shirt M",
+    "tshirt_l": "T-shirt L",
+    "tshirt_xl": "T-shirt XL",
+    "tshirt_xxl": "T-shirt XXL",
+    "tshirt_xxxl": "T-shirt XXXL"
+}
+
+def item_field(item_name):
+    """Employee JSON key holding the quantity of an item ("bag" -> "bag_quantity")"""
+    return item_name + ITEM_FIELD_SUFFIX
+
+def item_label(item_name):
+    return ITEM_LABELS.get(item_name, item_name.replace("_", " ").title())
+
+def get_item_catalog():
+    """{item_name: stock_id} for every stock item, in catalog order"""
+    return dict(db.session.execute(db.select(Stock.item_name, Stock.id).order_by(Stock.id)).all())
+
+def get_item_fields():
+    """{"<item>_quantity": item_name} for every stock item, in catalog order"""
+    return {item_field(item_name): item_name for item_name in get_item_catalog()}
+
+def item_quantity_column(stock_id, label):
+    """Per-row quantity of one item as a column of an Employee select.
+
+    A correlated primary-key lookup rather than a join, so selects keep
+    their index order (keyset pages, streamed exports) and stay one row
+    per employee.
+    """
+    employee = Employee.__table__
+    allocation = EmployeeItem.__table__
+    return db.func.coalesce(
+        db.select(allocation.c.quantity)
+        .where(allocation.c.employee_id == employee.c.employee_id, allocation.c.stock_id == stock_id)
+        .scalar_subquery(),
+        0
+    ).label(label)
+
+def employee_columns(fields, catalog=None):
+    """Select columns for Employee fields, item quantity fields included"""
+    employee = Employee.__table__
+    catalog = get_item_catalog() if catalog is None else catalog
+    columns = []
+    for field in fields:
+        if field in employee.c:
+            columns.append(employee.c[field])
+        else:
+            columns.append(item_quantity_column(catalog[field[:-len(ITEM_FIELD_SUFFIX)]], field))
+    return columns
+
+def get_employee_items(employee_id):
+    """{item_name: quantity} of everything held by one employee"""
+    return dict(db.session.execute(
+        db.select(Stock.item_name, EmployeeItem.quantity)
+        .join(Stock, Stock.id == EmployeeItem.stock_id)
+        .where(EmployeeItem.employee_id == employee_id)
+    ).all())
+
+def set_employee_items(employee_id, quantities, catalog=None):
+    """Write new quantities for some items of one employee (caller commits).
+
+    quantities maps item names to absolute quantities; zero removes the row.
+    """
+    catalog = get_item_catalog() if catalog is None else catalog
+    allocation = EmployeeItem.__table__
+    upserts = [
+        {"employee_id": employee_id, "stock_id": catalog[item_name], "quantity": quantity}
+        for item_name, quantity in quantities.items() if quantity
+    ]
+    removed = [catalog[item_name] for item_name, quantity in quantities.items() if not quantity]
+
+    if upserts:
+        stmt = insert(allocation)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[allocation.c.employee_id, allocation.c.stock_id],
+            set_={"quantity": stmt.excluded.quantity}
+        )
+        db.session.execute(stmt, upserts)
+    if removed:
+        db.session.execute(
+            allocation.delete().where(allocation.c.employee_id == employee_id, allocation.c.stock_id.in_(removed))
+        )
+
+def migrate_legacy_item_columns():
+    """Move quantities out of the old per-item Employee columns into employee_item.
+
+    Databases created before the item catalog have one <item>_quantity
+    column per kit item on employee. Their non-zero values are copied into
+    employee_item and the columns dropped, in one transaction. Returns the
+    number of allocations moved (0 when there was nothing to migrate).
+    """
+    columns = [row[1] for row in db.session.execute(text("PRAGMA table_info(employee)"))]
+    legacy = [column for column in columns if column.endswith(ITEM_FIELD_SUFFIX)]
+    if not legacy:
+        return 0
+
+    try:
+        catalog = get_item_catalog()
+        moved = 0
+        for column in legacy:
+            item_name = column[:-len(ITEM_FIELD_SUFFIX)]
+            if item_name not in catalog:
+                # Keep what employees hold even if the item left the stock table
+                stock = Stock(item_name=item_name, quantity=0)
+                db.session.add(stock)
+                db.session.flush()
+                catalog[item_name] = stock.id
+            moved += db.session.execute(text(
+                f"INSERT INTO employee_item (employee_id, stock_id, quantity) "
+                f"SELECT employee_id, :stock_id, {column} FROM employee WHERE {column} > 0"
+            ), {"stock_id": catalog[item_name]}).rowcount
+        for column in legacy:
+            # ALTER TABLE ... DROP COLUMN needs SQLite 3.35+
+            db.session.execute(text(f"ALTER TABLE employee DROP COLUMN {column}"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    print(f"Migrated {moved} item allocations from {len(legacy)} employee columns")
+    return moved
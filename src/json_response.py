@@ -0,0 +1,58 @@
+"""JSON encoding for API responses.
+
+init_json(app) makes jsonify encode with orjson when it is installed. The
+output matches Flask's default provider (sorted keys, datetimes as HTTP
+dates, compact unless debugging) except that non-ASCII text is sent as
+UTF-8 instead of \\u escapes. Without orjson the default provider is kept.
+
+List endpoints can also answer in a columnar format, naming the fields once
+instead of repeating them in every row:
+
+    {"columns": ["employee_id", "first_name"], "rows": [["EMP001", "Asha"], ...]}
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+OBJECTS_FORMAT = "objects"
+COLUMNS_FORMAT = "columns"
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask's default JSON provider with orjson doing the encoding"""
+
+    def _options(self, indent=False):
+        # Dates go through self.default so they are formatted as Flask formats them
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Encoder arguments only the standard library understands
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def init_json(app):
+    """Encode app's JSON responses with orjson when it is available"""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+
+def parse_response_format(requested):
+    """Validate a format= value; True for the columnar format"""
+    if requested in (None, "", OBJECTS_FORMAT):
+        return False
+    if requested == COLUMNS_FORMAT:
+        return True
+    raise ValueError(f"format must be {OBJECTS_FORMAT} or {COLUMNS_FORMAT}")
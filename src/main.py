@@ -3,41 +3,172 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, render_template
+import mimetypes
+import click
+from flask import Flask, current_app, render_template, request, send_from_directory
 from flask_cors import CORS
-from src.models.inventory import db
 from src.database_init import init_database
+from src.db_config import init_sqlite
+from src.json_response import init_json
+from src.metrics import init_metrics
 from src.routes.stock import stock_bp
 from src.routes.employee import employee_bp
+from src.routes.events import events_bp
+from src.routes.sync import sync_bp, publish_synced_changes
+from src.site_sync import pull_from_peer, require_site_id, SyncError, SYNC_PEERS
+from src.static_assets import load_asset_manifest, BUILD_FOLDER, ENCODING_SUFFIXES
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+DATABASE_PATH = os.environ.get('INVENTORY_DATABASE', os.path.join(os.path.dirname(__file__), 'database', 'app.db'))
 
-# Enable CORS for all routes
-CORS(app)
+# url_for('static', ...) hands out the fingerprinted name from the asset build
+# (src/static_assets.py) or, for files not built, adds the modification time
+# as ?v=; either way a changed file gets a new URL, so these are cached for a year
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', str(365 * 24 * 3600)))
+# Static paths written without url_for are revalidated after an hour
+STATIC_UNVERSIONED_MAX_AGE = 3600
 
-# Register blueprints
-app.register_blueprint(stock_bp, url_prefix='/api')
-app.register_blueprint(employee_bp, url_prefix='/api')
+def static_version(filename):
+    """The ?v= value url_for gives a static file, or None if it doesn't exist"""
+    try:
+        return str(int(os.stat(os.path.join(STATIC_DIR, filename)).st_mtime))
+    except (OSError, ValueError):
+        return None
 
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+def serve_built_static(assets, filename, encodings):
+    """A fingerprinted file from the asset build, precompressed if the browser accepts it"""
+    encoding = next((e for e in ('br', 'gzip') if e in encodings and request.accept_encodings[e]), None)
+    response = send_from_directory(
+        assets.build_folder, filename + ENCODING_SUFFIXES[encoding] if encoding else filename,
+        max_age=STATIC_MAX_AGE, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    )
+    if encoding:
+        response.content_encoding = encoding
+    if encodings:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
 
-# Initialize database
-with app.app_context():
-    init_database()
+def serve_static(filename):
+    assets = current_app.extensions.get('static_assets')
+    encodings = assets.encodings(filename) if assets else None
+    if encodings is not None:
+        return serve_built_static(assets, filename, encodings)
 
-@app.route('/')
-def serve():
-    
-    return render_template('index.html')
+    version = request.args.get('v')
+    # Only the URL url_for currently builds may be cached for good; any other v
+    # could pin the current file under a URL the app never handed out
+    versioned = version is not None and version == static_version(filename)
+    response = send_from_directory(
+        STATIC_DIR, filename, max_age=STATIC_MAX_AGE if versioned else STATIC_UNVERSIONED_MAX_AGE
+    )
+    if versioned:
+        response.cache_control.immutable = True
+    return response
 
-@app.route('/icard')
-def icard():
-    return render_template('icard.html')
+def add_static_version(endpoint, values):
+    if endpoint != 'static' or 'v' in values or 'filename' not in values:
+        return
+    assets = current_app.extensions.get('static_assets')
+    built = assets.built_name(values['filename']) if assets else None
+    if built is not None:
+        values['filename'] = built
+        return
+    version = static_version(values['filename'])
+    if version is not None:
+        values['v'] = version
+
+def create_app(config=None, initialize=None):
+    """Build the application.
+
+    config is a mapping of settings applied over the defaults, e.g.
+    {'SQLALCHEMY_DATABASE_URI': 'sqlite:////tmp/test.db'} for a throwaway
+    instance. initialize=False skips creating and migrating the database;
+    the production server runs `flask init-db` once before starting its
+    workers instead (see gunicorn.conf.py). It defaults to the
+    INVENTORY_INIT_DB environment variable, and to True when that is unset.
+
+    Importing this module loads neither the database nor the PDF stack:
+    WeasyPrint is imported by the first i-card render.
+    """
+    if initialize is None:
+        initialize = os.environ.get('INVENTORY_INIT_DB', '1') == '1'
+    # A site that syncs must name itself; fail here rather than stamp movements with the host name
+    require_site_id()
+
+    app = Flask(__name__, static_folder=None)
+    app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+    app.add_url_rule('/static/<path:filename>', endpoint='static', view_func=serve_static)
+    app.url_defaults(add_static_version)
+
+    # Enable CORS for all routes
+    CORS(app)
+    # orjson encoding for jsonify, when installed
+    init_json(app)
+
+    # Register blueprints
+    app.register_blueprint(stock_bp, url_prefix='/api')
+    app.register_blueprint(employee_bp, url_prefix='/api')
+    app.register_blueprint(events_bp, url_prefix='/api')
+    app.register_blueprint(sync_bp, url_prefix='/api')
+
+    # Database configuration
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{DATABASE_PATH}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Built by `python src/static_assets.py`; without a build src/static is served as is
+    app.config['ASSET_BUILD_DIR'] = BUILD_FOLDER
+    if config:
+        app.config.from_mapping(config)
+    app.extensions['static_assets'] = load_asset_manifest(app.config['ASSET_BUILD_DIR'])
+    # WAL, pragmas and a sized connection pool
+    init_sqlite(app)
+    # Per-endpoint latency, SQL counts and sizes at /metrics
+    init_metrics(app)
+
+    @app.route('/')
+    def serve():
+        return render_template('index.html')
+
+    @app.route('/icard')
+    def icard():
+        return render_template('icard.html')
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing tables, migrate older databases and seed default stock."""
+        init_database()
+
+    @app.cli.command('sync')
+    @click.argument('peers', nargs=-1)
+    def sync_command(peers):
+        """Pull and apply what changed at other sites (SYNC_PEERS when none are given)."""
+        try:
+            require_site_id(peers)
+        except SyncError as e:
+            print(e)
+            sys.exit(1)
+        failed = False
+        for peer in peers or SYNC_PEERS:
+            try:
+                summary = pull_from_peer(peer, on_page=publish_synced_changes)
+                print(f"{peer}: {summary['movements']} movements, {summary['employees']} employees in {summary['pages']} pages")
+                if summary['below_zero']:
+                    levels = ', '.join(f'{item_name} {quantity}' for item_name, quantity in summary['below_zero'].items())
+                    print(f"{peer}: warning, synced stock is below zero: {levels}")
+            except SyncError as e:
+                print(f"{peer}: {e}")
+                failed = True
+        if failed:
+            sys.exit(1)
+
+    # Initialize database
+    if initialize:
+        with app.app_context():
+            init_database()
+
+    return app
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server; production runs gunicorn -c gunicorn.conf.py
+    create_app().run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
@@ -0,0 +1,259 @@
+"""Request metrics and opt-in profiling.
+
+init_metrics(app) times every request, counts the SQL statements it runs
+(through SQLAlchemy engine events) and records request and response sizes,
+all per endpoint. The numbers are served in Prometheus text format at
+/metrics. Each response also carries a Server-Timing header with the same
+figures, so a request issuing one query per item shows up straight away in
+the browser's network panel.
+
+With PROFILING_ENABLED=1, a request sent with "X-Profile: 1" is run under
+cProfile ("X-Profile: pyinstrument" uses pyinstrument if it is installed).
+Its response is replaced by a plain-text report: the profile followed by
+the request's SQL statements grouped by how often they ran.
+
+Metrics are kept per process; with several workers each one reports its
+own share.
+"""
+import collections
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from src.models.inventory import db
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_HEADER = "X-Profile"
+# Functions listed in a cProfile report
+PROFILE_LIMIT = 40
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}_total{_format_labels(self.labels, label_values)} {value}"
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered the way Prometheus expects"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels + ("le",), label_values + (bound,))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels + ("le",), label_values + ("+Inf",))
+            yield f"{self.name}_bucket{labels} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {count}"
+
+REQUEST_SECONDS = Histogram(
+    "inventory_request_duration_seconds", "Time spent handling a request",
+    LATENCY_BUCKETS, ("endpoint", "method", "status")
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    "inventory_request_sql_statements", "SQL statements executed per request",
+    STATEMENT_BUCKETS, ("endpoint",)
+)
+REQUEST_SQL_SECONDS = Histogram(
+    "inventory_request_sql_duration_seconds", "Time spent in SQL per request",
+    LATENCY_BUCKETS, ("endpoint",)
+)
+REQUEST_BYTES = Histogram(
+    "inventory_request_size_bytes", "Request body size",
+    SIZE_BUCKETS, ("endpoint",)
+)
+RESPONSE_BYTES = Histogram(
+    "inventory_response_size_bytes", "Response body size (streamed responses are not counted)",
+    SIZE_BUCKETS, ("endpoint",)
+)
+ICARD_RENDER_SECONDS = Histogram(
+    "inventory_icard_render_duration_seconds", "WeasyPrint rendering time per call",
+    LATENCY_BUCKETS, ("mode",)
+)
+ICARDS_RENDERED = Counter(
+    "inventory_icards_rendered", "I-card PDFs rendered", ("mode",)
+)
+SQL_STATEMENTS = Counter(
+    "inventory_sql_statements", "SQL statements executed outside any request (startup, background threads)"
+)
+
+REGISTRY = [
+    REQUEST_SECONDS, REQUEST_SQL_STATEMENTS, REQUEST_SQL_SECONDS, REQUEST_BYTES, RESPONSE_BYTES,
+    ICARD_RENDER_SECONDS, ICARDS_RENDERED, SQL_STATEMENTS
+]
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+class timed:
+    """Context manager observing elapsed seconds into a histogram"""
+
+    def __init__(self, histogram, *label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+        return False
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    pending = conn.info.get("query_started")
+    started = pending.pop() if pending else time.perf_counter()
+    if has_request_context() and "sql_statements" in g:
+        g.sql_statements += 1
+        g.sql_seconds += time.perf_counter() - started
+        if g.get("sql_log") is not None:
+            g.sql_log[statement] += 1
+    else:
+        SQL_STATEMENTS.inc()
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+    g.sql_log = None
+    g.profiler = None
+
+    mode = request.headers.get(PROFILE_HEADER)
+    if PROFILING_ENABLED and mode:
+        g.sql_log = collections.Counter()
+        if mode == "pyinstrument" and pyinstrument is not None:
+            g.profiler = pyinstrument.Profiler()
+            g.profiler.start()
+        else:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+def _profile_report(profiler, response):
+    """Plain-text profile plus the request's SQL statements, most repeated first"""
+    if pyinstrument is not None and isinstance(profiler, pyinstrument.Profiler):
+        profiler.stop()
+        report = profiler.output_text(unicode=False, color=False)
+    else:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LIMIT)
+        report = out.getvalue()
+
+    lines = [
+        f"{request.method} {request.full_path} -> {response.status_code}",
+        f"{g.sql_statements} SQL statements, {g.sql_seconds * 1000:.1f} ms in SQL",
+        ""
+    ]
+    for statement, count in g.sql_log.most_common():
+        lines.append(f"{count:>5}x  {' '.join(statement.split())}")
+    return Response("\n".join(lines) + "\n\n" + report, mimetype="text/plain")
+
+def _finish_request(response):
+    if "request_started" not in g:
+        return response
+    # Recorded as the view answered, even if a profile report replaces the body
+    status = response.status_code
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        response = _profile_report(profiler, response)
+
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = _endpoint()
+    REQUEST_SECONDS.observe(elapsed, endpoint, request.method, status)
+    REQUEST_SQL_STATEMENTS.observe(g.sql_statements, endpoint)
+    REQUEST_SQL_SECONDS.observe(g.sql_seconds, endpoint)
+    REQUEST_BYTES.observe(request.content_length or 0, endpoint)
+    if not response.is_streamed:
+        RESPONSE_BYTES.observe(response.calculate_content_length() or 0, endpoint)
+
+    response.headers["Server-Timing"] = (
+        f'app;dur={elapsed * 1000:.1f}, '
+        f'sql;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_statements} queries"'
+    )
+    return response
+
+def metrics_view():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+def init_metrics(app):
+    """Instrument app and db's engine, and serve /metrics"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db.engine, "after_cursor_execute", _after_cursor_execute)
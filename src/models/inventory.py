@@ -3,21 +3,32 @@ from datetime import datetime
 
 db = SQLAlchemy()
 
+# Suffix of the per-item keys in employee JSON ("bag" -> "bag_quantity")
+ITEM_FIELD_SUFFIX = "_quantity"
+
 class Stock(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     item_name = db.Column(db.String(100), unique=True, nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=0)
     danger_level = db.Column(db.Integer, nullable=False, default=30)
+    # Bumped by every write to the row; the ETag checked by If-Match (src/row_version.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
     def to_dict(self):
         return {
             "id": self.id,
             "item_name": self.item_name,
             "quantity": self.quantity,
-            "danger_level": self.danger_level
+            "danger_level": self.danger_level,
+            "version": self.version
         }
 
 class Employee(db.Model):
+    __table_args__ = (
+        # Keyset pagination order for the employee listing
+        db.Index("ix_employee_created_at_employee_id", "created_at", "employee_id"),
+    )
+
     employee_id = db.Column(db.String(50), primary_key=True, unique=True, nullable=False)
     first_name = db.Column(db.String(100), nullable=False)
     last_name = db.Column(db.String(100), nullable=False)
@@ -25,36 +36,94 @@ class Employee(db.Model):
     blood_group = db.Column(db.String(10), nullable=False)
     department_name = db.Column(db.String(100), nullable=False)
     
-    bag_quantity = db.Column(db.Integer, nullable=False, default=0)
-    pen_quantity = db.Column(db.Integer, nullable=False, default=0)
-    diary_quantity = db.Column(db.Integer, nullable=False, default=0)
-    bottle_quantity = db.Column(db.Integer, nullable=False, default=0)
-    tshirt_s_quantity = db.Column(db.Integer, nullable=False, default=0)
-    tshirt_m_quantity = db.Column(db.Integer, nullable=False, default=0)
-    tshirt_l_quantity = db.Column(db.Integer, nullable=False, default=0)
-    tshirt_xl_quantity = db.Column(db.Integer, nullable=False, default=0)
-    tshirt_xxl_quantity = db.Column(db.Integer, nullable=False, default=0)
-    tshirt_xxxl_quantity = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every update of the employee or their kit; the ETag checked by If-Match
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    # Kit handed to this employee, one row per catalog item
+    items = db.relationship("EmployeeItem", cascade="all, delete-orphan", lazy="select")
+
+class EmployeeItem(db.Model):
+    """Quantity of one catalog (Stock) item handed to one employee"""
+    __table_args__ = (
+        # Covers per-item totals (GROUP BY stock_id) without touching the table
+        db.Index("ix_employee_item_stock_id_quantity", "stock_id", "quantity"),
+    )
+
+    employee_id = db.Column(db.String(50), db.ForeignKey("employee.employee_id"), primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey("stock.id"), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+    stock = db.relationship("Stock")
+
+class StockMovement(db.Model):
+    """Append-only journal entry: one change to the quantity of a stock item"""
+    __table_args__ = (
+        # Point-in-time and period queries scan one item's movements by time;
+        # reason and delta ride along so those sums never have to visit the table
+        db.Index("ix_stock_movement_stock_id_created_at", "stock_id", "created_at", "reason", "delta"),
+        # Finds movements already received from another site (src/site_sync.py)
+        db.Index("ix_stock_movement_origin", "origin_site", "origin_id"),
+        # Per-employee journal sums shipped with synced employee states
+        db.Index("ix_stock_movement_employee_id", "employee_id", "origin_site", "stock_id", "delta"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey("stock.id"), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+    # opening, handout, return, restock or correction
+    reason = db.Column(db.String(20), nullable=False)
+    # Not a foreign key: the history outlives deleted employees
+    employee_id = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Site that recorded the movement and its id there (None when that is this
+    # row's id); None for movements from before multi-site sync
+    origin_site = db.Column(db.String(64))
+    origin_id = db.Column(db.Integer)
 
     def to_dict(self):
         return {
+            "id": self.id,
+            "delta": self.delta,
+            "reason": self.reason,
             "employee_id": self.employee_id,
-            "first_name": self.first_name,
-            "last_name": self.last_name,
-            "emergency_no": self.emergency_no,
-            "blood_group": self.blood_group,
-            "department_name": self.department_name,
-            "bag_quantity": self.bag_quantity,
-            "pen_quantity": self.pen_quantity,
-            "diary_quantity": self.diary_quantity,
-            "bottle_quantity": self.bottle_quantity,
-            "tshirt_s_quantity": self.tshirt_s_quantity,
-            "tshirt_m_quantity": self.tshirt_m_quantity,
-            "tshirt_l_quantity": self.tshirt_l_quantity,
-            "tshirt_xl_quantity": self.tshirt_xl_quantity,
-            "tshirt_xxl_quantity": self.tshirt_xxl_quantity,
-            "tshirt_xxxl_quantity": self.tshirt_xxxl_quantity,
             "created_at": self.created_at.isoformat()
         }
 
+class StockCheckpoint(db.Model):
+    """Quantity of an item after every movement up to (created_at, movement_id)"""
+    __table_args__ = (
+        db.Index("ix_stock_checkpoint_stock_id_created_at", "stock_id", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey("stock.id"), nullable=False)
+    movement_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+class StatsRollup(db.Model):
+    """Running totals behind /api/employees/stats, kept in step with Employee writes"""
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class EmployeeChange(db.Model):
+    """Latest change to one employee, numbered in commit order for multi-site sync"""
+    __table_args__ = (
+        db.Index("ix_employee_change_seq", "seq", unique=True),
+    )
+
+    employee_id = db.Column(db.String(50), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)
+    # When and at which site the change was made; the newest wins a conflict
+    changed_at = db.Column(db.DateTime, nullable=False)
+    site = db.Column(db.String(64), nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    # Deletes only: the employee's synced journal when deleted, as JSON (see site_sync.employee_journals)
+    journal = db.Column(db.Text)
+
+class SyncPeer(db.Model):
+    """How far this site has pulled the changes of another one"""
+    peer_url = db.Column(db.String(255), primary_key=True)
+    cursor = db.Column(db.String(100), nullable=False)
+    synced_at = db.Column(db.DateTime)
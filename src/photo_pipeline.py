@@ -0,0 +1,95 @@
+import os
+from io import BytesIO
+from PIL import Image, ImageOps
+from werkzeug.utils import secure_filename
+
+EMP_IMG_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emp_img')
+THUMBNAIL_FOLDER = os.path.join(EMP_IMG_FOLDER, 'thumbs')
+
+# The card's photo box is 76x80 CSS px; 4x that keeps print quality at ~380 dpi
+ICARD_PHOTO_SIZE = (304, 320)
+THUMBNAIL_SIZE = (96, 96)
+JPEG_QUALITY = 85
+
+ALLOWED_FORMATS = ("JPEG", "PNG", "WEBP")
+MAX_PHOTO_BYTES = 20 * 1024 * 1024
+# Refuse decompression bombs well before they exhaust memory
+MAX_PHOTO_PIXELS = 50_000_000
+
+class InvalidPhotoError(ValueError):
+    pass
+
+def photo_path(employee_id, size="icard"):
+    """Path of an employee's stored photo; size is "icard" or "thumb" """
+    filename = f"{secure_filename(str(employee_id)) or '_'}.jpg"
+    folder = THUMBNAIL_FOLDER if size == "thumb" else EMP_IMG_FOLDER
+    return os.path.join(folder, filename)
+
+def _open_image(data):
+    if len(data) > MAX_PHOTO_BYTES:
+        raise InvalidPhotoError(f"Photo larger than {MAX_PHOTO_BYTES // (1024 * 1024)} MB")
+    try:
+        image = Image.open(BytesIO(data))
+        if image.format not in ALLOWED_FORMATS:
+            raise InvalidPhotoError("Invalid file type")
+        if image.width * image.height > MAX_PHOTO_PIXELS:
+            raise InvalidPhotoError("Photo resolution too large")
+        # Let the JPEG decoder scale down by up to 8x while decoding
+        image.draft("RGB", (ICARD_PHOTO_SIZE[0] * 2, ICARD_PHOTO_SIZE[1] * 2))
+        image.load()
+    except InvalidPhotoError:
+        raise
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise InvalidPhotoError(f"Unreadable image: {e}")
+    return image
+
+def _to_rgb(image):
+    """Flatten transparency onto white; JPEG has no alpha channel"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+def _save_jpeg(image, path):
+    """Encode to a temp file next to path and swap it in atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        image.save(temp_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def ingest_photo(data, employee_id):
+    """Decode an uploaded photo once and store the i-card and thumbnail JPEGs.
+
+    The image is rotated per its EXIF orientation, flattened to RGB and
+    center-cropped to the card's photo box, so stored photos (and the PDFs
+    they end up in) stay the same size whatever resolution was uploaded.
+    Raises InvalidPhotoError for anything that isn't a readable JPEG, PNG
+    or WebP image.
+    """
+    image = _to_rgb(ImageOps.exif_transpose(_open_image(data)))
+
+    card_photo = ImageOps.fit(image, ICARD_PHOTO_SIZE, Image.LANCZOS)
+    thumbnail = ImageOps.fit(card_photo, THUMBNAIL_SIZE, Image.LANCZOS)
+
+    # Card photo first: the thumbnail's presence marks it as normalized
+    _save_jpeg(card_photo, photo_path(employee_id))
+    _save_jpeg(thumbnail, photo_path(employee_id, "thumb"))
+
+def ensure_normalized_photo(employee_id):
+    """Run photos stored before the pipeline existed through it once.
+
+    Returns False when the employee has no photo on file.
+    """
+    path = photo_path(employee_id)
+    if not os.path.exists(path):
+        return False
+    if not os.path.exists(photo_path(employee_id, "thumb")):
+        with open(path, "rb") as photo_file:
+            ingest_photo(photo_file.read(), employee_id)
+    return True
@@ -1,22 +1,78 @@
-from flask import Blueprint, request, jsonify, send_file, render_template, make_response, Response
-from src.models.inventory import db, Employee, Stock
-from src.routes.stock import adjust_stock_for_employee
+from flask import Blueprint, request, jsonify, send_file, render_template
+from sqlalchemy.exc import OperationalError
+from src.models.inventory import db, Employee, EmployeeItem
+from src.db_config import retry_on_busy
+from src.routes.stock import adjust_stock_for_employee, check_and_send_low_stock_alert, InsufficientStockError
+from src.stats_service import apply_stats_delta, build_employee_stats
+from src.search_index import (
+    search_employees, encode_search_cursor, decode_search_cursor,
+    SEARCH_RESULT_FIELDS, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+)
+from src.bulk_import import iter_upload_rows, detect_format, spool_upload, UploadDecodeError, IMPORT_CHUNK_SIZE
+from src.employee_listing import (
+    fetch_employee, fetch_employee_page, decode_keyset_cursor, parse_employee_fields, parse_page_size, employee_row_to_dict, employee_fields,
+    employee_rows_to_lists
+)
+from src.json_response import parse_response_format
+from src.item_catalog import (
+    get_item_catalog, get_item_fields, get_employee_items, set_employee_items, employee_columns,
+    item_field, item_label
+)
+from src.csv_export import csv_export_response, parse_export_columns
+from src.icard_renderer import (
+    build_icard_context, icard_cache_key, icard_cache_path, store_icard, invalidate_icards,
+    render_icard_pdf, render_icard_batch, merge_pdfs, MAX_BATCH_CARDS
+)
+from src.photo_pipeline import ingest_photo, ensure_normalized_photo, photo_path, InvalidPhotoError
+from src.event_hub import publish_event, has_subscribers
+from src.site_sync import record_employee_changes
+from src.row_version import VersionConflictError, version_etag, if_match_versions, precondition_failed
 import re
 import os
-from io import BytesIO, StringIO
-from weasyprint import HTML
-import base64
-import csv
+from datetime import datetime
 
 employee_bp = Blueprint("employee", __name__)
-EMP_IMG_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'emp_img')
+
+# (field, CSV header) pairs written by /export/employees ahead of the item columns
+EMPLOYEE_EXPORT_COLUMNS = [
+    ("employee_id", "Employee ID"),
+    ("first_name", "First Name"),
+    ("last_name", "Last Name"),
+    ("emergency_no", "Emergency No"),
+    ("blood_group", "Blood Group"),
+    ("department_name", "Department Name")
+]
+
+# Paging of the bare list GET /employees?search= returns: the cursor= of the
+# next page, and a flag when the ranking stopped at its candidate limit
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+SEARCH_TRUNCATED_HEADER = "X-Search-Truncated"
+
+# Employee fields a PUT may change (employee_id and created_at are fixed)
+EMPLOYEE_UPDATE_FIELDS = ("first_name", "last_name", "emergency_no", "blood_group", "department_name")
+
+def employee_export_columns():
+    """Export columns: the employee fields, then one column per catalog item"""
+    return EMPLOYEE_EXPORT_COLUMNS + [
+        (item_field(item_name), item_label(item_name)) for item_name in get_item_catalog()
+    ]
+
+def publish_employee_change(event_type, data):
+    """Push an employee change and the new dashboard totals to live clients"""
+    if not has_subscribers():
+        return
+    try:
+        publish_event(event_type, data)
+        publish_event("stats", build_employee_stats())
+    except Exception as e:
+        print(f"Error publishing employee change: {e}")
 
 def validate_email(email):
     """Validate email format"""
     pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
     return re.match(pattern, email) is not None
 
-def validate_employee_data(data, is_update=False):
+def validate_employee_data(data, is_update=False, item_fields=None):
     """Validate employee data"""
     errors = []
     
@@ -33,9 +89,8 @@ def validate_employee_data(data, is_update=False):
         errors.append("Invalid blood group selected")
     
     # Validate quantities if provided
-    item_fields = ["bag_quantity", "pen_quantity", "diary_quantity", "bottle_quantity",
-                   "tshirt_s_quantity", "tshirt_m_quantity", "tshirt_l_quantity",
-                   "tshirt_xl_quantity", "tshirt_xxl_quantity", "tshirt_xxxl_quantity"]
+    if item_fields is None:
+        item_fields = get_item_fields()
     
     for field in item_fields:
         if data.get(field) is not None:
@@ -50,25 +105,78 @@ def validate_employee_data(data, is_update=False):
 
 @employee_bp.route("/employees", methods=["GET"])
 def get_all_employees():
-    """Get all employees with optional search"""
+    """Get employees with optional search; paged when limit or cursor is given"""
     try:
         search_query = request.args.get("search", "").strip()
         
         if search_query:
-            employees = Employee.query.filter(
-                db.or_(
-                    Employee.employee_id.ilike(f"%{search_query}%"),
-                    Employee.first_name.ilike(f"%{search_query}%"),
-                    Employee.last_name.ilike(f"%{search_query}%"),
-                    Employee.emergency_no.ilike(f"%{search_query}%"),
-                    Employee.blood_group.ilike(f"%{search_query}%"),
-                    Employee.department_name.ilike(f"%{search_query}%")
-                )
-            ).all()
-        else:
-            employees = Employee.query.all()
+            # Ranked lookup through the search index, full rows in a bare list for
+            # compatibility; the rest of the matches are paged through headers
+            try:
+                limit = parse_page_size(request.args.get("limit"), MAX_SEARCH_LIMIT, MAX_SEARCH_LIMIT)
+                offset = decode_search_cursor(request.args.get("cursor"))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            rows, has_more, truncated = search_employees(
+                search_query, fields=employee_fields(), limit=limit, offset=offset
+            )
+            response = jsonify([employee_row_to_dict(row) for row in rows])
+            if has_more:
+                response.headers[NEXT_CURSOR_HEADER] = encode_search_cursor(offset + len(rows))
+            if truncated:
+                response.headers[SEARCH_TRUNCATED_HEADER] = "1"
+            return response, 200
         
-        return jsonify([emp.to_dict() for emp in employees]), 200
+        try:
+            fields = parse_employee_fields(request.args.get("fields"))
+            cursor = request.args.get("cursor")
+            paged = cursor is not None or "limit" in request.args
+            limit = parse_page_size(request.args.get("limit"))
+            after = decode_keyset_cursor(cursor) if cursor else None
+            columnar = parse_response_format(request.args.get("format"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if not paged:
+            # Unpaged callers still get a bare list of every employee
+            employees, _ = fetch_employee_page(fields, limit=None, as_lists=columnar)
+            if columnar:
+                return jsonify({"columns": fields, "rows": employees}), 200
+            return jsonify(employees), 200
+        
+        employees, next_cursor = fetch_employee_page(fields, limit=limit, after=after, as_lists=columnar)
+        if columnar:
+            return jsonify({"columns": fields, "rows": employees, "next_cursor": next_cursor}), 200
+        return jsonify({"employees": employees, "next_cursor": next_cursor}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@employee_bp.route("/employees/search", methods=["GET"])
+def search_employee_index():
+    """Ranked, paginated employee search over the full-text index"""
+    try:
+        query = request.args.get("q", "").strip()
+        if not query:
+            return jsonify({"error": "Search query is required"}), 400
+        
+        try:
+            fields = parse_employee_fields(request.args.get("fields"), default=SEARCH_RESULT_FIELDS)
+            limit = parse_page_size(request.args.get("limit"), DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT)
+            offset = decode_search_cursor(request.args.get("cursor"))
+            columnar = parse_response_format(request.args.get("format"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        rows, has_more, truncated = search_employees(query, fields=fields, limit=limit, offset=offset)
+        
+        if columnar:
+            page = {"columns": fields, "rows": employee_rows_to_lists(fields, rows)}
+        else:
+            page = {"employees": [employee_row_to_dict(row) for row in rows]}
+        page["next_cursor"] = encode_search_cursor(offset + len(rows)) if has_more else None
+        # No more pages because the ranking stopped at its candidate limit, not because matches ran out
+        page["truncated"] = truncated
+        return jsonify(page), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -76,15 +184,19 @@ def get_all_employees():
 def get_employee(employee_id):
     """Get specific employee by ID"""
     try:
-        employee = Employee.query.get(employee_id)
-        if not employee:
+        employee_data, version = fetch_employee(employee_id)
+        if employee_data is None:
             return jsonify({"error": "Employee not found"}), 404
         
-        return jsonify(employee.to_dict()), 200
+        response = jsonify(employee_data)
+        # Sent back as If-Match by a PUT that must not overwrite someone else's change
+        response.set_etag(version_etag(version))
+        return response, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @employee_bp.route("/employees", methods=["POST"])
+@retry_on_busy
 def create_employee():
     """Create new employee and deduct stock"""
     try:
@@ -100,6 +212,12 @@ def create_employee():
         if existing_employee:
             return jsonify({"error": "Employee ID already exists"}), 400
         
+        catalog = get_item_catalog()
+        item_quantities_to_deduct = {
+            item_name: int(data.get(item_field(item_name)) or 0)
+            for item_name in catalog
+        }
+        
         employee = Employee(
             employee_id=data["employee_id"],
             first_name=data["first_name"],
@@ -107,45 +225,170 @@ def create_employee():
             emergency_no=data["emergency_no"],
             blood_group=data["blood_group"],
             department_name=data["department_name"],
-            bag_quantity=data.get("bag_quantity", 0),
-            pen_quantity=data.get("pen_quantity", 0),
-            diary_quantity=data.get("diary_quantity", 0),
-            bottle_quantity=data.get("bottle_quantity", 0),
-            tshirt_s_quantity=data.get("tshirt_s_quantity", 0),
-            tshirt_m_quantity=data.get("tshirt_m_quantity", 0),
-            tshirt_l_quantity=data.get("tshirt_l_quantity", 0),
-            tshirt_xl_quantity=data.get("tshirt_xl_quantity", 0),
-            tshirt_xxl_quantity=data.get("tshirt_xxl_quantity", 0),
-            tshirt_xxxl_quantity=data.get("tshirt_xxxl_quantity", 0)
+            items=[
+                EmployeeItem(stock_id=catalog[item_name], quantity=quantity)
+                for item_name, quantity in item_quantities_to_deduct.items() if quantity
+            ]
         )
         
         db.session.add(employee)
+        
+        # Deduct stock for received items in the same transaction
+        adjust_stock_for_employee(item_quantities_to_deduct, data["employee_id"])
+        apply_stats_delta(1, item_quantities_to_deduct)
+        record_employee_changes([data["employee_id"]])
         db.session.commit()
         
-        # Deduct stock for received items
-        item_quantities_to_deduct = {
-            "bag": employee.bag_quantity,
-            "pen": employee.pen_quantity,
-            "diary": employee.diary_quantity,
-            "bottle": employee.bottle_quantity,
-            "tshirt_s": employee.tshirt_s_quantity,
-            "tshirt_m": employee.tshirt_m_quantity,
-            "tshirt_l": employee.tshirt_l_quantity,
-            "tshirt_xl": employee.tshirt_xl_quantity,
-            "tshirt_xxl": employee.tshirt_xxl_quantity,
-            "tshirt_xxxl": employee.tshirt_xxxl_quantity
-        }
+        check_and_send_low_stock_alert([name for name, quantity in item_quantities_to_deduct.items() if quantity])
         
-        adjust_stock_for_employee(item_quantities_to_deduct)
+        employee_data, _ = fetch_employee(data["employee_id"], catalog)
+        publish_employee_change("employee", {"action": "created", "employee": employee_data})
         
-        return jsonify(employee.to_dict()), 201
+        return jsonify(employee_data), 201
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e), "shortages": e.shortages}), 409
+    except OperationalError:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+def import_employee_rows(rows):
+    """Validate and insert uploaded rows; returns (imported, errors, item_totals).
+
+    Rows are checked and inserted IMPORT_CHUNK_SIZE at a time with one
+    existence query and one executemany INSERT per table per chunk. Stock,
+    stats and the commit are left to the caller so the whole upload applies
+    at once.
+    """
+    imported = 0
+    errors = []
+    catalog = get_item_catalog()
+    item_fields = get_item_fields()
+    item_totals = dict.fromkeys(catalog, 0)
+    seen_ids = set()
+
+    def flush(chunk):
+        nonlocal imported
+        ids = [row["employee_id"] for _, row in chunk]
+        existing = set(db.session.execute(
+            db.select(Employee.employee_id).where(Employee.employee_id.in_(ids))
+        ).scalars())
+
+        records = []
+        allocations = []
+        for line_number, row in chunk:
+            if row["employee_id"] in existing:
+                errors.append({"row": line_number, "employee_id": row["employee_id"], "errors": ["Employee ID already exists"]})
+                continue
+            record = {field: row[field] for field in (
+                "employee_id", "first_name", "last_name", "emergency_no", "blood_group", "department_name"
+            )}
+            for field_name, item_name in item_fields.items():
+                quantity = int(row.get(field_name) or 0)
+                if quantity:
+                    allocations.append({"employee_id": record["employee_id"], "stock_id": catalog[item_name], "quantity": quantity})
+                    item_totals[item_name] += quantity
+            records.append(record)
+
+        if records:
+            db.session.execute(db.insert(Employee), records)
+            record_employee_changes([record["employee_id"] for record in records])
+            imported += len(records)
+        if allocations:
+            db.session.execute(db.insert(EmployeeItem), allocations)
+
+    chunk = []
+    for line_number, row, parse_error in rows:
+        if parse_error:
+            errors.append({"row": line_number, "employee_id": None, "errors": [parse_error]})
+            continue
+        if row is None:
+            continue
+
+        row_errors = validate_employee_data(row, item_fields=item_fields)
+        employee_id = row.get("employee_id")
+        if not row_errors and employee_id in seen_ids:
+            row_errors = ["Duplicate employee_id in upload"]
+        if row_errors:
+            errors.append({"row": line_number, "employee_id": employee_id, "errors": row_errors})
+            continue
+
+        seen_ids.add(employee_id)
+        chunk.append((line_number, row))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            flush(chunk)
+            chunk = []
+
+    if chunk:
+        flush(chunk)
+
+    return imported, errors, item_totals
+
+@employee_bp.route("/employees/bulk", methods=["POST"])
+def bulk_create_employees():
+    """Import many employees from a CSV or JSON-lines upload in one transaction"""
+    try:
+        upload = request.files.get("file")
+        if upload:
+            stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+        else:
+            # Multipart files are already spooled by the form parser
+            stream, filename, content_type = spool_upload(request.stream), None, request.mimetype
+        
+        upload_format = detect_format(filename, content_type, request.args.get("format"))
+        if upload_format not in ("csv", "jsonl"):
+            return jsonify({"error": "Unsupported format, use csv or jsonl"}), 400
+        
+        try:
+            imported, errors, item_totals = import_employee_rows(iter_upload_rows(stream, upload_format))
+        except UploadDecodeError as e:
+            # The rest of the file can't be read, so none of it is imported
+            db.session.rollback()
+            error = {"row": e.line_number, "employee_id": None, "errors": [str(e)]}
+            return jsonify({"imported": 0, "failed": 1, "errors": [error]}), 400
+        report = {"imported": imported, "failed": len(errors), "errors": errors}
+        
+        if not imported:
+            db.session.rollback()
+            status = 400 if errors else 200
+            if not errors:
+                report["message"] = "No rows found in upload"
+            return jsonify(report), status
+        
+        # One stock update and one stats update for the whole batch
+        adjust_stock_for_employee(item_totals)
+        apply_stats_delta(imported, item_totals)
+        db.session.commit()
+        
+        check_and_send_low_stock_alert([name for name, quantity in item_totals.items() if quantity])
+        # One event for the batch; clients reload their employee list
+        publish_employee_change("employees", {"action": "imported", "count": imported})
+        
+        return jsonify(report), 201
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return jsonify({
+            "error": str(e),
+            "shortages": e.shortages,
+            "imported": 0,
+            "failed": len(errors),
+            "errors": errors
+        }), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @employee_bp.route("/employees/<employee_id>", methods=["PUT"])
+@retry_on_busy
 def update_employee(employee_id):
-    """Update existing employee and adjust stock accordingly"""
+    """Update existing employee and adjust stock accordingly.
+
+    With If-Match the update only happens if the employee is unchanged
+    since it was read; otherwise it answers 412 with the current ETag.
+    """
     try:
         employee = Employee.query.get(employee_id)
         if not employee:
@@ -159,52 +402,71 @@ def update_employee(employee_id):
         if errors:
             return jsonify({"errors": errors}), 400
         
-        # Update employee fields
-        if "first_name" in data:
-            employee.first_name = data["first_name"]
-        if "last_name" in data:
-            employee.last_name = data["last_name"]
-        if "emergency_no" in data:
-            employee.emergency_no = data["emergency_no"]
-        if "blood_group" in data:
-            employee.blood_group = data["blood_group"]
-        if "department_name" in data:
-            employee.department_name = data["department_name"]
+        # Fields and version bump in one UPDATE ... WHERE version IN (If-Match),
+        # which also takes the write lock before the held items are read
+        employee_table = Employee.__table__
+        stmt = employee_table.update().where(employee_table.c.employee_id == employee_id)
+        versions = if_match_versions()
+        if versions is not None:
+            stmt = stmt.where(employee_table.c.version.in_(versions))
+        fields = {field: data[field] for field in EMPLOYEE_UPDATE_FIELDS if field in data}
+        updated = db.session.execute(
+            stmt.values(version=employee_table.c.version + 1, **fields).returning(employee_table.c.version)
+        ).scalar()
+        if updated is None:
+            current = db.session.execute(
+                db.select(employee_table.c.version).where(employee_table.c.employee_id == employee_id)
+            ).scalar()
+            if current is None:
+                db.session.rollback()
+                return jsonify({"error": "Employee not found"}), 404
+            raise VersionConflictError(current)
         
         # Update item quantities and calculate stock changes
-        item_fields = {
-            "bag": "bag_quantity",
-            "pen": "pen_quantity",
-            "diary": "diary_quantity",
-            "bottle": "bottle_quantity",
-            "tshirt_s": "tshirt_s_quantity",
-            "tshirt_m": "tshirt_m_quantity",
-            "tshirt_l": "tshirt_l_quantity",
-            "tshirt_xl": "tshirt_xl_quantity",
-            "tshirt_xxl": "tshirt_xxl_quantity",
-            "tshirt_xxxl": "tshirt_xxxl_quantity"
+        catalog = get_item_catalog()
+        held = get_employee_items(employee_id)
+        new_quantities = {
+            item_name: int(data[item_field(item_name)])
+            for item_name in catalog if item_field(item_name) in data
         }
+        stock_changes = {
+            item_name: quantity - held.get(item_name, 0)
+            for item_name, quantity in new_quantities.items()
+        }
+        set_employee_items(employee_id, new_quantities, catalog)
 
-        stock_changes = {}
-        for item_key, field_name in item_fields.items():
-            if field_name in data:
-                new_quantity = int(data[field_name])
-                old_quantity = getattr(employee, field_name)
-                setattr(employee, field_name, new_quantity)
-                stock_changes[item_key] = new_quantity - old_quantity
-
+        # Adjust stock based on changes
+        adjust_stock_for_employee(stock_changes, employee_id)
+        apply_stats_delta(0, stock_changes)
+        record_employee_changes([employee_id])
         db.session.commit()
+        invalidate_icards(employee_id)
         
-        # Adjust stock based on changes
-        if stock_changes:
-            adjust_stock_for_employee(stock_changes)
+        changed_items = [name for name, change in stock_changes.items() if change]
+        if changed_items:
+            check_and_send_low_stock_alert(changed_items)
         
-        return jsonify(employee.to_dict()), 200
+        employee_data, _ = fetch_employee(employee_id, catalog)
+        publish_employee_change("employee", {"action": "updated", "employee": employee_data})
+        
+        response = jsonify(employee_data)
+        response.set_etag(version_etag(updated))
+        return response, 200
+    except VersionConflictError as e:
+        db.session.rollback()
+        return precondition_failed(e)
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e), "shortages": e.shortages}), 409
+    except OperationalError:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @employee_bp.route("/employees/<employee_id>", methods=["DELETE"])
+@retry_on_busy
 def delete_employee(employee_id):
     """Delete employee (optional functionality)"""
     try:
@@ -213,27 +475,25 @@ def delete_employee(employee_id):
             return jsonify({"error": "Employee not found"}), 404
         
         # Add stock back when employee is deleted
-        item_quantities_to_add = {
-            "bag": employee.bag_quantity,
-            "pen": employee.pen_quantity,
-            "diary": employee.diary_quantity,
-            "bottle": employee.bottle_quantity,
-            "tshirt_s": employee.tshirt_s_quantity,
-            "tshirt_m": employee.tshirt_m_quantity,
-            "tshirt_l": employee.tshirt_l_quantity,
-            "tshirt_xl": employee.tshirt_xl_quantity,
-            "tshirt_xxl": employee.tshirt_xxl_quantity,
-            "tshirt_xxxl": employee.tshirt_xxxl_quantity
-        }
+        item_quantities_to_add = get_employee_items(employee_id)
         
         # Convert deductions to additions by negating quantities
         stock_additions = {k: -v for k, v in item_quantities_to_add.items()}
-        adjust_stock_for_employee(stock_additions)
+        adjust_stock_for_employee(stock_additions, employee_id)
 
         db.session.delete(employee)
+        apply_stats_delta(-1, stock_additions)
+        record_employee_changes([employee_id], deleted=True)
         db.session.commit()
+        invalidate_icards(employee_id)
+        
+        check_and_send_low_stock_alert([name for name, quantity in stock_additions.items() if quantity])
+        publish_employee_change("employee", {"action": "deleted", "employee_id": employee_id})
         
         return jsonify({"message": "Employee deleted successfully"}), 200
+    except OperationalError:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -242,33 +502,7 @@ def delete_employee(employee_id):
 def get_employee_stats():
     """Get employee statistics"""
     try:
-        total_employees = Employee.query.count()
-        
-        stats = {
-            "total_employees": total_employees,
-            "bags_distributed": db.session.query(db.func.sum(Employee.bag_quantity)).scalar() or 0,
-            "pens_distributed": db.session.query(db.func.sum(Employee.pen_quantity)).scalar() or 0,
-            "diaries_distributed": db.session.query(db.func.sum(Employee.diary_quantity)).scalar() or 0,
-            "bottles_distributed": db.session.query(db.func.sum(Employee.bottle_quantity)).scalar() or 0,
-            "tshirts_distributed": (
-                db.session.query(db.func.sum(Employee.tshirt_s_quantity)).scalar() or 0 +
-                db.session.query(db.func.sum(Employee.tshirt_m_quantity)).scalar() or 0 +
-                db.session.query(db.func.sum(Employee.tshirt_l_quantity)).scalar() or 0 +
-                db.session.query(db.func.sum(Employee.tshirt_xl_quantity)).scalar() or 0 +
-                db.session.query(db.func.sum(Employee.tshirt_xxl_quantity)).scalar() or 0 +
-                db.session.query(db.func.sum(Employee.tshirt_xxxl_quantity)).scalar() or 0
-            )
-        }
-        
-        tshirt_sizes_distributed = {
-            "S": db.session.query(db.func.sum(Employee.tshirt_s_quantity)).scalar() or 0,
-            "M": db.session.query(db.func.sum(Employee.tshirt_m_quantity)).scalar() or 0,
-            "L": db.session.query(db.func.sum(Employee.tshirt_l_quantity)).scalar() or 0,
-            "XL": db.session.query(db.func.sum(Employee.tshirt_xl_quantity)).scalar() or 0,
-            "XXL": db.session.query(db.func.sum(Employee.tshirt_xxl_quantity)).scalar() or 0,
-            "XXXL": db.session.query(db.func.sum(Employee.tshirt_xxxl_quantity)).scalar() or 0
-        }
-        stats["tshirt_sizes_distributed"] = tshirt_sizes_distributed
+        stats = build_employee_stats()
         
         return jsonify(stats), 200
     except Exception as e:
@@ -280,76 +514,137 @@ def upload_photo():
     employee_id = request.form.get('employee_id')
     if not photo or not employee_id:
         return jsonify({'success': False, 'error': 'Missing photo or employee_id'}), 400
-    if not os.path.exists(EMP_IMG_FOLDER):
-        os.makedirs(EMP_IMG_FOLDER)
-    ext = os.path.splitext(photo.filename)[1].lower()
-    if ext not in ['.jpg', '.jpeg', '.png']:
-        return jsonify({'success': False, 'error': 'Invalid file type'}), 400
-    filename = f"{employee_id}.jpg"
-    photo.save(os.path.join(EMP_IMG_FOLDER, filename))
+    try:
+        ingest_photo(photo.read(), employee_id)
+    except InvalidPhotoError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    invalidate_icards(employee_id)
     return jsonify({'success': True})
 
+@employee_bp.route('/employees/<employee_id>/photo', methods=['GET'])
+def get_employee_photo(employee_id):
+    """Serve the i-card photo, or the grid thumbnail with ?size=thumb"""
+    size = request.args.get('size', 'icard')
+    if size not in ('icard', 'thumb'):
+        return jsonify({"error": "size must be icard or thumb"}), 400
+    try:
+        if not ensure_normalized_photo(employee_id):
+            return jsonify({"error": "Photo not found"}), 404
+    except InvalidPhotoError as e:
+        return jsonify({"error": str(e)}), 404
+
+    # send_file answers If-None-Match / If-Modified-Since with a 304
+    response = send_file(photo_path(employee_id, size), mimetype='image/jpeg', conditional=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def icard_photo_path(employee_id):
+    """Card photo for an employee, normalizing one stored before the photo pipeline"""
+    try:
+        ensure_normalized_photo(employee_id)
+    except InvalidPhotoError as e:
+        print(f"Could not normalize photo of {employee_id}: {e}")
+    return photo_path(employee_id)
+
 @employee_bp.route('/employees/icard/<employee_id>', methods=['GET'])
 def generate_icard(employee_id):
     employee = Employee.query.get(employee_id)
     if not employee:
         return "Employee not found", 404
 
-    # Get photo path
-    img_path = os.path.join(EMP_IMG_FOLDER, f"{employee_id}.jpg")
-    photo_data = None
-    if os.path.exists(img_path):
-        with open(img_path, "rb") as img_file:
-            photo_data = "data:image/jpeg;base64," + base64.b64encode(img_file.read()).decode('utf-8')
-    else:
-        # Use a placeholder image or blank
-        photo_data = None
-
-    # Render HTML with employee data
-    html = render_template(
-        "icard.html",
-        first_name=employee.first_name,
-        last_name=employee.last_name,
-        emergency_no=employee.emergency_no,
-        blood_group=employee.blood_group,
-        department_name=employee.department_name,
-        employee_id=employee.employee_id,
-        photo_data=photo_data
-    )
+    img_path = icard_photo_path(employee_id)
+    context = build_icard_context(employee, img_path)
+    key = icard_cache_key(context, img_path)
+    pdf_path = icard_cache_path(employee_id, key)
 
-    # Generate PDF from HTML
-    pdf = HTML(string=html, base_url=request.host_url).write_pdf()
+    # Only render when the card's content has changed since it was last generated
+    if not os.path.exists(pdf_path):
+        store_icard(employee_id, pdf_path, render_icard_pdf(render_template("icard.html", **context)))
 
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename={employee_id}_icard.pdf'
+    response = send_file(
+        pdf_path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'{employee_id}_icard.pdf',
+        etag=key
+    )
+    response.headers['Cache-Control'] = 'no-cache'
     return response
 
-@employee_bp.route('/export/employees')
-def export_employees():
-    output = StringIO()
-    writer = csv.writer(output)
-    # Write header
-    writer.writerow([
-        'Employee ID', 'First Name', 'Last Name', 'Emergency No',
-        'Blood Group', 'Department Name', 'Bag', 'Pen', 'Diary', 'Bottle',
-        'T-shirt S', 'T-shirt M', 'T-shirt L', 'T-shirt XL', 'T-shirt XXL', 'T-shirt XXXL'
-    ])
-    # Query all employees
-    employees = Employee.query.all()
-    for emp in employees:
-        writer.writerow([
-            emp.employee_id, emp.first_name, emp.last_name, emp.emergency_no,
-            emp.blood_group, emp.department_name, emp.bag_quantity, emp.pen_quantity,
-            emp.diary_quantity, emp.bottle_quantity, emp.tshirt_s_quantity,
-            emp.tshirt_m_quantity, emp.tshirt_l_quantity, emp.tshirt_xl_quantity,
-            emp.tshirt_xxl_quantity, emp.tshirt_xxxl_quantity
-        ])
-    output.seek(0)
-    return Response(
-        output,
-        mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment;filename=employees.csv'}
-    )
+@employee_bp.route('/employees/icards', methods=['GET'])
+def generate_icard_batch():
+    """Render the cards of a department or onboarding batch into one PDF; supports ids=, department=, since=, until="""
+    try:
+        query = Employee.query.order_by(Employee.created_at, Employee.employee_id)
+        if request.args.get("ids"):
+            query = query.filter(Employee.employee_id.in_(request.args["ids"].split(",")))
+        if request.args.get("department"):
+            query = query.filter(Employee.department_name == request.args["department"])
+        if request.args.get("since"):
+            query = query.filter(Employee.created_at >= datetime.fromisoformat(request.args["since"]))
+        if request.args.get("until"):
+            query = query.filter(Employee.created_at < datetime.fromisoformat(request.args["until"]))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not any(request.args.get(name) for name in ("ids", "department", "since", "until")):
+        return jsonify({"error": "Select cards with ids, department, since or until"}), 400
+
+    employees = query.limit(MAX_BATCH_CARDS + 1).all()
+    if not employees:
+        return jsonify({"error": "No matching employees"}), 404
+    if len(employees) > MAX_BATCH_CARDS:
+        return jsonify({"error": f"At most {MAX_BATCH_CARDS} cards per batch"}), 400
+
+    try:
+        pdf_paths = []
+        missing = []
+        for employee in employees:
+            img_path = icard_photo_path(employee.employee_id)
+            context = build_icard_context(employee, img_path)
+            pdf_path = icard_cache_path(employee.employee_id, icard_cache_key(context, img_path))
+            pdf_paths.append(pdf_path)
+            if not os.path.exists(pdf_path):
+                missing.append((employee.employee_id, pdf_path, render_template("icard.html", **context)))
+
+        # Cache misses are rendered in parallel by the worker pool
+        rendered = render_icard_batch([html for _, _, html in missing])
+        for (employee_id, pdf_path, _), pdf in zip(missing, rendered):
+            store_icard(employee_id, pdf_path, pdf)
+
+        pdfs = []
+        for pdf_path in pdf_paths:
+            with open(pdf_path, "rb") as pdf_file:
+                pdfs.append(pdf_file.read())
 
+        return send_file(
+            merge_pdfs(pdfs),
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name='icards.pdf'
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+@employee_bp.route('/export/employees')
+def export_employees():
+    """Stream employees as CSV; supports columns=, department=, blood_group=, since=, until="""
+    try:
+        columns = parse_export_columns(request.args.get("columns"), employee_export_columns())
+        
+        employee = Employee.__table__
+        stmt = db.select(*employee_columns([field for field, _ in columns])).order_by(
+            employee.c.created_at, employee.c.employee_id
+        )
+        if request.args.get("department"):
+            stmt = stmt.where(employee.c.department_name == request.args["department"])
+        if request.args.get("blood_group"):
+            stmt = stmt.where(employee.c.blood_group == request.args["blood_group"])
+        if request.args.get("since"):
+            stmt = stmt.where(employee.c.created_at >= datetime.fromisoformat(request.args["since"]))
+        if request.args.get("until"):
+            stmt = stmt.where(employee.c.created_at < datetime.fromisoformat(request.args["until"]))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return csv_export_response("employees.csv", columns, stmt)
@@ -0,0 +1,20 @@
+from flask import Blueprint, Response, request, jsonify
+from src.event_hub import event_hub, TooManySubscribers
+
+events_bp = Blueprint("events", __name__)
+
+@events_bp.route("/events", methods=["GET"])
+def stream_events():
+    """Server-sent events for stock, low_stock, employee, employees, stats and resync"""
+    try:
+        stream = event_hub.stream(request.headers.get("Last-Event-ID"))
+    except TooManySubscribers:
+        response = jsonify({"error": "Too many live connections, please retry"})
+        response.headers["Retry-After"] = "30"
+        return response, 503
+    
+    response = Response(stream, mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Stops nginx from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
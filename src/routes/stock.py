@@ -1,22 +1,57 @@
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, make_response
+from sqlalchemy.exc import OperationalError
 from src.models.inventory import db, Stock
-from src.database_init import get_low_stock_items
-from src.email_service import send_low_stock_alert
-import csv
-from io import StringIO
+from src.db_config import retry_on_busy
+from src.database_init import get_low_stock_items, get_stock_levels
+from src.alert_dispatcher import get_alert_dispatcher
+from src.csv_export import csv_export_response, parse_export_columns
+from src.stock_journal import (
+    record_movements, record_opening_balances, set_stock_quantity, restock, apply_stock_changes,
+    stock_at, consumption, get_movements, HANDOUT, RETURN
+)
+from src.stock_cache import stock_cache
+from src.stock_forecast import build_stock_forecast, FORECAST_HISTORY_DAYS, MAX_HISTORY_DAYS, DEFAULT_LEAD_DAYS
+from src.event_hub import publish_event
+from src.row_version import VersionConflictError, version_etag, if_match_versions, precondition_failed
+from datetime import datetime
+import json
 
 stock_bp = Blueprint("stock", __name__)
 
+# (field, CSV header) pairs written by /export/stock, in column order
+STOCK_EXPORT_COLUMNS = [
+    ("item_name", "Item Name"),
+    ("quantity", "Quantity"),
+    ("danger_level", "Danger Level")
+]
+
+MAX_BATCH_OPERATIONS = 500
+
+def build_stock_snapshot():
+    """JSON body of GET /stock, rendered once per stock version"""
+    stock_items = Stock.query.all()
+    response_data = {
+        "stock_items": [item.to_dict() for item in stock_items],
+        "low_stock_items": get_low_stock_items()
+    }
+    return json.dumps(response_data).encode()
+
 @stock_bp.route("/stock", methods=["GET"])
 def get_all_stock():
-    """Get all stock items"""
+    """Get all stock items; answers If-None-Match with 304 until stock is written"""
     try:
-        stock_items = Stock.query.all()
-        response_data = {
-            "stock_items": [item.to_dict() for item in stock_items],
-            "low_stock_items": get_low_stock_items()
-        }
-        return jsonify(response_data), 200
+        # Checked before touching the database: a poll with nothing new costs no query
+        etag = stock_cache.etag()
+        if etag in request.if_none_match:
+            response = make_response("", 304)
+        else:
+            etag, body = stock_cache.get(build_stock_snapshot)
+            response = make_response(body, 200)
+            response.mimetype = "application/json"
+        response.set_etag(etag)
+        # Browsers revalidate on every fetch instead of reusing a stale copy
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -27,37 +62,50 @@ def get_stock_item(item_name):
         item = Stock.query.filter_by(item_name=item_name).first()
         if not item:
             return jsonify({"error": "Item not found"}), 404
-        return jsonify(item.to_dict()), 200
+        response = jsonify(item.to_dict())
+        # Sent back as If-Match by a PUT that must not overwrite someone else's change
+        response.set_etag(version_etag(item.version))
+        return response, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @stock_bp.route("/stock/<item_name>", methods=["PUT"])
+@retry_on_busy
 def update_stock_item(item_name):
-    """Update stock quantity for an item"""
+    """Update stock quantity for an item; with If-Match, only if it is unchanged since read (412 otherwise)"""
     try:
         data = request.get_json()
         if not data or "quantity" not in data:
             return jsonify({"error": "Quantity is required"}), 400
         
-        item = Stock.query.filter_by(item_name=item_name).first()
-        if not item:
-            return jsonify({"error": "Item not found"}), 404
-        
         new_quantity = int(data["quantity"])
         if new_quantity < 0:
             return jsonify({"error": "Quantity cannot be negative"}), 400
         
-        item.quantity = new_quantity
+        # Journals the difference as a correction in the same transaction
+        if not set_stock_quantity(item_name, new_quantity, if_match_versions()):
+            db.session.rollback()
+            return jsonify({"error": "Item not found"}), 404
         db.session.commit()
+        item = Stock.query.filter_by(item_name=item_name).first()
         
-        check_and_send_low_stock_alert()
+        check_and_send_low_stock_alert([item_name])
         
-        return jsonify(item.to_dict()), 200
+        response = jsonify(item.to_dict())
+        response.set_etag(version_etag(item.version))
+        return response, 200
+    except VersionConflictError as e:
+        db.session.rollback()
+        return precondition_failed(e)
+    except OperationalError:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @stock_bp.route("/stock/<item_name>/add", methods=["POST"])
+@retry_on_busy
 def add_stock_quantity(item_name):
     """Add quantity to existing stock"""
     try:
@@ -65,18 +113,101 @@ def add_stock_quantity(item_name):
         if not data or "quantity" not in data:
             return jsonify({"error": "Quantity is required"}), 400
         
-        item = Stock.query.filter_by(item_name=item_name).first()
-        if not item:
-            return jsonify({"error": "Item not found"}), 404
-        
         add_quantity = int(data["quantity"])
         if add_quantity <= 0:
             return jsonify({"error": "Quantity to add must be positive"}), 400
         
-        item.quantity += add_quantity
+        # quantity + n evaluates in SQLite, so concurrent restocks all count
+        if not restock(item_name, add_quantity):
+            db.session.rollback()
+            return jsonify({"error": "Item not found"}), 404
         db.session.commit()
+        item = Stock.query.filter_by(item_name=item_name).first()
+        
+        # Lets the dispatcher see the item recover so its next drop alerts again
+        check_and_send_low_stock_alert([item_name])
         
         return jsonify(item.to_dict()), 200
+    except OperationalError:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+def validate_stock_operations(operations):
+    """Fold a batch of set/add operations into {item_name: (mode, quantity)}.
+
+    Returns (changes, errors); errors name the index of each bad operation.
+    Later operations on the same item apply on top of earlier ones.
+    """
+    errors = []
+    changes = {}
+    if not isinstance(operations, list) or not operations:
+        return {}, [{"error": "operations must be a non-empty list"}]
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return {}, [{"error": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}]
+
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            errors.append({"index": index, "error": "Operation must be an object"})
+            continue
+        item_name = operation.get("item_name")
+        mode = operation.get("op")
+        try:
+            quantity = int(operation.get("quantity"))
+        except (TypeError, ValueError):
+            quantity = None
+
+        if not item_name:
+            errors.append({"index": index, "error": "Item name is required"})
+        elif mode not in ("set", "add"):
+            errors.append({"index": index, "item_name": item_name, "error": "op must be set or add"})
+        elif quantity is None:
+            errors.append({"index": index, "item_name": item_name, "error": "Quantity must be an integer"})
+        elif mode == "set" and quantity < 0:
+            errors.append({"index": index, "item_name": item_name, "error": "Quantity cannot be negative"})
+        elif mode == "add" and quantity <= 0:
+            errors.append({"index": index, "item_name": item_name, "error": "Quantity to add must be positive"})
+        elif mode == "add" and item_name in changes:
+            previous_mode, previous = changes[item_name]
+            changes[item_name] = (previous_mode, previous + quantity)
+        else:
+            changes[item_name] = (mode, quantity)
+
+    known = set(db.session.execute(
+        db.select(Stock.item_name).where(Stock.item_name.in_(list(changes)))
+    ).scalars()) if changes else set()
+    for index, operation in enumerate(operations):
+        if isinstance(operation, dict) and operation.get("item_name") in changes and operation["item_name"] not in known:
+            errors.append({"index": index, "item_name": operation["item_name"], "error": "Item not found"})
+    return changes, sorted(errors, key=lambda error: error.get("index", -1))
+
+@stock_bp.route("/stock/batch", methods=["POST"])
+@retry_on_busy
+def batch_update_stock():
+    """Apply set/add operations to many items in one transaction, all or nothing"""
+    try:
+        data = request.get_json()
+        operations = data.get("operations") if isinstance(data, dict) else data
+        changes, errors = validate_stock_operations(operations)
+        if errors:
+            return jsonify({"errors": errors}), 400
+        
+        apply_stock_changes(changes)
+        db.session.commit()
+        
+        # One alert evaluation and one live update for the whole delivery
+        check_and_send_low_stock_alert(list(changes))
+        
+        etag, body = stock_cache.get(build_stock_snapshot)
+        response = make_response(body, 200)
+        response.mimetype = "application/json"
+        response.set_etag(etag)
+        return response
+    except OperationalError:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -88,9 +219,9 @@ def check_low_stock():
         low_stock_items = get_low_stock_items()
         
         if low_stock_items:
-            send_low_stock_alert(low_stock_items)
+            get_alert_dispatcher().submit(low_stock_items, force=True)
             return jsonify({
-                "message": "Low stock alert sent",
+                "message": "Low stock alert queued",
                 "low_stock_items": low_stock_items
             }), 200
         else:
@@ -98,34 +229,84 @@ def check_low_stock():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def check_and_send_low_stock_alert():
-    """Helper function to check and send low stock alerts"""
-    try:
-        low_stock_items = get_low_stock_items()
-        if low_stock_items:
-            send_low_stock_alert(low_stock_items)
-    except Exception as e:
-        print(f"Error sending low stock alert: {e}")
+def check_and_send_low_stock_alert(item_names=None):
+    """Hand the levels of items just written (all items when None) to the alert dispatcher.
 
-def adjust_stock_for_employee(item_quantities):
-    """Adjust stock based on items given/taken from employee"""
+    The dispatcher decides in the background whether anything crossed into
+    low stock, so this never waits on the mail server. The same levels go
+    out to live clients as a stock event.
+    """
     try:
-        for item_name, quantity_change in item_quantities.items():
-            item = Stock.query.filter_by(item_name=item_name).first()
-            if item:
-                item.quantity -= quantity_change  # Deduct for positive, add for negative
-                if item.quantity < 0:
-                    item.quantity = 0  # Ensure stock doesn't go below zero
-        
-        db.session.commit()
-        
-        check_and_send_low_stock_alert()
-        
+        levels = get_stock_levels(item_names)
+        get_alert_dispatcher().submit(levels)
+        publish_event("stock", {"items": levels})
     except Exception as e:
-        db.session.rollback()
-        raise e
+        print(f"Error queueing low stock alert: {e}")
+
+class InsufficientStockError(Exception):
+    """Raised when a stock movement would take one or more items below zero"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        details = ", ".join(
+            f"{item['item_name']} (requested {item['requested']}, available {item['available']})"
+            for item in shortages
+        )
+        super().__init__(f"Insufficient stock: {details}")
+
+def adjust_stock_for_employee(item_quantities, employee_id=None):
+    """Adjust stock based on items given/taken from employee.
+
+    Positive quantities are handed out, negative ones returned. All deltas are
+    applied by one conditional UPDATE in the caller's transaction, so the
+    caller commits (or rolls back) together with its Employee write, and are
+    journaled against employee_id (None for bulk imports). Items that don't
+    have enough stock raise InsufficientStockError instead of being clamped
+    at zero.
+    """
+    deltas = {item_name: int(quantity) for item_name, quantity in item_quantities.items() if quantity}
+    if not deltas:
+        return
+
+    # quantity - :n and quantity >= :n evaluate in SQLite, so concurrent
+    # handouts can't read a stale quantity and overwrite each other
+    stock = Stock.__table__
+    delta = db.case(deltas, value=stock.c.item_name)
+    stmt = (
+        stock.update()
+        .where(stock.c.item_name.in_(deltas), stock.c.quantity >= delta)
+        .values(quantity=stock.c.quantity - delta, version=stock.c.version + 1)
+        .returning(stock.c.item_name, stock.c.id)
+    )
+    applied = dict(db.session.execute(stmt).all())
+
+    if len(applied) != len(deltas):
+        missing = [item_name for item_name in deltas if item_name not in applied]
+        # Rows that failed the condition were left untouched, so this reads their real level
+        available = dict(db.session.execute(
+            db.select(stock.c.item_name, stock.c.quantity).where(stock.c.item_name.in_(missing))
+        ).all())
+        raise InsufficientStockError([
+            {
+                "item_name": item_name,
+                "requested": deltas[item_name],
+                "available": available.get(item_name, 0)
+            }
+            for item_name in missing
+        ])
+    
+    record_movements([
+        {
+            "stock_id": stock_id,
+            "delta": -deltas[item_name],
+            "reason": HANDOUT if deltas[item_name] > 0 else RETURN,
+            "employee_id": employee_id
+        }
+        for item_name, stock_id in applied.items()
+    ])
 
 @stock_bp.route("/stock", methods=["POST"])
+@retry_on_busy
 def add_stock_item():
     """Add a new stock item"""
     try:
@@ -139,25 +320,111 @@ def add_stock_item():
             return jsonify({"error": "Item already exists"}), 400
         item = Stock(item_name=name, quantity=quantity, danger_level=danger_level)
         db.session.add(item)
+        db.session.flush()
+        record_opening_balances()
         db.session.commit()
+        
+        check_and_send_low_stock_alert([name])
+        
         return jsonify(item.to_dict()), 201
+    except OperationalError:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @stock_bp.route('/export/stock')
 def export_stock():
-    output = StringIO()
-    writer = csv.writer(output)
-    # Write header
-    writer.writerow(['Item Name', 'Quantity', 'Danger Level'])
-    # Query all stock items
-    stocks = Stock.query.all()
-    for item in stocks:
-        writer.writerow([item.item_name, item.quantity, item.danger_level])
-    output.seek(0)
-    return Response(
-        output,
-        mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment;filename=stock.csv'}
-    )
\ No newline at end of file
+    """Stream stock as CSV; supports columns= and low_only=1"""
+    try:
+        columns = parse_export_columns(request.args.get("columns"), STOCK_EXPORT_COLUMNS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    stock = Stock.__table__
+    stmt = db.select(*[stock.c[field] for field, _ in columns]).order_by(stock.c.id)
+    if request.args.get("low_only") == "1":
+        stmt = stmt.where(stock.c.quantity <= stock.c.danger_level)
+    
+    return csv_export_response("stock.csv", columns, stmt)
+
+def parse_journal_time(value, default=None):
+    """ISO timestamp from a query parameter (UTC, like the journal), or default when absent"""
+    if not value:
+        return default
+    return datetime.fromisoformat(value)
+
+@stock_bp.route("/stock/<item_name>/level", methods=["GET"])
+def get_stock_level_at(item_name):
+    """Stock level of an item at a point in time; supports at= (default now)"""
+    try:
+        item = Stock.query.filter_by(item_name=item_name).first()
+        if not item:
+            return jsonify({"error": "Item not found"}), 404
+        at = parse_journal_time(request.args.get("at"), datetime.utcnow())
+        return jsonify({
+            "item_name": item_name,
+            "at": at.isoformat(),
+            "quantity": stock_at(item.id, at)
+        }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@stock_bp.route("/stock/<item_name>/movements", methods=["GET"])
+def get_stock_movements(item_name):
+    """Journal of an item, newest first; supports since=, until= and limit= (max 1000)"""
+    try:
+        item = Stock.query.filter_by(item_name=item_name).first()
+        if not item:
+            return jsonify({"error": "Item not found"}), 404
+        since = parse_journal_time(request.args.get("since"))
+        until = parse_journal_time(request.args.get("until"))
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+        movements = get_movements(item.id, since, until, limit)
+        return jsonify({
+            "item_name": item_name,
+            "movements": [movement.to_dict() for movement in movements]
+        }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@stock_bp.route("/stock/<item_name>/consumption", methods=["GET"])
+def get_stock_consumption(item_name):
+    """What an item was handed out, returned and restocked over a period; needs from=, to= defaults to now"""
+    try:
+        item = Stock.query.filter_by(item_name=item_name).first()
+        if not item:
+            return jsonify({"error": "Item not found"}), 404
+        if not request.args.get("from"):
+            return jsonify({"error": "from is required"}), 400
+        start = parse_journal_time(request.args.get("from"))
+        end = parse_journal_time(request.args.get("to"), datetime.utcnow())
+        if end < start:
+            return jsonify({"error": "to must not be before from"}), 400
+        report = consumption(item.id, start, end)
+        report.update({"item_name": item_name, "from": start.isoformat(), "to": end.isoformat()})
+        return jsonify(report), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@stock_bp.route("/stock/forecast", methods=["GET"])
+def get_stock_forecast():
+    """Daily consumption, days of cover and a reorder point per item; supports days= and lead_days="""
+    try:
+        try:
+            history_days = int(request.args.get("days", FORECAST_HISTORY_DAYS))
+            lead_days = int(request.args.get("lead_days", DEFAULT_LEAD_DAYS))
+        except ValueError:
+            return jsonify({"error": "days and lead_days must be integers"}), 400
+        if not 1 <= history_days <= MAX_HISTORY_DAYS or lead_days < 1:
+            return jsonify({"error": f"days must be between 1 and {MAX_HISTORY_DAYS}, lead_days at least 1"}), 400
+        return jsonify(build_stock_forecast(history_days, lead_days)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,35 @@
+from flask import Blueprint, request, jsonify
+from src.site_sync import export_changes, sync_authorized, SYNC_TOKEN, SYNC_PAGE_SIZE, MAX_SYNC_PAGE_SIZE
+from src.employee_listing import parse_page_size
+from src.icard_renderer import invalidate_icards
+from src.routes.stock import check_and_send_low_stock_alert
+from src.routes.employee import publish_employee_change
+
+sync_bp = Blueprint("sync", __name__)
+
+@sync_bp.route("/sync/changes", methods=["GET"])
+def get_sync_changes():
+    """Stock movements and employee changes after cursor=, for another site to pull"""
+    try:
+        if not SYNC_TOKEN:
+            return jsonify({"error": "Sync is not enabled"}), 404
+        if not sync_authorized(request.headers.get("Authorization")):
+            return jsonify({"error": "Invalid sync token"}), 401
+        try:
+            limit = parse_page_size(request.args.get("limit"), SYNC_PAGE_SIZE, MAX_SYNC_PAGE_SIZE)
+            page = export_changes(request.args.get("cursor"), limit)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(page), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def publish_synced_changes(stock_totals, employee_ids):
+    """After a pulled page is committed: low-stock alerts, live updates, stale i-cards"""
+    if stock_totals:
+        check_and_send_low_stock_alert(list(stock_totals))
+    for employee_id in employee_ids:
+        invalidate_icards(employee_id)
+    if employee_ids:
+        # One event per page; clients reload their employee list
+        publish_employee_change("employees", {"action": "synced", "count": len(employee_ids)})
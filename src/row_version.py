@@ -0,0 +1,41 @@
+from flask import request, jsonify
+from sqlalchemy import text
+from src.models.inventory import db
+
+# Tables whose rows carry a version for optimistic concurrency
+VERSIONED_TABLES = ("stock", "employee")
+
+class VersionConflictError(Exception):
+    """A conditional write found the row at another version than the client read"""
+    def __init__(self, version):
+        self.version = version
+        super().__init__(f"Changed by someone else since it was read (now at version {version}); reload and retry")
+
+def migrate_version_columns():
+    """Add the version column to stock and employee tables created before it existed"""
+    for table in VERSIONED_TABLES:
+        columns = [row[1] for row in db.session.execute(text(f"PRAGMA table_info({table})"))]
+        if "version" not in columns:
+            db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+    db.session.commit()
+
+def version_etag(version):
+    """ETag value of a row version (quoted by response.set_etag)"""
+    return str(version)
+
+def if_match_versions():
+    """Versions the request's If-Match accepts, or None when it doesn't restrict the write.
+
+    If-Match compares strongly, so weak tags are ignored; a header naming no
+    version at all gives an empty set, which no row matches (412).
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    return {int(tag) for tag in request.if_match.as_set() if tag.isdigit()}
+
+def precondition_failed(error):
+    """412 for a VersionConflictError, carrying the current ETag so the client can re-read"""
+    response = jsonify({"error": str(error), "version": error.version})
+    response.status_code = 412
+    response.set_etag(version_etag(error.version))
+    return response
@@ -0,0 +1,183 @@
+import base64
+import json
+from sqlalchemy import text
+from src.models.inventory import db, Employee
+from src.item_catalog import employee_columns
+
+# Employee columns covered by the trigram index, with their bm25 weights
+SEARCH_COLUMNS = {
+    "employee_id": 10.0,
+    "first_name": 5.0,
+    "last_name": 5.0,
+    "emergency_no": 1.0
+}
+
+# Low-cardinality columns: a department shares its trigrams with thousands of
+# rows, so it is prefix-matched through a NOCASE b-tree index instead
+PREFIX_COLUMNS = ("department_name", "blood_group")
+
+# Compact projection returned by the search endpoint unless fields= asks for more
+SEARCH_RESULT_FIELDS = ("employee_id", "first_name", "last_name", "department_name")
+
+SEARCH_TABLE = "employee_search"
+DEFAULT_SEARCH_LIMIT = 25
+MAX_SEARCH_LIMIT = 200
+
+# Trigram tokens need at least three characters to hit the index
+MIN_INDEXED_QUERY_LENGTH = 3
+
+# Hits considered per query: the best N full-text matches plus the first N
+# department/blood group prefix matches. Results past them are reported as
+# truncated rather than paged, so broad terms don't page through thousands
+RANKED_CANDIDATES = 500
+
+_search_index_ready = None
+
+def ensure_search_index():
+    """Create the FTS5 trigram index and the triggers that keep it in step with Employee"""
+    global _search_index_ready
+
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": SEARCH_TABLE}
+    ).first()
+
+    try:
+        if not exists:
+            db.session.execute(text(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                f"{columns}, content='employee', content_rowid='rowid', tokenize='trigram')"
+            ))
+            # Index whatever employees are already on file
+            db.session.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+        for column in PREFIX_COLUMNS:
+            db.session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_employee_{column}_nocase "
+                f"ON employee ({column} COLLATE NOCASE)"
+            ))
+
+        db.session.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON employee BEGIN "
+            f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.rowid, {new_values}); END"
+        ))
+        db.session.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON employee BEGIN "
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) "
+            f"VALUES ('delete', old.rowid, {old_values}); END"
+        ))
+        db.session.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF {columns} ON employee BEGIN "
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) "
+            f"VALUES ('delete', old.rowid, {old_values}); "
+            f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.rowid, {new_values}); END"
+        ))
+        db.session.commit()
+        _search_index_ready = True
+    except Exception as e:
+        # SQLite builds without FTS5 or the trigram tokenizer fall back to LIKE scans
+        db.session.rollback()
+        print(f"Employee search index unavailable, using LIKE search: {e}")
+        _search_index_ready = False
+
+    return _search_index_ready
+
+def rebuild_search_index():
+    """Re-derive the whole index from the employee table (e.g. after a VACUUM)"""
+    db.session.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+def search_index_ready():
+    """Whether the FTS5 index exists in the connected database"""
+    global _search_index_ready
+    if _search_index_ready is None:
+        _search_index_ready = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": SEARCH_TABLE}
+        ).first() is not None
+    return _search_index_ready
+
+def encode_search_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode()
+
+def decode_search_cursor(cursor):
+    """Turn an opaque cursor back into a result offset (0 for a missing cursor)"""
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["o"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+def _match_expression(query):
+    """Quote the query as a single FTS5 phrase so user input is never parsed as syntax"""
+    return '"' + query.replace('"', '""') + '"'
+
+def _escape_like(query):
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _more_than(stmt, count):
+    """Whether stmt yields more than count rows"""
+    return db.session.execute(
+        db.select(db.func.count()).select_from(stmt.limit(count + 1).subquery())
+    ).scalar() > count
+
+def search_employees(query, fields=SEARCH_RESULT_FIELDS, limit=DEFAULT_SEARCH_LIMIT, offset=0):
+    """Return (rows, has_more, truncated) for employees matching query, best matches first.
+
+    Rows are Core rows holding only the requested fields. Queries long enough
+    for the trigram index do substring matching on names, IDs and phone
+    numbers ranked by bm25, followed by department/blood group prefix matches.
+    Shorter queries fall back to a LIKE scan that puts prefix matches first.
+    Only the best RANKED_CANDIDATES hits per source are ranked; truncated is
+    True on the last page when a source had more.
+    """
+    employee = Employee.__table__
+    employee_rowid = db.literal_column("employee.rowid")
+    escaped = _escape_like(query)
+    prefix_match = db.or_(*[
+        employee.c[column].like(f"{escaped}%", escape="\\") for column in PREFIX_COLUMNS
+    ])
+
+    if search_index_ready() and len(query) >= MIN_INDEXED_QUERY_LENGTH:
+        search = db.table(SEARCH_TABLE, db.column("rowid"))
+        match = text(f"{SEARCH_TABLE} MATCH :match").bindparams(match=_match_expression(query))
+        weights = ", ".join(str(weight) for weight in SEARCH_COLUMNS.values())
+        bm25 = db.literal_column(f"bm25({SEARCH_TABLE}, {weights})")
+        # bm25 scores are negative, so full-text hits sort ahead of prefix hits
+        sources = [
+            db.select(search.c.rowid.label("rowid"), bm25.label("score")).where(match).order_by(bm25),
+            db.select(employee_rowid.label("rowid"), db.literal(0.0).label("score"))
+            .where(prefix_match).order_by(employee.c.employee_id)
+        ]
+        hits = db.union_all(*[
+            source.limit(RANKED_CANDIDATES).subquery().select() for source in sources
+        ]).subquery()
+        candidates = db.select(
+            hits.c.rowid, db.func.min(hits.c.score).label("score")
+        ).group_by(hits.c.rowid).subquery()
+    else:
+        searched = [employee.c[column] for column in (*SEARCH_COLUMNS, *PREFIX_COLUMNS)]
+        starts_with = db.or_(*[column.like(f"{escaped}%", escape="\\") for column in searched])
+        score = db.case((starts_with, 0), else_=1)
+        sources = [
+            db.select(employee_rowid.label("rowid"), score.label("score")).where(
+                db.or_(*[column.like(f"%{escaped}%", escape="\\") for column in searched])
+            ).order_by(score, employee.c.employee_id)
+        ]
+        candidates = sources[0].limit(RANKED_CANDIDATES).subquery()
+
+    stmt = db.select(*employee_columns(fields)).select_from(
+        employee.join(candidates, candidates.c.rowid == employee_rowid)
+    ).order_by(candidates.c.score, employee.c.employee_id)
+
+    rows = db.session.execute(stmt.limit(limit + 1).offset(offset)).all()
+    has_more = len(rows) > limit
+    truncated = not has_more and any(_more_than(source, RANKED_CANDIDATES) for source in sources)
+    return rows[:limit], has_more, truncated
@@ -0,0 +1,526 @@
+"""Site-to-site sync between the office copies of the app.
+
+Every office runs its own instance and database. A site pulls what changed
+at another one from GET /api/sync/changes on it (see `flask sync`) and
+applies it locally; each pair of sites pulls both ways, and changes relayed
+through a site are passed on with their original origin, so offices can
+also be chained.
+
+Stock is synced as movements, not levels. Every journal movement carries
+the site that recorded it and its id there; a site adds each movement it
+hasn't seen to its own level and journal. Adding deltas commutes, so two
+offices handing out the same item at the same time both count, and every
+site ends up with the same levels once it has seen the same movements.
+
+Employees are synced as their latest state. Each create, update and delete
+bumps the employee's row in employee_change with a new sequence number, the
+time and the site; a page of changes is the rows after the peer's last
+sequence, so a pull costs what changed since the previous one. Concurrent
+edits of one employee resolve to the newest (ties go to the higher site
+name) for the employee's fields.
+
+What employees hold follows the movements, so it always adds up with
+stock. A movement naming an employee also changes what they hold, and a
+state carries the per-site sums of the employee's movements it includes,
+so the winning state is merged with the movements the applying site has
+and it hasn't (a handout is kept through a concurrent edit). A delete
+carries those sums as of the delete, and each site returns what its own
+movements handed out that the deleting site hadn't seen. Movements are
+applied even when they take a level below zero; the pull reports it.
+
+A site that joins starts from a copy of another site's database with its
+own SITE_ID; movements from before sync existed have no origin and are
+never sent.
+"""
+import hmac
+import json
+import os
+import urllib.error
+import urllib.request
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from src.models.inventory import db, Employee, EmployeeItem, EmployeeChange, Stock, StockMovement, SyncPeer
+from src.item_catalog import get_item_catalog, get_employee_items, set_employee_items
+from src.stats_service import apply_stats_delta
+from src.stock_journal import record_movements, record_opening_balances, SITE_ID, HANDOUT, RETURN
+
+# Version of the page format; a site refuses pages of another version
+SYNC_FORMAT = 2
+# Shared secret sent as "Authorization: Bearer <token>"; sync is off without it
+SYNC_TOKEN = os.environ.get("SYNC_TOKEN")
+# Peers pulled by `flask sync` when none are given, comma separated base URLs
+SYNC_PEERS = [peer.strip() for peer in os.environ.get("SYNC_PEERS", "").split(",") if peer.strip()]
+SYNC_PAGE_SIZE = 1000
+MAX_SYNC_PAGE_SIZE = 5000
+SYNC_TIMEOUT = 30
+
+EMPLOYEE_SYNC_FIELDS = ("first_name", "last_name", "emergency_no", "blood_group", "department_name")
+
+class SyncError(Exception):
+    pass
+
+def require_site_id(peers=()):
+    """Refuse to sync without an explicit SITE_ID (raises SyncError).
+
+    Checked at startup when SYNC_TOKEN or SYNC_PEERS is set, and by
+    `flask sync` for the peers it is given: two offices falling back to
+    the same host name would take each other's movements for their own.
+    """
+    if (SYNC_TOKEN or SYNC_PEERS or peers) and not os.environ.get("SITE_ID"):
+        raise SyncError("SITE_ID must be set on every site that syncs; it names this site's movements")
+
+def migrate_sync_columns():
+    """Add the movement origin columns to journals created before sync, and delete snapshots"""
+    columns = [row[1] for row in db.session.execute(text("PRAGMA table_info(stock_movement)"))]
+    if "origin_site" not in columns:
+        db.session.execute(text("ALTER TABLE stock_movement ADD COLUMN origin_site VARCHAR(64)"))
+        db.session.execute(text("ALTER TABLE stock_movement ADD COLUMN origin_id INTEGER"))
+    columns = [row[1] for row in db.session.execute(text("PRAGMA table_info(employee_change)"))]
+    if "journal" not in columns:
+        db.session.execute(text("ALTER TABLE employee_change ADD COLUMN journal TEXT"))
+    db.session.commit()
+
+def sync_authorized(authorization):
+    """Whether an Authorization header carries the sync token"""
+    if not SYNC_TOKEN or not authorization:
+        return False
+    return hmac.compare_digest(authorization, f"Bearer {SYNC_TOKEN}")
+
+def encode_sync_cursor(movement_id, change_seq):
+    return f"{movement_id}-{change_seq}"
+
+def decode_sync_cursor(cursor):
+    """(last movement id, last employee change seq) of a cursor; the start for None"""
+    if not cursor:
+        return 0, 0
+    movement_id, _, change_seq = cursor.partition("-")
+    if not movement_id.isdigit() or not change_seq.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(movement_id), int(change_seq)
+
+def employee_journals(employee_ids):
+    """{employee_id: {origin site: {item_name: summed delta}}} of the synced movements of some employees"""
+    movement = StockMovement.__table__
+    stock = Stock.__table__
+    journals = {}
+    for employee_id, origin_site, item_name, delta in db.session.execute(
+        db.select(movement.c.employee_id, movement.c.origin_site, stock.c.item_name, db.func.sum(movement.c.delta))
+        .join(stock, stock.c.id == movement.c.stock_id)
+        .where(movement.c.employee_id.in_(employee_ids), movement.c.origin_site.is_not(None))
+        .group_by(movement.c.employee_id, movement.c.origin_site, movement.c.stock_id)
+    ):
+        if delta:
+            journals.setdefault(employee_id, {}).setdefault(origin_site, {})[item_name] = delta
+    return journals
+
+def record_employee_changes(employee_ids, deleted=False, changed_at=None, site=SITE_ID, journals=None):
+    """Mark employees as changed for sync, inside the caller's transaction (caller commits).
+
+    Each gets the next sequence number; the numbering is read by the same
+    statement that writes it, under the write lock, so sequences follow
+    commit order. A delete also keeps the employee's journal as it was
+    then (journals, or the current one for a local delete, whose returns
+    are already recorded).
+    """
+    if not employee_ids:
+        return
+    if deleted and journals is None:
+        journals = employee_journals(employee_ids)
+    change = EmployeeChange.__table__
+    next_seq = db.select(db.func.coalesce(db.func.max(change.c.seq), 0) + 1).scalar_subquery()
+    stmt = insert(change).values(
+        employee_id=db.bindparam("employee_id"), seq=next_seq, changed_at=changed_at or datetime.utcnow(),
+        site=site, deleted=deleted, journal=db.bindparam("journal")
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[change.c.employee_id],
+        set_={
+            "seq": stmt.excluded.seq,
+            "changed_at": stmt.excluded.changed_at,
+            "site": stmt.excluded.site,
+            "deleted": stmt.excluded.deleted,
+            "journal": stmt.excluded.journal
+        }
+    )
+    db.session.execute(stmt, [
+        {
+            "employee_id": employee_id,
+            "journal": json.dumps(journals.get(employee_id, {})) if deleted else None
+        }
+        for employee_id in employee_ids
+    ])
+
+def export_changes(cursor=None, limit=SYNC_PAGE_SIZE):
+    """The page of movements and employee changes after cursor, for GET /api/sync/changes"""
+    after_movement, after_change = decode_sync_cursor(cursor)
+    movement = StockMovement.__table__
+    stock = Stock.__table__
+
+    # Movements from before sync have no origin and stay local
+    movements = db.session.execute(
+        db.select(
+            movement.c.id, movement.c.origin_site, db.func.coalesce(movement.c.origin_id, movement.c.id),
+            stock.c.item_name, movement.c.delta, movement.c.reason, movement.c.employee_id
+        )
+        .join(stock, stock.c.id == movement.c.stock_id)
+        .where(movement.c.id > after_movement, movement.c.origin_site.is_not(None))
+        .order_by(movement.c.id).limit(limit)
+    ).all()
+
+    changes = db.session.execute(
+        db.select(EmployeeChange.__table__).where(EmployeeChange.seq > after_change)
+        .order_by(EmployeeChange.seq).limit(limit)
+    ).all()
+    changed_ids = [change.employee_id for change in changes]
+    employees = {
+        row.employee_id: row for row in db.session.execute(
+            db.select(Employee.__table__).where(Employee.employee_id.in_(changed_ids))
+        )
+    }
+    items = {}
+    for employee_id, item_name, quantity in db.session.execute(
+        db.select(EmployeeItem.employee_id, Stock.item_name, EmployeeItem.quantity)
+        .join(Stock, Stock.id == EmployeeItem.stock_id)
+        .where(EmployeeItem.employee_id.in_(changed_ids))
+    ):
+        items.setdefault(employee_id, {})[item_name] = quantity
+
+    journals = employee_journals(changed_ids)
+
+    employee_changes = []
+    for change in changes:
+        entry = {
+            "employee_id": change.employee_id,
+            "changed_at": change.changed_at.isoformat(),
+            "site": change.site,
+            "deleted": change.deleted or change.employee_id not in employees,
+            # The movements the state below includes; a delete's as of the delete
+            "journal": json.loads(change.journal) if change.journal else journals.get(change.employee_id, {})
+        }
+        if not entry["deleted"]:
+            employee = employees[change.employee_id]
+            entry["employee"] = {field: getattr(employee, field) for field in EMPLOYEE_SYNC_FIELDS}
+            entry["employee"]["created_at"] = employee.created_at.isoformat() if employee.created_at else None
+            entry["items"] = items.get(change.employee_id, {})
+        employee_changes.append(entry)
+
+    item_names = {row.item_name for row in movements}
+    for entry in employee_changes:
+        item_names.update(entry.get("items", {}))
+        for deltas in entry["journal"].values():
+            item_names.update(deltas)
+    danger_levels = dict(db.session.execute(
+        db.select(stock.c.item_name, stock.c.danger_level).where(stock.c.item_name.in_(item_names))
+    ).all())
+
+    return {
+        "format": SYNC_FORMAT,
+        "site": SITE_ID,
+        # [origin site, id there, item, delta, reason, employee_id]
+        "movements": [list(row[1:]) for row in movements],
+        "employees": employee_changes,
+        # Danger levels of the items named in this page, for items the puller doesn't have yet
+        "items": danger_levels,
+        "cursor": encode_sync_cursor(
+            movements[-1].id if movements else after_movement,
+            changes[-1].seq if changes else after_change
+        ),
+        "more": len(movements) == limit or len(changes) == limit
+    }
+
+def _ensure_items(danger_levels, item_names):
+    """{item_name: stock_id}, creating items this site doesn't have yet at quantity 0"""
+    catalog = get_item_catalog()
+    missing = [item_name for item_name in item_names if item_name not in catalog]
+    if missing:
+        db.session.add_all([
+            Stock(item_name=item_name, quantity=0, danger_level=danger_levels.get(item_name, 30))
+            for item_name in missing
+        ])
+        db.session.flush()
+        record_opening_balances()
+        catalog = get_item_catalog()
+    return catalog
+
+def _unseen_movements(movements):
+    """The movements of a page not recorded here yet, in page order"""
+    movement = StockMovement.__table__
+    seen = set()
+    by_site = {}
+    for origin_site, origin_id, *_ in movements:
+        by_site.setdefault(origin_site, []).append(origin_id)
+    for origin_site, origin_ids in by_site.items():
+        # A movement copied with the database keeps its id and has no origin_id
+        seen.update(db.session.execute(
+            db.select(movement.c.origin_site, db.func.coalesce(movement.c.origin_id, movement.c.id)).where(
+                movement.c.origin_site == origin_site,
+                db.or_(
+                    movement.c.origin_id.in_(origin_ids),
+                    db.and_(movement.c.origin_id.is_(None), movement.c.id.in_(origin_ids))
+                )
+            )
+        ).all())
+    return [
+        entry for entry in movements
+        if entry[0] != SITE_ID and (entry[0], entry[1]) not in seen
+    ]
+
+def _add_to_levels(totals):
+    """Add {item_name: delta} to stock levels, bumping each row's version"""
+    stock = Stock.__table__
+    delta = db.case(totals, value=stock.c.item_name)
+    db.session.execute(
+        stock.update().where(stock.c.item_name.in_(totals))
+        .values(quantity=stock.c.quantity + delta, version=stock.c.version + 1)
+    )
+
+def _add_to_holdings(holdings, catalog):
+    """Add {employee_id: {item_name: quantity}} to what employees hold; returns {item_name: net added}.
+
+    Only employees this site has are changed: a movement for one deleted
+    here is settled by the site that recorded it (see _apply_employee).
+    """
+    present = set(db.session.execute(
+        db.select(Employee.employee_id).where(Employee.employee_id.in_(holdings))
+    ).scalars())
+    rows = [
+        {"employee_id": employee_id, "stock_id": catalog[item_name], "quantity": quantity}
+        for employee_id in present for item_name, quantity in holdings[employee_id].items() if quantity
+    ]
+    if not rows:
+        return {}
+
+    allocation = EmployeeItem.__table__
+    stmt = insert(allocation)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[allocation.c.employee_id, allocation.c.stock_id],
+        set_={"quantity": allocation.c.quantity + stmt.excluded.quantity}
+    )
+    db.session.execute(stmt, rows)
+    db.session.execute(
+        allocation.delete().where(allocation.c.employee_id.in_(present), allocation.c.quantity == 0)
+    )
+    # Their kit changed, so an edit made from the state before must not pass If-Match
+    employee = Employee.__table__
+    db.session.execute(
+        employee.update().where(employee.c.employee_id.in_(present)).values(version=employee.c.version + 1)
+    )
+
+    item_deltas = {}
+    for employee_id in present:
+        for item_name, quantity in holdings[employee_id].items():
+            item_deltas[item_name] = item_deltas.get(item_name, 0) + quantity
+    return item_deltas
+
+def _apply_movements(movements, catalog):
+    """Add remote movements to levels, journal and the holdings of the employees they name.
+
+    Returns ({item_name: net stock delta}, {item_name: net held delta}).
+    """
+    totals = {}
+    holdings = {}
+    for _, _, item_name, delta, _, employee_id in movements:
+        totals[item_name] = totals.get(item_name, 0) + delta
+        if employee_id is not None:
+            # What leaves stock for an employee is held by them
+            held = holdings.setdefault(employee_id, {})
+            held[item_name] = held.get(item_name, 0) - delta
+    _add_to_levels(totals)
+    record_movements([
+        {
+            "stock_id": catalog[item_name],
+            "delta": delta,
+            "reason": reason,
+            "employee_id": employee_id,
+            "origin_site": origin_site,
+            "origin_id": origin_id
+        }
+        for origin_site, origin_id, item_name, delta, reason, employee_id in movements
+    ])
+    return totals, _add_to_holdings(holdings, catalog) if holdings else {}
+
+def _is_newer(entry, current):
+    """Whether a remote employee change beats the local one (None when there is none)"""
+    if current is None:
+        return True
+    return (datetime.fromisoformat(entry["changed_at"]), entry["site"]) > (current.changed_at, current.site)
+
+def _merged_items(entry, local):
+    """A remote state's items merged with this site's journal of the employee.
+
+    Movements only this site has seen are added to the state, and those
+    only the remote one has are taken off (they are added here when they
+    arrive), so a handout is never lost to a concurrent edit.
+    """
+    quantities = dict(entry["items"])
+    for journal, sign in ((local, 1), (entry["journal"], -1)):
+        for deltas in journal.values():
+            for item_name, delta in deltas.items():
+                quantities[item_name] = quantities.get(item_name, 0) - sign * delta
+    return quantities
+
+def _apply_employee(entry, catalog):
+    """Write one remote employee state.
+
+    Returns (employee count delta, {item_name: held delta}, {item_name: stock delta}).
+    """
+    employee_id = entry["employee_id"]
+    employee = db.session.get(Employee, employee_id)
+    held = get_employee_items(employee_id) if employee else {}
+    local = employee_journals([employee_id]).get(employee_id, {})
+
+    if entry["deleted"]:
+        # Each site returns what its own movements handed the employee that the
+        # deleting site hadn't seen (or takes back returns it had made too);
+        # the deleting site returned the rest
+        own = local.get(SITE_ID, {})
+        seen = entry["journal"].get(SITE_ID, {})
+        settle = {
+            item_name: seen.get(item_name, 0) - own.get(item_name, 0)
+            for item_name in {*own, *seen} if seen.get(item_name, 0) != own.get(item_name, 0)
+        }
+        if settle:
+            _add_to_levels(settle)
+            record_movements([
+                {
+                    "stock_id": catalog[item_name],
+                    "delta": delta,
+                    "reason": RETURN if delta > 0 else HANDOUT,
+                    "employee_id": employee_id
+                }
+                for item_name, delta in settle.items()
+            ])
+        if employee is None:
+            return 0, {}, settle
+        db.session.delete(employee)
+        return -1, {item_name: -quantity for item_name, quantity in held.items()}, settle
+
+    data = entry["employee"]
+    created = employee is None
+    if created:
+        employee = Employee(employee_id=employee_id)
+        if data.get("created_at"):
+            employee.created_at = datetime.fromisoformat(data["created_at"])
+        db.session.add(employee)
+    for field in EMPLOYEE_SYNC_FIELDS:
+        setattr(employee, field, data[field])
+    if not created:
+        # A local edit made from the state before this one must not pass If-Match
+        employee.version = Employee.version + 1
+    db.session.flush()
+
+    quantities = dict.fromkeys(held, 0)
+    quantities.update(_merged_items(entry, local))
+    set_employee_items(employee_id, quantities, catalog)
+    return (1 if created else 0), {
+        item_name: quantity - held.get(item_name, 0) for item_name, quantity in quantities.items()
+    }, {}
+
+def levels_below_zero(item_names):
+    """{item_name: quantity} of the given items whose level is negative"""
+    return dict(db.session.execute(
+        db.select(Stock.item_name, Stock.quantity).where(Stock.item_name.in_(item_names), Stock.quantity < 0)
+    ).all())
+
+def apply_changes(page):
+    """Apply a page from export_changes (caller commits).
+
+    Returns (applied movement count, {item_name: net stock delta}, ids of
+    employees written).
+    """
+    if page.get("format") != SYNC_FORMAT:
+        raise SyncError(f"Unsupported sync format {page.get('format')}, expected {SYNC_FORMAT}")
+
+    movements = _unseen_movements(page["movements"])
+    current = {
+        change.employee_id: change for change in db.session.execute(
+            db.select(EmployeeChange).where(
+                EmployeeChange.employee_id.in_([entry["employee_id"] for entry in page["employees"]])
+            )
+        ).scalars()
+    }
+    changes = [
+        entry for entry in page["employees"]
+        if entry["site"] != SITE_ID and _is_newer(entry, current.get(entry["employee_id"]))
+    ]
+
+    item_names = {entry[2] for entry in movements}
+    for entry in changes:
+        item_names.update(entry.get("items", {}))
+        for deltas in entry["journal"].values():
+            item_names.update(deltas)
+    catalog = _ensure_items(page.get("items", {}), item_names)
+
+    stock_totals, item_deltas = _apply_movements(movements, catalog) if movements else ({}, {})
+
+    employee_delta = 0
+    for entry in changes:
+        added, held_deltas, stock_deltas = _apply_employee(entry, catalog)
+        employee_delta += added
+        for item_name, delta in held_deltas.items():
+            item_deltas[item_name] = item_deltas.get(item_name, 0) + delta
+        for item_name, delta in stock_deltas.items():
+            stock_totals[item_name] = stock_totals.get(item_name, 0) + delta
+        # Keep the remote stamp, under a new local sequence so it is passed on
+        record_employee_changes(
+            [entry["employee_id"]], deleted=entry["deleted"],
+            changed_at=datetime.fromisoformat(entry["changed_at"]), site=entry["site"],
+            journals={entry["employee_id"]: entry["journal"]}
+        )
+    apply_stats_delta(employee_delta, item_deltas)
+    return len(movements), stock_totals, [entry["employee_id"] for entry in changes]
+
+def fetch_changes(peer_url, cursor, token=None, limit=SYNC_PAGE_SIZE):
+    """GET one page of a peer's changes"""
+    query = f"?limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+    request = urllib.request.Request(
+        peer_url.rstrip("/") + "/api/sync/changes" + query,
+        headers={"Authorization": f"Bearer {token or SYNC_TOKEN}", "Accept-Encoding": "identity"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=SYNC_TIMEOUT) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise SyncError(f"{peer_url} answered {e.code}: {e.read().decode(errors='replace')[:200]}")
+    except urllib.error.URLError as e:
+        raise SyncError(f"{peer_url} unreachable: {e.reason}")
+
+def pull_from_peer(peer_url, token=None, limit=SYNC_PAGE_SIZE, on_page=None):
+    """Apply everything a peer changed since the last pull; returns a summary.
+
+    The summary counts pages, movements and employees, and lists the items
+    the pull left below zero (below_zero). Each page is applied and its cursor saved in one transaction, so an
+    interrupted pull resumes where it stopped. on_page(stock_totals,
+    employee_ids) runs after each committed page.
+    """
+    peer = db.session.get(SyncPeer, peer_url)
+    cursor = peer.cursor if peer else None
+    summary = {"peer": peer_url, "pages": 0, "movements": 0, "employees": 0, "below_zero": {}}
+    touched = set()
+
+    while True:
+        page = fetch_changes(peer_url, cursor, token, limit)
+        try:
+            applied, stock_totals, employee_ids = apply_changes(page)
+            if peer is None:
+                peer = SyncPeer(peer_url=peer_url, cursor=page["cursor"])
+                db.session.add(peer)
+            peer.cursor = page["cursor"]
+            peer.synced_at = datetime.utcnow()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        cursor = page["cursor"]
+        summary["pages"] += 1
+        summary["movements"] += applied
+        summary["employees"] += len(employee_ids)
+        touched.update(stock_totals)
+        if on_page is not None:
+            on_page(stock_totals, employee_ids)
+        if not page["more"]:
+            # Movements already happened at their site, so they are applied
+            # even past zero; the levels that went negative are reported
+            summary["below_zero"] = levels_below_zero(touched)
+            return summary
@@ -1,10 +1,32 @@
 // Global variables
 const API_BASE_URL = "/api";
 
+// Columns the employee grid renders; requested explicitly from paged endpoints
+const EMPLOYEE_GRID_FIELDS = [
+    "employee_id", "first_name", "last_name", "department_name", "blood_group", "emergency_no",
+    "bag_quantity", "pen_quantity", "diary_quantity", "bottle_quantity",
+    "tshirt_s_quantity", "tshirt_m_quantity", "tshirt_l_quantity",
+    "tshirt_xl_quantity", "tshirt_xxl_quantity", "tshirt_xxxl_quantity"
+];
+const EMPLOYEE_PAGE_SIZE = 50;
+
 let pendingStockQuantity = 0;
+// Version of the item when the stock modal opened, sent back as If-Match
+let pendingStockVersion = null;
+// ETag of the employee open in the update modal, sent back as If-Match
+let updateEmployeeETag = null;
 let currentICardEmployeeId = null;
 let photoUploaded = false;
 
+// Paging state for the employee grid
+let employeeQuery = "";
+let employeeCursor = null;
+let employeeRequestSeq = 0;
+
+// Last known stock levels by item name, kept current by /api/events
+let stockItemsByName = {};
+let liveUpdates = null;
+
 // DOM elements
 const navItems = document.querySelectorAll(".nav-item");
 const pages = document.querySelectorAll(".page");
@@ -30,6 +52,7 @@ document.addEventListener("DOMContentLoaded", function() {
     initializeApp();
     setupEventListeners();
     loadDashboardData();
+    startLiveUpdates();
 });
 
 function initializeApp() {
@@ -49,6 +72,11 @@ function setupEventListeners() {
     // Search
     searchInput.addEventListener("input", debounce(handleSearch, 300));
 
+    // Next page of employees
+    document.getElementById("load-more-employees").addEventListener("click", () => {
+        loadMoreEmployees();
+    });
+
     // Add employee button
     addEmployeeBtn.addEventListener("click", () => {
         openAddEmployeeModal();
@@ -214,11 +242,17 @@ function showPage(pageName) {
         addEmployeeBtn.style.display = "none";
     }
 
-    // Load page-specific data
+    // Load page-specific data; while the event stream is up the last load is still current
     if (pageName === "stock") {
-        loadStock();
+        if (isLive() && Object.keys(stockItemsByName).length) {
+            displayStock(Object.values(stockItemsByName));
+        } else {
+            loadStock();
+        }
     } else if (pageName === "dashboard") {
-        loadDashboardData();
+        if (!isLive() || !Object.keys(stockItemsByName).length) {
+            loadDashboardData();
+        }
     }
 }
 
@@ -234,6 +268,7 @@ async function loadDashboardData() {
         const stockData = await stockResponse.json();
         const statsData = await statsResponse.json();
 
+        rememberStock(stockData.stock_items || []);
         updateDashboardStats(statsData);
         updateLowStockAlerts(stockData.low_stock_items || []);
         
@@ -297,6 +332,7 @@ async function loadStock() {
         const response = await fetch(`${API_BASE_URL}/stock`);
         const data = await response.json();
         
+        rememberStock(data.stock_items || []);
         displayStock(data.stock_items || []);
     } catch (error) {
         console.error("Error loading stock:", error);
@@ -340,16 +376,56 @@ function displayStock(stockItems) {
 }
 
 async function loadEmployees(searchQuery = "") {
+    employeeQuery = searchQuery;
+    employeeCursor = null;
+    await fetchEmployeePage(false);
+}
+
+async function loadMoreEmployees() {
+    if (employeeCursor) {
+        await fetchEmployeePage(true);
+    }
+}
+
+// Columnar responses name the fields once: {"columns": [...], "rows": [[...]]}
+function rowsToObjects(columns, rows) {
+    return rows.map(row => Object.fromEntries(columns.map((column, i) => [column, row[i]])));
+}
+
+async function fetchEmployeePage(append) {
+    // Drop responses that arrive after a newer search has been issued
+    const requestSeq = ++employeeRequestSeq;
     try {
         showLoading(true);
-        const url = searchQuery 
-            ? `${API_BASE_URL}/employees?search=${encodeURIComponent(searchQuery)}`
-            : `${API_BASE_URL}/employees`;
-            
+        const params = new URLSearchParams({
+            limit: EMPLOYEE_PAGE_SIZE,
+            fields: EMPLOYEE_GRID_FIELDS.join(","),
+            format: "columns"
+        });
+        if (append && employeeCursor) {
+            params.set("cursor", employeeCursor);
+        }
+
+        let url = `${API_BASE_URL}/employees?${params}`;
+        if (employeeQuery) {
+            params.set("q", employeeQuery);
+            url = `${API_BASE_URL}/employees/search?${params}`;
+        }
+
         const response = await fetch(url);
-        const employees = await response.json();
-        
-        displayEmployees(employees);
+        const page = await response.json();
+        const employees = rowsToObjects(page.columns || [], page.rows || []);
+        const nextCursor = page.next_cursor;
+
+        if (requestSeq !== employeeRequestSeq) {
+            return;
+        }
+        employeeCursor = nextCursor;
+        displayEmployees(employees, append);
+        document.getElementById("load-more-employees").style.display = employeeCursor ? "inline-flex" : "none";
+        if (page.truncated) {
+            showToast("Only the best matches are shown, refine the search to see others", "warning");
+        }
     } catch (error) {
         console.error("Error loading employees:", error);
         showToast("Error loading employees", "error");
@@ -358,10 +434,10 @@ async function loadEmployees(searchQuery = "") {
     }
 }
 
-function displayEmployees(employees) {
+function displayEmployees(employees, append = false) {
     const employeesGrid = document.getElementById("employees-grid");
     
-    if (employees.length === 0) {
+    if (employees.length === 0 && !append) {
         employeesGrid.innerHTML = `
             <div class="text-center" style="grid-column: 1 / -1; padding: 2rem;">
                 <h3>No employees found</h3>
@@ -371,67 +447,79 @@ function displayEmployees(employees) {
         return;
     }
 
-    employeesGrid.innerHTML = employees.map(employee => `
-        <div class="employee-card">
-            <div class="employee-header">
-                <div class="employee-info">
-                    <h3>${employee.first_name} ${employee.last_name}</h3>
-                </div>
-                <div class="employee-id">${employee.employee_id}</div>
-            </div>
-            <div class="employee-details">
-                <p><strong>Department:</strong> ${employee.department_name}</p>
-                <p><strong>Blood Group:</strong> ${employee.blood_group}</p>
-                <p><strong>Emergency No:</strong> ${employee.emergency_no}</p>
+    const cards = employees.map(renderEmployeeCard).join("");
+
+    if (append) {
+        employeesGrid.insertAdjacentHTML("beforeend", cards);
+    } else {
+        employeesGrid.innerHTML = cards;
+    }
+}
+
+function renderEmployeeCard(employee) {
+    return `
+    <div class="employee-card" data-employee-id="${employee.employee_id}">
+        <div class="employee-header">
+            <img class="employee-photo" src="/api/employees/${encodeURIComponent(employee.employee_id)}/photo?size=thumb"
+                 alt="" loading="lazy" width="48" height="48" onerror="this.remove()">
+            <div class="employee-info">
+                <h3>${employee.first_name} ${employee.last_name}</h3>
             </div>
-            <div class="employee-items">
-                <h4>Items Received</h4>
-                <div class="items-grid">
-                    <div class="item-badge ${employee.bag_quantity > 0 ? 'has-items' : ''}">
-                        Bag: ${employee.bag_quantity}
-                    </div>
-                    <div class="item-badge ${employee.pen_quantity > 0 ? 'has-items' : ''}">
-                        Pen: ${employee.pen_quantity}
-                    </div>
-                    <div class="item-badge ${employee.diary_quantity > 0 ? 'has-items' : ''}">
-                        Diary: ${employee.diary_quantity}
-                    </div>
-                    <div class="item-badge ${employee.bottle_quantity > 0 ? 'has-items' : ''}">
-                        Bottle: ${employee.bottle_quantity}
-                    </div>
-                    <div class="item-badge ${employee.tshirt_s_quantity > 0 ? 'has-items' : ''}">
-                        T-shirt S: ${employee.tshirt_s_quantity}
-                    </div>
-                    <div class="item-badge ${employee.tshirt_m_quantity > 0 ? 'has-items' : ''}">
-                        T-shirt M: ${employee.tshirt_m_quantity}
-                    </div>
-                    <div class="item-badge ${employee.tshirt_l_quantity > 0 ? 'has-items' : ''}">
-                        T-shirt L: ${employee.tshirt_l_quantity}
-                    </div>
-                    <div class="item-badge ${employee.tshirt_xl_quantity > 0 ? 'has-items' : ''}">
-                        T-shirt XL: ${employee.tshirt_xl_quantity}
-                    </div>
-                    <div class="item-badge ${employee.tshirt_xxl_quantity > 0 ? 'has-items' : ''}">
-                        T-shirt XXL: ${employee.tshirt_xxl_quantity}
-                    </div>
-                    <div class="item-badge ${employee.tshirt_xxxl_quantity > 0 ? 'has-items' : ''}">
-                        T-shirt XXXL: ${employee.tshirt_xxxl_quantity}
-                    </div>
+            <div class="employee-id">${employee.employee_id}</div>
+        </div>
+        <div class="employee-details">
+            <p><strong>Department:</strong> ${employee.department_name}</p>
+            <p><strong>Blood Group:</strong> ${employee.blood_group}</p>
+            <p><strong>Emergency No:</strong> ${employee.emergency_no}</p>
+        </div>
+        <div class="employee-items">
+            <h4>Items Received</h4>
+            <div class="items-grid">
+                <div class="item-badge ${employee.bag_quantity > 0 ? 'has-items' : ''}">
+                    Bag: ${employee.bag_quantity}
+                </div>
+                <div class="item-badge ${employee.pen_quantity > 0 ? 'has-items' : ''}">
+                    Pen: ${employee.pen_quantity}
+                </div>
+                <div class="item-badge ${employee.diary_quantity > 0 ? 'has-items' : ''}">
+                    Diary: ${employee.diary_quantity}
+                </div>
+                <div class="item-badge ${employee.bottle_quantity > 0 ? 'has-items' : ''}">
+                    Bottle: ${employee.bottle_quantity}
+                </div>
+                <div class="item-badge ${employee.tshirt_s_quantity > 0 ? 'has-items' : ''}">
+                    T-shirt S: ${employee.tshirt_s_quantity}
+                </div>
+                <div class="item-badge ${employee.tshirt_m_quantity > 0 ? 'has-items' : ''}">
+                    T-shirt M: ${employee.tshirt_m_quantity}
+                </div>
+                <div class="item-badge ${employee.tshirt_l_quantity > 0 ? 'has-items' : ''}">
+                    T-shirt L: ${employee.tshirt_l_quantity}
+                </div>
+                <div class="item-badge ${employee.tshirt_xl_quantity > 0 ? 'has-items' : ''}">
+                    T-shirt XL: ${employee.tshirt_xl_quantity}
+                </div>
+                <div class="item-badge ${employee.tshirt_xxl_quantity > 0 ? 'has-items' : ''}">
+                    T-shirt XXL: ${employee.tshirt_xxl_quantity}
+                </div>
+                <div class="item-badge ${employee.tshirt_xxxl_quantity > 0 ? 'has-items' : ''}">
+                    T-shirt XXXL: ${employee.tshirt_xxxl_quantity}
                 </div>
-            </div>
-            <div class="employee-actions">
-                <button class="btn btn-primary" onclick="openUpdateEmployeeModal('${employee.employee_id}')">
-                    <i class="fas fa-edit"></i> Update
-                </button>
-                <button class="btn btn-danger" onclick="deleteEmployee('${employee.employee_id}')">
-                    <i class="fas fa-trash"></i> Delete
-                </button>
-                <button class="btn btn-secondary" onclick="openICardModal('${employee.employee_id}')">
-                    <i class="fas fa-id-card"></i> I'card
-                </button>
             </div>
         </div>
-    `).join("");
+        <div class="employee-actions">
+            <button class="btn btn-primary" onclick="openUpdateEmployeeModal('${employee.employee_id}')">
+                <i class="fas fa-edit"></i> Update
+            </button>
+            <button class="btn btn-danger" onclick="deleteEmployee('${employee.employee_id}')">
+                <i class="fas fa-trash"></i> Delete
+            </button>
+            <button class="btn btn-secondary" onclick="openICardModal('${employee.employee_id}')">
+                <i class="fas fa-id-card"></i> I'card
+            </button>
+        </div>
+    </div>
+    `;
 }
 
 function openAddEmployeeModal() {
@@ -450,6 +538,7 @@ async function openUpdateEmployeeModal(employeeId) {
         showLoading(true);
         const response = await fetch(`${API_BASE_URL}/employees/${employeeId}`);
         const employee = await response.json();
+        updateEmployeeETag = response.headers.get("ETag");
 
         // Populate form with correct fields
         document.getElementById("update-employee-id").value = employee.employee_id;
@@ -519,6 +608,8 @@ function openUpdateStockModal(itemName, currentQuantity) {
     document.getElementById("stock-item-display").value = formatItemName(itemName);
     document.getElementById("adjust-amount").value = 1;
     pendingStockQuantity = currentQuantity;
+    // Taken now: live updates keep moving the remembered version while the modal is open
+    pendingStockVersion = stockItemsByName[itemName] ? stockItemsByName[itemName].version : null;
     document.getElementById("stock-current-quantity").textContent = pendingStockQuantity;
     showModal(updateStockModal);
 }
@@ -549,8 +640,10 @@ async function handleAddEmployee(e) {
         if (response.ok) {
             showToast("Employee added successfully!");
             closeModal(addEmployeeModal);
-            loadEmployees();
-            loadDashboardData();
+            if (!isLive()) {
+                loadEmployees();
+                loadDashboardData();
+            }
         } else {
             const error = await response.json();
             showToast(error.error || "Error adding employee", "error");
@@ -581,19 +674,27 @@ async function handleUpdateEmployee(e) {
         
         delete data.employee_id; // Remove from data as it's in the URL
         
+        const headers = { "Content-Type": "application/json" };
+        if (updateEmployeeETag) {
+            headers["If-Match"] = updateEmployeeETag;
+        }
         const response = await fetch(`${API_BASE_URL}/employees/${employeeId}`, {
             method: "PUT",
-            headers: {
-                "Content-Type": "application/json"
-            },
+            headers: headers,
             body: JSON.stringify(data)
         });
         
-        if (response.ok) {
+        if (response.status === 412) {
+            // Someone else saved this employee since the modal opened: show their version
+            showToast("This employee was changed by someone else; the form now shows their changes", "error");
+            await openUpdateEmployeeModal(employeeId);
+        } else if (response.ok) {
             showToast("Employee updated successfully!");
             closeModal(updateEmployeeModal);
-            loadEmployees();
-            loadDashboardData();
+            if (!isLive()) {
+                loadEmployees();
+                loadDashboardData();
+            }
         } else {
             const error = await response.json();
             showToast(error.error || "Error updating employee", "error");
@@ -611,16 +712,29 @@ async function handleUpdateStock(e) {
     try {
         showLoading(true);
         const itemName = document.getElementById("stock-item-name").value;
+        const headers = { "Content-Type": "application/json" };
+        if (pendingStockVersion) {
+            headers["If-Match"] = `"${pendingStockVersion}"`;
+        }
         const response = await fetch(`${API_BASE_URL}/stock/${itemName}`, {
             method: "PUT",
-            headers: { "Content-Type": "application/json" },
+            headers: headers,
             body: JSON.stringify({ quantity: pendingStockQuantity })
         });
-        if (response.ok) {
+        if (response.status === 412) {
+            // The level changed since the modal opened; start again from the current one
+            const current = await fetch(`${API_BASE_URL}/stock/${itemName}`).then(r => r.json());
+            rememberStock([current]);
+            refreshStockViews();
+            openUpdateStockModal(itemName, current.quantity);
+            showToast(`${formatItemName(itemName)} changed to ${current.quantity} meanwhile; adjust again`, "error");
+        } else if (response.ok) {
             showToast("Stock updated successfully!");
             closeModal(updateStockModal);
-            loadStock();
-            loadDashboardData();
+            if (!isLive()) {
+                loadStock();
+                loadDashboardData();
+            }
         } else {
             const error = await response.json();
             showToast(error.error || "Error updating stock", "error");
@@ -645,8 +759,10 @@ async function deleteEmployee(employeeId) {
         
         if (response.ok) {
             showToast("Employee deleted successfully!");
-            loadEmployees();
-            loadDashboardData();
+            if (!isLive()) {
+                loadEmployees();
+                loadDashboardData();
+            }
         } else {
             const error = await response.json();
             showToast(error.error || "Error deleting employee", "error");
@@ -731,7 +847,9 @@ async function handleAddStockItem(e) {
         if (response.ok) {
             showToast("Stock item added successfully!");
             closeModal(addStockItemModal);
-            loadStock();
+            if (!isLive()) {
+                loadStock();
+            }
         } else {
             const error = await response.json();
             showToast(error.error || "Error adding stock item", "error");
@@ -792,3 +910,97 @@ document.addEventListener('DOMContentLoaded', function() {
     };
 });
 
+// Live updates: apply pushed changes instead of re-fetching
+function startLiveUpdates() {
+    if (!window.EventSource) {
+        return;
+    }
+    liveUpdates = new EventSource(`${API_BASE_URL}/events`);
+
+    liveUpdates.addEventListener("stock", (e) => {
+        rememberStock(JSON.parse(e.data).items.map(level => ({
+            item_name: level.name,
+            quantity: level.quantity,
+            danger_level: level.danger_level,
+            version: level.version
+        })));
+        refreshStockViews();
+    });
+
+    liveUpdates.addEventListener("low_stock", (e) => {
+        const change = JSON.parse(e.data);
+        if (change.low) {
+            showToast(`${formatItemName(change.item.name)} is low on stock (${change.item.quantity} left)`, "error");
+        }
+    });
+
+    liveUpdates.addEventListener("stats", (e) => {
+        updateDashboardStats(JSON.parse(e.data));
+    });
+
+    liveUpdates.addEventListener("employee", (e) => {
+        applyEmployeeChange(JSON.parse(e.data));
+    });
+
+    liveUpdates.addEventListener("employees", () => {
+        // Bulk imports are announced once; re-read the grid if it is showing
+        if (isPageActive("employees")) {
+            loadEmployees(employeeQuery);
+        }
+    });
+
+    liveUpdates.addEventListener("resync", () => {
+        // Changes were missed (server restart or a long disconnect)
+        loadDashboardData();
+        if (isPageActive("stock")) {
+            loadStock();
+        }
+        if (isPageActive("employees")) {
+            loadEmployees(employeeQuery);
+        }
+    });
+}
+
+function isLive() {
+    return liveUpdates !== null && liveUpdates.readyState === EventSource.OPEN;
+}
+
+function isPageActive(pageName) {
+    return document.getElementById(`${pageName}-page`).classList.contains("active");
+}
+
+function rememberStock(stockItems) {
+    stockItems.forEach(item => {
+        stockItemsByName[item.item_name] = { ...stockItemsByName[item.item_name], ...item };
+    });
+}
+
+function refreshStockViews() {
+    const stockItems = Object.values(stockItemsByName);
+    updateLowStockAlerts(stockItems
+        .filter(item => item.quantity <= item.danger_level)
+        .map(item => ({ name: item.item_name, quantity: item.quantity, danger_level: item.danger_level })));
+    if (isPageActive("stock")) {
+        displayStock(stockItems);
+    }
+}
+
+function applyEmployeeChange(change) {
+    const employeesGrid = document.getElementById("employees-grid");
+    const employeeId = change.employee ? change.employee.employee_id : change.employee_id;
+    const card = employeesGrid.querySelector(`.employee-card[data-employee-id="${CSS.escape(employeeId)}"]`);
+
+    if (change.action === "deleted") {
+        if (card) {
+            card.remove();
+        }
+    } else if (card) {
+        card.outerHTML = renderEmployeeCard(change.employee);
+    } else if (change.action === "created" && !employeeQuery && !employeeCursor && isPageActive("employees")) {
+        // Grid is in joining order and fully loaded, so the newcomer goes last
+        if (!employeesGrid.querySelector(".employee-card")) {
+            employeesGrid.innerHTML = "";
+        }
+        employeesGrid.insertAdjacentHTML("beforeend", renderEmployeeCard(change.employee));
+    }
+}
@@ -0,0 +1,401 @@
+"""Build step for the static files of the web app.
+
+Every file under src/static is written to src/static_build under a name
+carrying a hash of its content (css/styles.3f9a1c2e07.css), so a built
+URL never changes meaning and browsers may keep it for good. Stylesheets
+and scripts are minified, stylesheets get their url() references rewritten
+to the built names, and the TTF fonts they use get a Latin WOFF2 subset
+next to them (with fontTools and brotli installed). Text formats are
+precompressed to .gz and, with brotli installed, .br. manifest.json maps
+each source path to its built file; main.py serves those with
+Cache-Control: immutable and the encoding the browser accepts, and
+url_for('static', ...) hands out the built names.
+
+Files from the previous build are kept, so pages loaded before a deploy
+can still fetch theirs. A source edited after the build is served from
+src/static again (with the mtime ?v= URL) until the next build.
+
+    python src/static_assets.py
+    python src/static_assets.py --build-dir /tmp/static_build
+"""
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import posixpath
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# fontTools takes over 100ms to import, so only the build loads it (for WOFF2)
+WOFF2_AVAILABLE = brotli is not None and importlib.util.find_spec("fontTools") is not None
+
+SRC_FOLDER = os.path.dirname(os.path.abspath(__file__))
+STATIC_FOLDER = os.path.join(SRC_FOLDER, "static")
+BUILD_FOLDER = os.path.join(SRC_FOLDER, "static_build")
+MANIFEST_NAME = "manifest.json"
+
+# Design sources, not served to browsers
+SKIP_EXTENSIONS = {".eps"}
+# Formats worth precompressing; images like PNG are compressed already
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".ttf", ".otf", ".json", ".txt", ".html"}
+# A precompressed copy is kept only if it saves at least this fraction
+MIN_COMPRESSION_SAVING = 0.1
+HASH_LENGTH = 10
+# File name suffix of each precompressed copy
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# Glyphs kept in the WOFF2 subsets: Latin-1, general punctuation and a few
+# symbols; anything else falls back to the TTF listed after it
+WOFF2_UNICODES = "U+0000-00FF,U+0131,U+0152-0153,U+02C6,U+02DA,U+02DC,U+2000-206F,U+20AC,U+2122"
+
+CSS_URL = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)(\s*format\((['\"])truetype\4\))?")
+
+# Characters after which a / starts a regular expression rather than a division
+JS_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+JS_REGEX_KEYWORDS = {
+    "return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw", "instanceof", "yield", "await"
+}
+
+def _is_identifier_char(char):
+    return char.isalnum() or char in "_$\\" or ord(char) > 127
+
+def _copy_quoted(source, start, quote):
+    """Index just past the string literal opening at start"""
+    index = start + 1
+    while index < len(source) and source[index] != quote:
+        index += 2 if source[index] == "\\" else 1
+    return index + 1
+
+def minify_css(source):
+    """Drop comments and the whitespace CSS doesn't need; strings are kept as written"""
+    out = []
+    pending_space = False
+    index = 0
+    while index < len(source):
+        char = source[index]
+        if source.startswith("/*", index):
+            end = source.find("*/", index + 2)
+            index = len(source) if end < 0 else end + 2
+            pending_space = True
+            continue
+        if char.isspace():
+            pending_space = True
+            index += 1
+            continue
+        if pending_space and out and out[-1][-1] not in "{};,>(:" and char not in "{};,>)":
+            out.append(" ")
+        pending_space = False
+        if char in "'\"":
+            end = _copy_quoted(source, index, char)
+            out.append(source[index:end])
+            index = end
+            continue
+        if char == "}" and out and out[-1] == ";":
+            out.pop()
+        out.append(char)
+        index += 1
+    return "".join(out)
+
+def minify_js(source):
+    """Drop comments and collapse whitespace outside strings, templates and regular expressions.
+
+    Line breaks are kept wherever automatic semicolon insertion could depend
+    on them, so this never changes what the script means.
+    """
+    out = []
+    # Brace depth at which each open ${ ... } returns to its template literal
+    templates = []
+    depth = 0
+    pending = ""
+    index = 0
+    length = len(source)
+
+    def last_char():
+        return out[-1][-1] if out else ""
+
+    def last_word():
+        match = re.search(r"[A-Za-z_$][\w$]*$", out[-1]) if out else None
+        return match.group(0) if match else ""
+
+    def emit(token):
+        nonlocal pending
+        if pending and out:
+            previous, following = last_char(), token[0]
+            if pending == "\n" and previous not in "{[(,;" and following not in "}]),;.":
+                out.append("\n")
+            elif (_is_identifier_char(previous) and _is_identifier_char(following)) or (
+                previous in "+-" and following in "+-"
+            ):
+                out.append(" ")
+        pending = ""
+        out.append(token)
+
+    def copy_template(start):
+        """Index past the template text starting at start, stopping after a ${"""
+        nonlocal depth
+        position = start
+        while position < length:
+            if source[position] == "\\":
+                position += 2
+            elif source[position] == "`":
+                return position + 1
+            elif source.startswith("${", position):
+                templates.append(depth)
+                depth += 1
+                return position + 2
+            else:
+                position += 1
+        return position
+
+    while index < length:
+        char = source[index]
+        if char.isspace():
+            if char == "\n" or pending == "\n":
+                pending = "\n"
+            else:
+                pending = " "
+            index += 1
+        elif source.startswith("//", index):
+            end = source.find("\n", index)
+            index = length if end < 0 else end
+        elif source.startswith("/*", index):
+            end = source.find("*/", index + 2)
+            comment = source[index:length if end < 0 else end]
+            pending = "\n" if "\n" in comment or pending == "\n" else (pending or " ")
+            index = length if end < 0 else end + 2
+        elif char in "'\"":
+            end = _copy_quoted(source, index, char)
+            emit(source[index:end])
+            index = end
+        elif char == "`":
+            end = copy_template(index + 1)
+            emit(source[index:end])
+            index = end
+        elif char == "}" and templates and depth - 1 == templates[-1]:
+            # End of a ${ ... }: back into the template literal's text
+            templates.pop()
+            depth -= 1
+            end = copy_template(index + 1)
+            emit(source[index:end])
+            index = end
+        elif char == "/" and (not out or last_char() in JS_REGEX_PRECEDERS or last_word() in JS_REGEX_KEYWORDS):
+            position = index + 1
+            in_class = False
+            while position < length and (source[position] != "/" or in_class):
+                if source[position] == "\\":
+                    position += 1
+                elif source[position] == "[":
+                    in_class = True
+                elif source[position] == "]":
+                    in_class = False
+                position += 1
+            position += 1
+            while position < length and _is_identifier_char(source[position]):
+                position += 1
+            emit(source[index:position])
+            index = position
+        elif _is_identifier_char(char):
+            # Words and numbers as one token, so last_word sees keywords whole
+            end = index + 1
+            while end < length and (_is_identifier_char(source[end]) or (source[end] == "." and char.isdigit())):
+                end += 1
+            emit(source[index:end])
+            index = end
+        else:
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+            emit(char)
+            index += 1
+    return "".join(out).strip() + "\n"
+
+def subset_woff2(data):
+    """A WOFF2 of the font keeping the WOFF2_UNICODES glyphs"""
+    from fontTools import subset as font_subset
+    options = font_subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    font = font_subset.load_font(io.BytesIO(data), options)
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(unicodes=font_subset.parse_unicodes(WOFF2_UNICODES))
+    subsetter.subset(font)
+    output = io.BytesIO()
+    font_subset.save_font(font, output, options)
+    return output.getvalue()
+
+def fingerprinted_name(path, data):
+    stem, extension = posixpath.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}"
+
+def precompress(data):
+    """{encoding: compressed bytes} worth storing next to data"""
+    variants = {"gzip": gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+    return {
+        encoding: compressed for encoding, compressed in variants.items()
+        if len(compressed) <= len(data) * (1 - MIN_COMPRESSION_SAVING)
+    }
+
+def _source_files(static_folder):
+    for folder, _, files in os.walk(static_folder):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SKIP_EXTENSIONS:
+                continue
+            full_path = os.path.join(folder, name)
+            yield os.path.relpath(full_path, static_folder).replace(os.sep, "/"), full_path
+
+def _rewrite_css_urls(css, css_path, entries):
+    """Point url() references of a stylesheet at built files (WOFF2 first for TTF fonts)"""
+    folder = posixpath.dirname(css_path)
+
+    def built_url(path):
+        return posixpath.relpath(entries[path]["file"], folder)
+
+    def replace(match):
+        url = match.group(2)
+        if ":" in url or url.startswith("/"):
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(folder, url))
+        if path not in entries:
+            return match.group(0)
+        woff2 = posixpath.splitext(path)[0] + ".woff2"
+        if match.group(3) and woff2 in entries:
+            return f"url('{built_url(woff2)}') format('woff2'), url('{built_url(path)}') format('truetype')"
+        return f"url('{built_url(path)}'){match.group(3) or ''}"
+
+    return CSS_URL.sub(replace, css)
+
+def _css_font_paths(static_folder):
+    """Source paths of the TTF fonts referenced by stylesheets"""
+    fonts = set()
+    for path, full_path in _source_files(static_folder):
+        if path.endswith(".css"):
+            with open(full_path, encoding="utf-8") as css:
+                for match in CSS_URL.finditer(css.read()):
+                    if match.group(3):
+                        fonts.add(posixpath.normpath(posixpath.join(posixpath.dirname(path), match.group(2))))
+    return fonts
+
+def build_assets(static_folder=STATIC_FOLDER, build_folder=BUILD_FOLDER):
+    """Build every static file into build_folder and write its manifest; returns the manifest entries"""
+    previous = load_asset_manifest(build_folder, static_folder)
+    entries = {}
+    outputs = {}
+
+    def add(path, source, data):
+        stat = os.stat(source)
+        built = fingerprinted_name(path, data)
+        entries[path] = {
+            "file": built,
+            "source": posixpath.relpath(source.replace(os.sep, "/"), static_folder.replace(os.sep, "/")),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "encodings": []
+        }
+        outputs[built] = data
+        if posixpath.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            for encoding, compressed in precompress(data).items():
+                entries[path]["encodings"].append(encoding)
+                outputs[built + ENCODING_SUFFIXES[encoding]] = compressed
+
+    fonts = _css_font_paths(static_folder) if WOFF2_AVAILABLE else set()
+    stylesheets = []
+    for path, full_path in _source_files(static_folder):
+        with open(full_path, "rb") as source:
+            data = source.read()
+        if path.endswith(".css"):
+            # After everything else, so the files they reference have their names
+            stylesheets.append((path, full_path, data))
+            continue
+        if path.endswith(".js"):
+            data = minify_js(data.decode("utf-8")).encode("utf-8")
+        add(path, full_path, data)
+        if path in fonts:
+            add(posixpath.splitext(path)[0] + ".woff2", full_path, subset_woff2(data))
+    for path, full_path, data in stylesheets:
+        css = _rewrite_css_urls(data.decode("utf-8"), path, entries)
+        add(path, full_path, minify_css(css).encode("utf-8"))
+
+    for name, data in outputs.items():
+        target = os.path.join(build_folder, *name.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as output:
+            output.write(data)
+    manifest_path = os.path.join(build_folder, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as manifest:
+        json.dump(entries, manifest, indent=2, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    # Keep this build and the previous one; drop anything older
+    keep = set(outputs) | {MANIFEST_NAME}
+    if previous is not None:
+        for entry in previous.entries.values():
+            keep.add(entry["file"])
+            keep.update(entry["file"] + ENCODING_SUFFIXES[encoding] for encoding in entry["encodings"])
+    for folder, _, files in os.walk(build_folder):
+        for name in files:
+            full_path = os.path.join(folder, name)
+            if os.path.relpath(full_path, build_folder).replace(os.sep, "/") not in keep:
+                os.remove(full_path)
+    return entries
+
+class AssetManifest:
+    """The built names of the static files, as written by build_assets"""
+
+    def __init__(self, build_folder, static_folder, entries):
+        self.build_folder = build_folder
+        self.static_folder = static_folder
+        self.entries = entries
+        self.built = {entry["file"]: entry for entry in entries.values()}
+
+    def built_name(self, filename):
+        """The built file for a source path, or None if it wasn't built or has changed since"""
+        entry = self.entries.get(filename)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(os.path.join(self.static_folder, entry["source"]))
+        except OSError:
+            return None
+        if (stat.st_mtime_ns, stat.st_size) != (entry["mtime_ns"], entry["size"]):
+            return None
+        return entry["file"]
+
+    def encodings(self, built_name):
+        """Precompressed encodings stored for a built file; None if it isn't one"""
+        entry = self.built.get(built_name)
+        return None if entry is None else entry["encodings"]
+
+def load_asset_manifest(build_folder=BUILD_FOLDER, static_folder=STATIC_FOLDER):
+    """The manifest of a build, or None when nothing has been built there"""
+    try:
+        with open(os.path.join(build_folder, MANIFEST_NAME), encoding="utf-8") as manifest:
+            entries = json.load(manifest)
+    except (OSError, ValueError):
+        return None
+    return AssetManifest(build_folder, static_folder, entries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--static-dir", default=STATIC_FOLDER)
+    parser.add_argument("--build-dir", default=BUILD_FOLDER)
+    args = parser.parse_args()
+
+    entries = build_assets(args.static_dir, args.build_dir)
+    for path, entry in sorted(entries.items()):
+        print(f"{path} -> {entry['file']} {' '.join(entry['encodings'])}")
+    if brotli is None:
+        print("brotli is not installed: built gzip copies only (pip install brotli)")
+    if not WOFF2_AVAILABLE:
+        print("fontTools or brotli is not installed: no WOFF2 fonts built")
+    sys.exit(0)
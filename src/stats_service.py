@@ -0,0 +1,85 @@
+from sqlalchemy.dialects.sqlite import insert
+from src.models.inventory import db, Employee, EmployeeItem, Stock, StatsRollup
+
+# Rollup key holding the employee count; every other key is a stock item name
+EMPLOYEE_COUNT_KEY = "__employees__"
+
+TSHIRT_SIZES = {
+    "S": "tshirt_s",
+    "M": "tshirt_m",
+    "L": "tshirt_l",
+    "XL": "tshirt_xl",
+    "XXL": "tshirt_xxl",
+    "XXXL": "tshirt_xxxl"
+}
+
+def scan_distribution_totals():
+    """Compute the employee count and every per-item total (one GROUP BY over allocations)"""
+    totals = {EMPLOYEE_COUNT_KEY: db.session.execute(db.select(db.func.count()).select_from(Employee)).scalar()}
+    totals.update(dict.fromkeys(db.session.execute(db.select(Stock.item_name)).scalars(), 0))
+    totals.update(db.session.execute(
+        db.select(Stock.item_name, db.func.sum(EmployeeItem.quantity))
+        .join(Stock, Stock.id == EmployeeItem.stock_id)
+        .group_by(EmployeeItem.stock_id)
+    ).all())
+    return totals
+
+def rebuild_stats_rollup():
+    """Replace the rollup with totals freshly scanned from the Employee table"""
+    totals = scan_distribution_totals()
+    db.session.execute(db.delete(StatsRollup))
+    db.session.execute(
+        db.insert(StatsRollup),
+        [{"key": key, "value": value} for key, value in totals.items()]
+    )
+    return totals
+
+def apply_stats_delta(employee_delta=0, item_deltas=None):
+    """Add deltas to the rollup inside the caller's transaction (caller commits)"""
+    params = []
+    if employee_delta:
+        params.append({"key": EMPLOYEE_COUNT_KEY, "value": employee_delta})
+    for item_name, delta in (item_deltas or {}).items():
+        if delta:
+            params.append({"key": item_name, "value": int(delta)})
+
+    if not params:
+        return
+
+    table = StatsRollup.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.key],
+        set_={"value": table.c.value + stmt.excluded.value}
+    )
+    db.session.execute(stmt, params)
+
+def get_distribution_totals():
+    """Read the rollup, rebuilding it first if it has never been populated"""
+    totals = dict(db.session.execute(db.select(StatsRollup.key, StatsRollup.value)).all())
+    if EMPLOYEE_COUNT_KEY not in totals:
+        totals = rebuild_stats_rollup()
+        db.session.commit()
+    return totals
+
+def build_employee_stats():
+    """Shape rollup totals into the /api/employees/stats response"""
+    totals = get_distribution_totals()
+
+    tshirt_sizes_distributed = {
+        size: totals.get(item_name, 0) for size, item_name in TSHIRT_SIZES.items()
+    }
+
+    return {
+        "total_employees": totals[EMPLOYEE_COUNT_KEY],
+        "bags_distributed": totals.get("bag", 0),
+        "pens_distributed": totals.get("pen", 0),
+        "diaries_distributed": totals.get("diary", 0),
+        "bottles_distributed": totals.get("bottle", 0),
+        "tshirts_distributed": sum(tshirt_sizes_distributed.values()),
+        "tshirt_sizes_distributed": tshirt_sizes_distributed,
+        # Every catalog item, including ones added after the fixed fields above
+        "items_distributed": {
+            key: value for key, value in totals.items() if key != EMPLOYEE_COUNT_KEY
+        }
+    }
@@ -0,0 +1,117 @@
+import mmap
+import os
+import struct
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development server only
+    fcntl = None
+
+# Shared by every worker on the host; override to keep it off a network filesystem
+STOCK_VERSION_FILE = os.environ.get(
+    "STOCK_VERSION_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "database", "stock.version")
+)
+
+# Session.info key set by stock writes; the version is bumped once they commit
+STOCK_DIRTY_KEY = "stock_dirty"
+
+# epoch (random, fixed when the file is created) and counter, both unsigned 64-bit
+_LAYOUT = struct.Struct("<QQ")
+
+class VersionCounter:
+    """A counter in a small memory-mapped file, readable by all processes without a syscall.
+
+    Increments take an exclusive flock so workers never hand out the same
+    version. The epoch is picked when the file is created, so versions from
+    a deleted and recreated file never collide with ones clients have seen.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._map = None
+
+    def _open(self):
+        if self._map is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                self._flock(fd, True)
+                if os.fstat(fd).st_size < _LAYOUT.size:
+                    os.write(fd, _LAYOUT.pack(struct.unpack("<Q", os.urandom(8))[0], 0))
+                self._flock(fd, False)
+                self._map = mmap.mmap(fd, _LAYOUT.size)
+            finally:
+                os.close(fd)
+        return self._map
+
+    def _flock(self, fd, exclusive):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_UN)
+
+    def read(self):
+        """(epoch, counter)"""
+        return _LAYOUT.unpack(self._open()[:_LAYOUT.size])
+
+    def bump(self):
+        mapping = self._open()
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR)
+            try:
+                self._flock(fd, True)
+                epoch, counter = _LAYOUT.unpack(mapping[:_LAYOUT.size])
+                mapping[:_LAYOUT.size] = _LAYOUT.pack(epoch, counter + 1)
+                self._flock(fd, False)
+            finally:
+                os.close(fd)
+        return epoch, counter + 1
+
+class StockCache:
+    """The latest rendered stock snapshot of this process, keyed by the shared version"""
+
+    def __init__(self, counter):
+        self.counter = counter
+        self._lock = threading.Lock()
+        self._entry = None
+
+    def etag(self):
+        epoch, counter = self.counter.read()
+        return f"{epoch:x}-{counter}"
+
+    def get(self, build):
+        """(etag, body) for the current version, calling build() to make the body on a miss.
+
+        The version is read before building, so a write committing meanwhile
+        leaves at worst newer data under the old version, never older data
+        under the new one.
+        """
+        etag = self.etag()
+        entry = self._entry
+        if entry is not None and entry[0] == etag:
+            return entry
+        body = build()
+        with self._lock:
+            self._entry = (etag, body)
+        return etag, body
+
+    def invalidate(self):
+        self.counter.bump()
+
+stock_cache = StockCache(VersionCounter(STOCK_VERSION_FILE))
+
+def mark_stock_changed(session):
+    """Flag a session whose transaction writes stock; the cache is invalidated when it commits"""
+    session.info[STOCK_DIRTY_KEY] = True
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop(STOCK_DIRTY_KEY, False):
+        stock_cache.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_writes(session):
+    session.info.pop(STOCK_DIRTY_KEY, None)
@@ -0,0 +1,108 @@
+import math
+from datetime import datetime, timedelta
+from src.models.inventory import db, Stock, StockMovement
+from src.stock_journal import HANDOUT, RETURN
+
+# Days of journal a forecast looks back over
+FORECAST_HISTORY_DAYS = 90
+MAX_HISTORY_DAYS = 730
+# Recent days weigh more, so a hiring wave shows up within a week or two
+FORECAST_HALF_LIFE_DAYS = 14
+# Days between ordering an item and having it on the shelf
+DEFAULT_LEAD_DAYS = 7
+# Safety stock covers demand up to this many standard deviations above the
+# forecast over the lead time (1.65 is about a 95% chance of not running out)
+SAFETY_FACTOR = 1.65
+
+def daily_consumption(start, days):
+    """{stock_id: [units consumed on each of the days days from start]}, handouts net of returns.
+
+    One query sums each item's day from the (stock_id, created_at, reason,
+    delta) index, so the work is a range scan of the window's movements and
+    Python only sees items x days. Grouping by date(created_at) instead
+    would sort every movement in a temporary B-tree, several times slower.
+    """
+    movement = StockMovement.__table__
+    stock = Stock.__table__
+    day_numbers = db.select(db.literal(0).label("n")).cte("day_numbers", recursive=True)
+    day_numbers = day_numbers.union_all(
+        db.select(day_numbers.c.n + 1).where(day_numbers.c.n < days - 1)
+    )
+
+    # Day bounds as text: created_at is stored as "YYYY-MM-DD HH:MM:SS.ffffff"
+    first_day = start.date().isoformat()
+    day_start = db.func.date(first_day, db.literal("+").concat(day_numbers.c.n).concat(" days"))
+    day_end = db.func.date(day_start, "+1 day")
+    total = db.select(db.func.sum(movement.c.delta)).where(
+        movement.c.stock_id == stock.c.id,
+        movement.c.created_at >= day_start,
+        movement.c.created_at < day_end,
+        movement.c.reason.in_((HANDOUT, RETURN))
+    ).scalar_subquery()
+
+    rows = db.session.execute(
+        db.select(stock.c.id, day_numbers.c.n, total).select_from(stock.join(day_numbers, db.true()))
+    ).all()
+    series = {}
+    for stock_id, day, delta in rows:
+        # Handouts are negative deltas
+        series.setdefault(stock_id, [0] * days)[day] = -(delta or 0)
+    return series
+
+def _journal_starts(stock_ids):
+    """{stock_id: time of the item's first movement}; one index seek per item"""
+    movement = StockMovement.__table__
+    return {
+        stock_id: db.session.execute(
+            db.select(db.func.min(movement.c.created_at)).where(movement.c.stock_id == stock_id)
+        ).scalar()
+        for stock_id in stock_ids
+    }
+
+def forecast_demand(series, half_life=FORECAST_HALF_LIFE_DAYS):
+    """(daily rate, daily standard deviation) of a consumption series, weighted towards its end"""
+    if not series:
+        return 0.0, 0.0
+    last = len(series) - 1
+    weights = [0.5 ** ((last - index) / half_life) for index in range(len(series))]
+    total = sum(weights)
+    rate = sum(weight * value for weight, value in zip(weights, series)) / total
+    variance = sum(weight * (value - rate) ** 2 for weight, value in zip(weights, series)) / total
+    return max(rate, 0.0), math.sqrt(variance)
+
+def reorder_point(rate, deviation, lead_days=DEFAULT_LEAD_DAYS):
+    """Stock level at which to reorder: expected lead-time demand plus safety stock"""
+    return math.ceil(rate * lead_days + SAFETY_FACTOR * deviation * math.sqrt(lead_days))
+
+def build_stock_forecast(history_days=FORECAST_HISTORY_DAYS, lead_days=DEFAULT_LEAD_DAYS, now=None):
+    """Days of cover and a reorder point for every stock item, from its recent consumption"""
+    now = now or datetime.utcnow()
+    # Whole days only: today's count is still growing and would read as a slowdown
+    start = datetime.combine(now.date() - timedelta(days=history_days), datetime.min.time())
+    series = daily_consumption(start, history_days)
+    starts = _journal_starts(series)
+
+    items = []
+    for item in Stock.query.order_by(Stock.item_name).all():
+        # Days before an item's journal began say nothing about its demand
+        first = starts.get(item.id)
+        skipped = (first.date() - start.date()).days if first and first > start else 0
+        history = series.get(item.id, [])[skipped:]
+        rate, deviation = forecast_demand(history)
+        point = reorder_point(rate, deviation, lead_days)
+        items.append({
+            "item_name": item.item_name,
+            "quantity": item.quantity,
+            "danger_level": item.danger_level,
+            "daily_consumption": round(rate, 2),
+            "days_of_cover": round(item.quantity / rate, 1) if rate > 0 else None,
+            "reorder_point": point,
+            "reorder": item.quantity <= point,
+            "history_days": len(history)
+        })
+    return {
+        "generated_at": now.isoformat(),
+        "history_days": history_days,
+        "lead_days": lead_days,
+        "items": items
+    }
@@ -0,0 +1,261 @@
+import os
+import socket
+from datetime import datetime
+from src.models.inventory import db, Stock, StockMovement, StockCheckpoint
+from src.stock_cache import mark_stock_changed
+from src.row_version import VersionConflictError
+
+# Movement reasons
+OPENING = "opening"
+HANDOUT = "handout"
+RETURN = "return"
+RESTOCK = "restock"
+CORRECTION = "correction"
+
+# An item gets a new checkpoint once this many movements follow its last one,
+# so a point-in-time query never sums more than this many rows
+CHECKPOINT_INTERVAL = 1000
+
+# This installation's name in multi-site sync (src/site_sync.py); every
+# movement recorded here is stamped with it. Must differ between offices,
+# so a site that syncs has to set it (site_sync.require_site_id); the host
+# name only stands in for a lone install.
+SITE_ID = os.environ.get("SITE_ID") or socket.gethostname()
+
+# Raw INSERTs store timestamps in the same text format as the ORM columns
+_CREATED_AT = db.bindparam("created_at", type_=db.DateTime)
+
+def _last_checkpoint(stock_id, at=None):
+    """(created_at, movement_id, quantity) of the newest checkpoint (at or before at), or None"""
+    checkpoint = StockCheckpoint.__table__
+    stmt = (
+        db.select(checkpoint.c.created_at, checkpoint.c.movement_id, checkpoint.c.quantity)
+        .where(checkpoint.c.stock_id == stock_id)
+        .order_by(checkpoint.c.created_at.desc(), checkpoint.c.movement_id.desc())
+        .limit(1)
+    )
+    if at is not None:
+        stmt = stmt.where(checkpoint.c.created_at <= at)
+    return db.session.execute(stmt).first()
+
+def _tail(stock_id, checkpoint, at=None):
+    """Movements of one item after a checkpoint (all of them when checkpoint is None)"""
+    movement = StockMovement.__table__
+    conditions = [movement.c.stock_id == stock_id]
+    if checkpoint is not None:
+        # After (created_at, movement_id) in journal order; the >= bounds the index range
+        conditions += [
+            movement.c.created_at >= checkpoint.created_at,
+            db.or_(movement.c.created_at > checkpoint.created_at, movement.c.id > checkpoint.movement_id)
+        ]
+    if at is not None:
+        conditions.append(movement.c.created_at <= at)
+    return conditions
+
+def record_movements(movements, created_at=None):
+    """Append movements to the journal inside the caller's transaction (caller commits).
+
+    movements are dicts with stock_id, delta, reason and optionally
+    employee_id, and origin_site/origin_id for movements received from
+    another site. Items whose journal has grown CHECKPOINT_INTERVAL
+    movements past their last checkpoint get a new one in the same
+    transaction.
+    """
+    movements = [movement for movement in movements if movement["delta"] or movement["reason"] == OPENING]
+    if not movements:
+        return
+
+    mark_stock_changed(db.session)
+    created_at = created_at or datetime.utcnow()
+    db.session.execute(db.insert(StockMovement), [
+        {
+            "stock_id": movement["stock_id"],
+            "delta": int(movement["delta"]),
+            "reason": movement["reason"],
+            "employee_id": movement.get("employee_id"),
+            "created_at": created_at,
+            "origin_site": movement.get("origin_site", SITE_ID),
+            "origin_id": movement.get("origin_id")
+        }
+        for movement in movements
+    ])
+    create_checkpoints({movement["stock_id"] for movement in movements})
+
+def create_checkpoints(stock_ids=None, interval=CHECKPOINT_INTERVAL):
+    """Checkpoint every given item (all items when None) with at least interval movements since its last checkpoint"""
+    movement = StockMovement.__table__
+    if stock_ids is None:
+        stock_ids = db.session.execute(db.select(Stock.id)).scalars()
+
+    created = 0
+    for stock_id in stock_ids:
+        checkpoint = _last_checkpoint(stock_id)
+        conditions = _tail(stock_id, checkpoint)
+        # Cheap test first: is there an interval-th movement after the checkpoint?
+        due = db.session.execute(
+            db.select(movement.c.id).where(*conditions).limit(1).offset(max(interval - 1, 0))
+        ).first()
+        if due is None:
+            continue
+
+        tail_sum = db.session.execute(db.select(db.func.sum(movement.c.delta)).where(*conditions)).scalar()
+        last = db.session.execute(
+            db.select(movement.c.created_at, movement.c.id).where(*conditions)
+            .order_by(movement.c.created_at.desc(), movement.c.id.desc()).limit(1)
+        ).one()
+        db.session.execute(db.insert(StockCheckpoint).values(
+            stock_id=stock_id,
+            movement_id=last.id,
+            quantity=(checkpoint.quantity if checkpoint else 0) + tail_sum,
+            created_at=last.created_at
+        ))
+        created += 1
+    return created
+
+def rebuild_checkpoints(stock_id, interval=CHECKPOINT_INTERVAL):
+    """Recompute one item's checkpoints from its whole journal in a single pass (caller commits)"""
+    db.session.execute(db.delete(StockCheckpoint).where(StockCheckpoint.stock_id == stock_id))
+    # Running total over the journal in (created_at, id) order, kept every interval-th row
+    result = db.session.execute(db.text(
+        "INSERT INTO stock_checkpoint (stock_id, movement_id, quantity, created_at) "
+        "SELECT stock_id, id, quantity, created_at FROM ("
+        "  SELECT stock_id, id, created_at,"
+        "    SUM(delta) OVER (ORDER BY created_at, id) AS quantity,"
+        "    ROW_NUMBER() OVER (ORDER BY created_at, id) AS position"
+        "  FROM stock_movement WHERE stock_id = :stock_id"
+        ") WHERE position % :interval = 0"
+    ), {"stock_id": stock_id, "interval": interval})
+    return result.rowcount
+
+def record_opening_balances():
+    """Open the journal of every item that has none with its current quantity (caller commits)"""
+    mark_stock_changed(db.session)
+    result = db.session.execute(db.text(
+        "INSERT INTO stock_movement (stock_id, delta, reason, created_at, origin_site) "
+        "SELECT id, quantity, :reason, :created_at, :site FROM stock "
+        "WHERE NOT EXISTS (SELECT 1 FROM stock_movement WHERE stock_movement.stock_id = stock.id)"
+    ).bindparams(_CREATED_AT), {"reason": OPENING, "created_at": datetime.utcnow(), "site": SITE_ID})
+    return result.rowcount
+
+def _lock_stock_rows(condition):
+    """Take the write lock and read (id, item_name, quantity) of the matching items.
+
+    An UPDATE bumping the rows' version rather than a SELECT: the lock is
+    held from here until commit, so the quantities read can't change
+    underneath the caller and journal timestamps taken afterwards follow
+    movement id order, which checkpoints rely on.
+    """
+    stock = Stock.__table__
+    return db.session.execute(
+        stock.update().where(condition).values(version=stock.c.version + 1)
+        .returning(stock.c.id, stock.c.item_name, stock.c.quantity)
+    ).all()
+
+def set_stock_quantity(item_name, quantity, versions=None):
+    """Overwrite an item's level, journaling the difference as a correction (caller commits).
+
+    With versions (from If-Match) the write only happens if the item is
+    still at one of them: the check and the version bump are one UPDATE, so
+    of two operators who read the same version only the first one's write
+    lands and the other gets VersionConflictError. Returns False when the
+    item doesn't exist.
+    """
+    stock = Stock.__table__
+    condition = stock.c.item_name == item_name
+    if versions is not None:
+        condition = db.and_(condition, stock.c.version.in_(versions))
+    current = _lock_stock_rows(condition)
+    if not current:
+        version = None
+        if versions is not None:
+            version = db.session.execute(db.select(stock.c.version).where(stock.c.item_name == item_name)).scalar()
+        if version is None:
+            return False
+        raise VersionConflictError(version)
+    stock_id, _, old_quantity = current[0]
+    db.session.execute(stock.update().where(stock.c.id == stock_id).values(quantity=quantity))
+    record_movements([{"stock_id": stock_id, "delta": quantity - old_quantity, "reason": CORRECTION}])
+    return True
+
+def restock(item_name, quantity):
+    """Add quantity to an item's level and journal it (caller commits); False when the item doesn't exist"""
+    stock = Stock.__table__
+    stock_id = db.session.execute(
+        stock.update().where(stock.c.item_name == item_name)
+        .values(quantity=stock.c.quantity + quantity, version=stock.c.version + 1).returning(stock.c.id)
+    ).scalar()
+    if stock_id is None:
+        return False
+    record_movements([{"stock_id": stock_id, "delta": quantity, "reason": RESTOCK}])
+    return True
+
+def apply_stock_changes(changes):
+    """Apply {item_name: ("set" | "add", quantity)} to several items at once (caller commits).
+
+    The items are read under the write lock, updated by one UPDATE and
+    journaled by one INSERT; set journals a correction and add a restock.
+    Returns {item_name: new quantity} for the items that exist.
+    """
+    if not changes:
+        return {}
+    stock = Stock.__table__
+    current = _lock_stock_rows(stock.c.item_name.in_(changes))
+    if not current:
+        return {}
+
+    quantities = {}
+    movements = []
+    for stock_id, item_name, old_quantity in current:
+        mode, quantity = changes[item_name]
+        quantities[item_name] = quantity if mode == "set" else old_quantity + quantity
+        movements.append({
+            "stock_id": stock_id,
+            "delta": quantities[item_name] - old_quantity,
+            "reason": CORRECTION if mode == "set" else RESTOCK
+        })
+
+    new_quantity = db.case(quantities, value=stock.c.item_name, else_=stock.c.quantity)
+    db.session.execute(stock.update().where(stock.c.item_name.in_(quantities)).values(quantity=new_quantity))
+    record_movements(movements)
+    return quantities
+
+def stock_at(stock_id, at):
+    """Quantity of an item at time at: its last checkpoint before then plus the movements since"""
+    movement = StockMovement.__table__
+    checkpoint = _last_checkpoint(stock_id, at)
+    tail_sum = db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(movement.c.delta), 0)).where(*_tail(stock_id, checkpoint, at))
+    ).scalar()
+    return (checkpoint.quantity if checkpoint else 0) + tail_sum
+
+def consumption(stock_id, start, end):
+    """Levels at start and end of a period and what moved in between, per reason"""
+    movement = StockMovement.__table__
+    by_reason = dict(db.session.execute(
+        db.select(movement.c.reason, db.func.sum(movement.c.delta))
+        .where(movement.c.stock_id == stock_id, movement.c.created_at > start, movement.c.created_at <= end)
+        .group_by(movement.c.reason)
+    ).all())
+    opening = stock_at(stock_id, start)
+    return {
+        "opening_quantity": opening,
+        "closing_quantity": opening + sum(by_reason.values()),
+        "handed_out": -by_reason.get(HANDOUT, 0),
+        "returned": by_reason.get(RETURN, 0),
+        "restocked": by_reason.get(RESTOCK, 0),
+        "corrections": by_reason.get(CORRECTION, 0) + by_reason.get(OPENING, 0)
+    }
+
+def get_movements(stock_id, since=None, until=None, limit=100):
+    """Newest-first movements of one item, optionally within [since, until)"""
+    stmt = (
+        db.select(StockMovement)
+        .where(StockMovement.stock_id == stock_id)
+        .order_by(StockMovement.created_at.desc(), StockMovement.id.desc())
+        .limit(limit)
+    )
+    if since is not None:
+        stmt = stmt.where(StockMovement.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(StockMovement.created_at < until)
+    return db.session.execute(stmt).scalars().all()